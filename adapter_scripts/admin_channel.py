@@ -0,0 +1,212 @@
+#
+# TPRO 2020
+#
+"""
+Persistent command channel to the admin host, shared by the user management scripts.
+
+Instead of a new "sudo -u pjamaadmin ssh bobby sudo <cmd>" (i.e. a full ssh handshake) per command, a few
+long-lived root shells are kept open on bobby and commands are written to them one at a time. The end of a
+command's output is recognized by a sentinel line carrying its exit code.
+"""
+import os
+import queue
+import selectors
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, NamedTuple, Optional
+
+from command import time_left
+
+# command starting a shell on the admin host, LIGHTHOUSE_ADMIN_SHELL replaces it (e.g. with "bash" for testing)
+ADMIN_SHELL = ["sudo", "-u", "pjamaadmin", "ssh", "-T", "-o", "ServerAliveInterval=30", "bobby", "sudo", "bash"]
+# max. number of shells open at the same time
+POOL_SIZE = 2
+# commands taking longer are abandoned, along with their shell
+COMMAND_TIMEOUT_SEC = 60
+
+_SENTINEL = "__lighthouse_command_done__"
+
+
+class CommandResult(NamedTuple):
+    # None if the command timed out or the connection was lost
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+
+
+class AdminChannel:
+    """
+    A shell running command after command, (re)started on demand. Not thread safe, see ChannelPool
+    """
+    def __init__(self, command: List[str], timeout_sec: float = COMMAND_TIMEOUT_SEC):
+        self.command = command
+        self.timeout_sec = timeout_sec
+        self._process: Optional[subprocess.Popen] = None
+
+    def execute(self, *args, timeout_sec: Optional[float] = None) -> CommandResult:
+        """
+        Run a command in the shell
+        :param args: the command and its arguments, quoted for the shell
+        :param timeout_sec: overrides the timeout of the channel, by default the time left to the calling action
+        (if any) bounds it
+        :return:
+        """
+        if timeout_sec is None:
+            left = time_left()
+            timeout_sec = self.timeout_sec if left is None else min(self.timeout_sec, left)
+        if timeout_sec <= 0:
+            # not written at all: the shell would be killed before the command is known to have run or not
+            return CommandResult(None, "", "No time left to run the command")
+        token = uuid.uuid4().hex
+        line = " ".join(shlex.quote(str(arg)) for arg in args)
+        line += f' </dev/null; echo "{_SENTINEL} {token} $?"; echo "{_SENTINEL} {token}" >&2\n'
+
+        # a shell that exited since the last command (e.g. the ssh connection dropped) is replaced once
+        for attempt in range(2):
+            if self._process is None or self._process.poll() is not None:
+                try:
+                    self._connect()
+                except OSError as e:
+                    return CommandResult(None, "", f"Could not start {self.command[0]}: {e}")
+            try:
+                self._process.stdin.write(line.encode("utf-8"))
+                self._process.stdin.flush()
+                break
+            except OSError:
+                self.close()
+                if attempt:
+                    return CommandResult(None, "", "Connection to the admin host failed")
+        return self._read_result(token, timeout_sec)
+
+    def _read_result(self, token: str, timeout_sec: float) -> CommandResult:
+        stdout_end = f"{_SENTINEL} {token} ".encode("utf-8")
+        stderr_end = f"{_SENTINEL} {token}\n".encode("utf-8")
+        buffers = {self._process.stdout.fileno(): b"", self._process.stderr.fileno(): b""}
+        stdout_fd, stderr_fd = self._process.stdout.fileno(), self._process.stderr.fileno()
+
+        def done():
+            return stdout_end in buffers[stdout_fd] and buffers[stdout_fd].endswith(b"\n") \
+                and buffers[stderr_fd].endswith(stderr_end)
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(stdout_fd, selectors.EVENT_READ)
+            selector.register(stderr_fd, selectors.EVENT_READ)
+            deadline = time.monotonic() + timeout_sec
+            while not done():
+                remaining = deadline - time.monotonic()
+                ready = selector.select(remaining) if remaining > 0 else []
+                if not ready:
+                    self.close()
+                    return CommandResult(None, buffers[stdout_fd].decode("utf-8", "replace"),
+                                         f"Command timed out after {timeout_sec}s")
+                for key, _ in ready:
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        self.close()
+                        return CommandResult(None, buffers[stdout_fd].decode("utf-8", "replace"),
+                                             "Connection to the admin host was lost")
+                    buffers[key.fd] += chunk
+
+        stdout, _, status = buffers[stdout_fd].rpartition(stdout_end)
+        stderr = buffers[stderr_fd][:-len(stderr_end)]
+        return CommandResult(int(status), stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace"))
+
+    def _connect(self):
+        self.close()
+        self._process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+
+    def close(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            for stream in [self._process.stdin, self._process.stdout, self._process.stderr]:
+                stream.close()
+            self._process = None
+
+
+class ChannelPool:
+    """
+    Up to size channels, each used by a single caller at a time
+    """
+    def __init__(self, command: List[str], size: int = POOL_SIZE, timeout_sec: float = COMMAND_TIMEOUT_SEC):
+        self.command = command
+        self.timeout_sec = timeout_sec
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        # channels are created on first use
+        self._slots = threading.Semaphore(size)
+
+    @contextmanager
+    def channel(self, timeout_sec: Optional[float] = None):
+        """
+        Hold a channel, e.g. to run a batch of commands over a single connection
+        :param timeout_sec: max. time to wait for a free channel, by default the time left to the calling action
+        (if any)
+        :raise TimeoutError: if no channel became free in time
+        """
+        if timeout_sec is None:
+            timeout_sec = time_left()
+        if not self._slots.acquire(timeout=max(timeout_sec, 0) if timeout_sec is not None else None):
+            raise TimeoutError(f"No connection to the admin host became free within {max(timeout_sec, 0):.1f}s")
+        try:
+            try:
+                channel = self._idle.get_nowait()
+            except queue.Empty:
+                channel = AdminChannel(self.command, self.timeout_sec)
+            try:
+                yield channel
+            finally:
+                self._idle.put(channel)
+        finally:
+            self._slots.release()
+
+    def execute(self, *args, timeout_sec: Optional[float] = None) -> CommandResult:
+        try:
+            with self.channel(timeout_sec) as channel:
+                return channel.execute(*args, timeout_sec=timeout_sec)
+        except TimeoutError as e:
+            return CommandResult(None, "", str(e))
+
+
+_pool: Optional[ChannelPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ChannelPool:
+    """
+    The pool shared by all scripts of this process
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            command = shlex.split(os.environ["LIGHTHOUSE_ADMIN_SHELL"]) if "LIGHTHOUSE_ADMIN_SHELL" in os.environ \
+                else ADMIN_SHELL
+            _pool = ChannelPool(command)
+        return _pool
+
+
+def exec_admin_command(cmd, *args, channel: Optional[AdminChannel] = None):
+    """
+    Executes the command on the admin host, handling any errors
+    Returns a tuple with boolean result and error string, if any
+    :param cmd:
+    :param args:
+    :param channel: channel to use, by default one of the shared pool
+    :return:
+    """
+    if channel is not None:
+        result = channel.execute(cmd, *args)
+    else:
+        result = get_pool().execute(cmd, *args)
+    if result.returncode == 0:
+        return True, None
+    return False, result.stderr or f"Exit code {result.returncode}"
+
@@ -0,0 +1,88 @@
+#
+# TPRO 2020
+#
+"""
+Batch user management adapter script: creates or removes many users over a single connection to the admin host
+"""
+import sys
+import time
+
+import create_user
+import remove_user
+from admin_channel import get_pool
+
+# upper bound on the number of users of a single call
+MAX_USERS = 100
+
+# batch_users.py create alice:secret:user,bob:secret:admin
+# batch_users.py remove alice,bob
+
+
+def parse_users(operation: str, users: str) -> list:
+    """
+    Arguments of the per user script for every user: username:password:user_type for create, username for remove
+    """
+    arguments = [user.split(":") if operation == "create" else [user] for user in users.split(",") if user]
+    if len(arguments) > MAX_USERS:
+        raise ValueError(f"More than {MAX_USERS} users given")
+    for user_arguments in arguments:
+        if operation == "create" and (len(user_arguments) != 3 or user_arguments[2] not in ["admin", "user"]):
+            raise ValueError("Expected username:password:user_type, user_type either 'user' or 'admin'")
+    return arguments
+
+
+def batch_users(operation: str, arguments: list) -> list:
+    """
+    The actual functionality of the script
+    """
+    script = create_user if operation == "create" else remove_user
+    results = []
+    with get_pool().channel() as channel:
+        for user_arguments in arguments:
+            started = time.monotonic()
+            response = script.main(*user_arguments, channel=channel)
+            response["duration_sec"] = time.monotonic() - started
+            results.append(response)
+    return results
+
+
+def main(operation: str, users: str) -> dict:
+    """
+    Entry point of the script (from external location)
+    """
+    response = {"action": f"batch_{operation}_users"}
+    if operation not in ["create", "remove"]:
+        response["result"] = "failed"
+        response["error"] = "Operation is expected to be either 'create' or 'remove'"
+        return response
+    try:
+        arguments = parse_users(operation, users)
+    except ValueError as e:
+        response["result"] = "failed"
+        response["error"] = str(e)
+        return response
+
+    started = time.monotonic()
+    try:
+        response["results"] = batch_users(operation, arguments)
+    except TimeoutError as e:
+        # no user was touched
+        response["result"] = "failed"
+        response["error"] = str(e)
+        return response
+    response["duration_sec"] = time.monotonic() - started
+    response["failed_targets"] = [
+        result["target"] for result in response["results"] if result["result"] != "success"
+    ]
+    response["result"] = "failed" if response["failed_targets"] else "success"
+    return response
+
+
+if __name__ == "__main__":
+    """
+    When running the script manually (takes arguments from stdin)
+    """
+    if len(sys.argv) != 3:
+        raise ValueError("Batch users is expecting exactly 2 arguments!")
+
+    print(main(sys.argv[1], sys.argv[2]))
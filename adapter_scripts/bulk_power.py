@@ -0,0 +1,113 @@
+#
+# TPRO 2020
+#
+"""
+Bulk power adapter script: runs power_on, shutdown or reset on many nodes at once
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import power_on
+import reset
+import shutdown
+from command import time_left, call_with_deadline
+
+OPERATIONS = {
+    "power_on": power_on,
+    "shutdown": shutdown,
+    "reset": reset
+}
+
+# max. number of nodes handled at the same time, unless max_parallel is set for the action in config.json
+MAX_PARALLEL = 8
+# upper bound on the number of nodes of a single call, against typos such as 1-1000
+MAX_NODES = 64
+
+# bulk_power.py reset 1-4,6
+
+
+def parse_nodes(nodes: str) -> list:
+    """
+    Node numbers from a comma separated list of numbers and ranges, e.g. "1-4,6"
+    """
+    node_numbers = set()
+    for part in nodes.split(","):
+        first, _, last = part.strip().partition("-")
+        first, last = int(first), int(last or first)
+        if first < 0 or last < first or last - first >= MAX_NODES:
+            raise ValueError(f"Invalid node range: {part}")
+        node_numbers.update(range(first, last + 1))
+    if len(node_numbers) > MAX_NODES:
+        raise ValueError(f"More than {MAX_NODES} nodes given")
+    return sorted(node_numbers)
+
+
+def _run_on_node(operation, node_number: int) -> dict:
+    """
+    The per node script, timed
+    """
+    started = time.monotonic()
+    try:
+        response = operation.main(node_number)
+    except Exception as e:
+        response = {"target": node_number, "result": "failed", "error": str(e)}
+    response["duration_sec"] = time.monotonic() - started
+    return response
+
+
+def bulk_power(operation_name: str, node_numbers: list, max_parallel: int = MAX_PARALLEL) -> list:
+    """
+    The actual functionality of the script
+    """
+    operation = OPERATIONS[operation_name]
+    # the nodes share the time left to the action
+    timeout_sec = time_left()
+    deadline = time.monotonic() + timeout_sec if timeout_sec is not None else None
+
+    def run(node_number):
+        if deadline is None:
+            return _run_on_node(operation, node_number)
+        return call_with_deadline(deadline, _run_on_node, operation, node_number)
+
+    with ThreadPoolExecutor(max_workers=min(max_parallel, len(node_numbers))) as executor:
+        return list(executor.map(run, node_numbers))
+
+
+def main(operation: str, nodes: str, max_parallel: int = MAX_PARALLEL) -> dict:
+    """
+    Entry point of the script (from external location)
+    :param operation:
+    :param nodes:
+    :param max_parallel: max. number of nodes handled at the same time, max_parallel of the action in config.json
+    """
+    response = {"action": "bulk_" + operation, "targets": nodes}
+    if operation not in OPERATIONS:
+        response["result"] = "failed"
+        response["error"] = f"Unknown operation {operation}, expected one of {list(OPERATIONS)}"
+        return response
+    try:
+        node_numbers = parse_nodes(nodes)
+    except ValueError as e:
+        response["result"] = "failed"
+        response["error"] = str(e)
+        return response
+
+    started = time.monotonic()
+    response["results"] = bulk_power(operation, node_numbers, max_parallel)
+    response["duration_sec"] = time.monotonic() - started
+    response["failed_targets"] = [
+        result["target"] for result in response["results"] if result["result"] != "success"
+    ]
+    response["result"] = "failed" if response["failed_targets"] else "success"
+    return response
+
+
+if __name__ == "__main__":
+    """
+    When running the script manually (takes arguments from stdin)
+    """
+    if len(sys.argv) != 3:
+        raise ValueError("Bulk power is expecting exactly 2 arguments!")
+
+    print(main(sys.argv[1], sys.argv[2]))
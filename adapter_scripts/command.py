@@ -0,0 +1,70 @@
+#
+# TPRO 2020
+#
+"""
+Runs local commands for the adapter scripts, killing them once they take too long
+"""
+import os
+import signal
+import subprocess
+
+try:
+    from lighthouse.deadline import time_left, call_with_deadline
+except ImportError:
+    # run manually, without Lighthouse
+    def time_left():
+        return None
+
+    def call_with_deadline(deadline, function, *arguments):
+        return function(*arguments)
+
+# used when the action calling the script has no timeout_sec configured
+DEFAULT_TIMEOUT_SEC = 300
+
+
+def exec_command(args, timeout_sec=None):
+    """
+    Executes the command, handling any errors. The command (and anything it started) is killed when it runs
+    past the timeout, by default the time left to the calling action
+    Returns a tuple with boolean result and error string, if any
+    :param args: the command and its arguments
+    :param timeout_sec:
+    :return:
+    """
+    result, _, error = read_command(args, timeout_sec)
+    return result, error
+
+
+def read_command(args, timeout_sec=None):
+    """
+    Same as exec_command, for commands whose output is needed
+    Returns a tuple with boolean result, the standard output (None if the command failed) and error string, if any
+    :param args: the command and its arguments
+    :param timeout_sec:
+    :return:
+    """
+    if timeout_sec is None:
+        timeout_sec = time_left()
+    if timeout_sec is None:
+        timeout_sec = DEFAULT_TIMEOUT_SEC
+
+    try:
+        # in a session of its own, so that its children can be killed along with it
+        child = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    except Exception as e:
+        return False, None, str(e)
+
+    try:
+        output_stream, error_stream = child.communicate(timeout=timeout_sec)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(child.pid, signal.SIGKILL)
+        except OSError as e:
+            # e.g. the command runs as another user
+            return False, None, f"Timed out after {timeout_sec:.1f}s, {args[0]} could not be killed: {e}"
+        child.communicate()
+        return False, None, f"Timed out after {timeout_sec:.1f}s, {args[0]} was killed"
+
+    if child.returncode:
+        return False, None, error_stream.decode("ascii", "replace")
+    return True, output_stream.decode("utf-8", "replace"), None
@@ -1,64 +1,34 @@
 import sys
-import subprocess
+
+import user_cache
+from admin_channel import exec_admin_command
 
 
 SCRIPT_PATH = "/nfs/scripts/automation/create_user.bash"
 
 
-def create_user(username, password):
+def create_user(username, password, channel=None):
     """
     The actual functionality of the script
     """
-    return _exec_bash(SCRIPT_PATH, "-u", username, password)
+    return exec_admin_command(SCRIPT_PATH, "-u", username, password, channel=channel)
 
 
-def create_admin(username, password):
+def create_admin(username, password, channel=None):
     """
     The actual functionality of the script
     """
-    return _exec_bash(SCRIPT_PATH, "-a", username, password)
-
-
-def _exec_bash(cmd, *args):
-    """
-    Executes the bash script with argument, handling any errors
-    Returns a tuple with boolean result and error string, if any
-    :param cmd:
-    :param args:
-    :return:
-    """
-    result = False
-    error = None
-
-    # ssh bobby sudo SCRIPT_PATH ARGS
-    try:
-        # run ssh with pjamaadmin to execute the command on bobby using sudo
-        child = subprocess.Popen(
-            ["sudo", "-u", "pjamaadmin", "ssh", "bobby", "sudo", cmd, *args],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-
-        _, error_stream = child.communicate()
-        if not child.returncode:
-            result = True
-        else:
-            error = error_stream.decode("ascii")
-
-    except Exception as e:
-        error = str(e)
-
-    return result, error
+    return exec_admin_command(SCRIPT_PATH, "-a", username, password, channel=channel)
 
 
-def main(username, password, user_type) -> dict:
+def main(username, password, user_type, channel=None) -> dict:
     """
     Entry point of the script (from external location)
     """
     if user_type == "user":
-        result, error = create_user(username, password)
+        result, error = create_user(username, password, channel=channel)
     else:
-        result, error = create_admin(username, password)
+        result, error = create_admin(username, password, channel=channel)
 
     response = {"action": "create_user", "target": username, "type": user_type}
 
@@ -68,6 +38,7 @@ def main(username, password, user_type) -> dict:
             response["error"] = error
     else:
         response["result"] = "success"
+        user_cache.users.add(username)
 
     return response
 
@@ -5,7 +5,8 @@
 Power on adapter script
 """
 import sys
-import subprocess
+
+from command import exec_command
 
 
 SCRIPT_PATH = "/nfs/scripts/automation/lisa_scripts/power_control.py"
@@ -28,28 +29,7 @@ def _exec_bash(cmd, *args):
     :param args:
     :return:
     """
-    result = False
-    error = None
-
-    # ssh bobby sudo SCRIPT_PATH ARGS
-    try:
-        # run ssh with pjamaadmin to execute the command on bobby using sudo
-        child = subprocess.Popen(
-            ["python3", cmd, *args],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-
-        _, error_stream = child.communicate()
-        if not child.returncode:
-            result = True
-        else:
-            error = error_stream.decode("ascii")
-
-    except Exception as e:
-        error = str(e)
-
-    return result, error
+    return exec_command(["python3", cmd, *args])
 
 
 def main(node_number: int) -> dict:
@@ -1,54 +1,27 @@
 import sys
-import subprocess
+
+import user_cache
+from admin_channel import exec_admin_command
 
 
 SCRIPT_PATH = "/nfs/scripts/automation/remove_user.bash"
 
 
-def remove_user(username):
+def remove_user(username, channel=None):
     """
     The actual functionality of the script
     """
-    return _exec_bash(SCRIPT_PATH, username)
-
-
-def _exec_bash(cmd, *args):
-    """
-    Executes the bash script with argument, handling any errors
-    Returns a tuple with boolean result and error string, if any
-    :param cmd:
-    :param args:
-    :return:
-    """
-    result = False
-    error = None
-
-    try:
-        child = subprocess.Popen(
-            ["sudo", "-u", "pjamaadmin", "ssh", "bobby", "sudo", cmd, *args],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        _, error_stream = child.communicate()
-        if not child.returncode:
-            result = True
-        else:
-            error = error_stream.decode("ascii")
-
-    except Exception as e:
-        error = str(e)
-
-    return result, error
+    return exec_admin_command(SCRIPT_PATH, username, channel=channel)
 
 
-def main(username) -> dict:
+def main(username, channel=None) -> dict:
     """
     Entry point of the script (from external location)
     """
 
     response = {"action": "remove_user", "target": username}
 
-    result, error = remove_user(username)
+    result, error = remove_user(username, channel=channel)
 
     if not result:
         response["result"] = "failed"
@@ -56,6 +29,7 @@ def main(username) -> dict:
             response["error"] = error
     else:
         response["result"] = "success"
+        user_cache.users.remove(username)
 
     return response
 
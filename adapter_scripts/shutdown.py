@@ -5,7 +5,8 @@
 Shutdown adapter script
 """
 import sys
-import subprocess
+
+from command import exec_command
 
 
 SCRIPT_PATH = "/nfs/scripts/automation/playbooks/shutdown.yml"
@@ -29,28 +30,10 @@ def _exec_ansible(cmd, *args):
     :return:
     """
     inventory = "/nfs/scripts/automation/inventory.ini"
-    result = False
-    error = None
-
-    # ssh bobby sudo SCRIPT_PATH ARGS
-    try:
-        # run ssh with pjamaadmin to execute the command on bobby using sudo
-        child = subprocess.Popen(
-            ["sudo", "-u", "pjamaadmin", "ssh", "bobby", "ansible-playbook", cmd, "-i", inventory, *args],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-
-        _, error_stream = child.communicate()
-        if not child.returncode:
-            result = True
-        else:
-            error = error_stream.decode("ascii")
-
-    except Exception as e:
-        error = str(e)
-
-    return result, error
+    # ssh bobby ansible-playbook SCRIPT_PATH ARGS, as pjamaadmin
+    return exec_command(
+        ["sudo", "-u", "pjamaadmin", "ssh", "bobby", "ansible-playbook", cmd, "-i", inventory, *args]
+    )
 
 
 def main(node_number: int) -> dict:
@@ -0,0 +1,89 @@
+#
+# TPRO 2020
+#
+"""
+In-process cache of the user list, shared by user_list.py (reads) and create_user.py / remove_user.py (updates).
+The list holds one username per line of get_users.bash
+"""
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+class UserListCache:
+    """
+    Holds the last user list loaded and serves it while it is fresh. A stale list is still served for a while
+    and refreshed in the background, so only the first read or a read after a long idle time waits for a load.
+    Successful changes of users are applied to the cached list in place, a refresh that was already running
+    when a change happened is discarded, as it may not include the change
+    """
+    def __init__(self):
+        self._users: Optional[List[str]] = None
+        self._loaded_at = 0.0
+        # incremented by every change, tells whether a refresh started before a change
+        self._generation = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        # only one load runs at a time, reads arriving meanwhile wait for it instead of loading again
+        self._load_lock = threading.Lock()
+
+    def get(self, load: Callable[[], Optional[List[str]]], ttl_sec: float, stale_sec: float) -> Optional[List[str]]:
+        """
+        Get the user list
+        :param load: loads the list, returns None on failure (which isn't cached)
+        :param ttl_sec: age up to which the cached list is served as is
+        :param stale_sec: further time during which the cached list is served while it is refreshed
+        :return: copy of the list, None if it couldn't be loaded
+        """
+        with self._lock:
+            age = time.monotonic() - self._loaded_at
+            if self._users is not None and age < ttl_sec + stale_sec:
+                if age >= ttl_sec and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, args=(load,), daemon=True).start()
+                return list(self._users)
+        with self._load_lock:
+            with self._lock:
+                if self._users is not None and time.monotonic() - self._loaded_at < ttl_sec:
+                    # loaded by the read we waited for
+                    return list(self._users)
+            users = self._load(load)
+        return list(users) if users is not None else None
+
+    def _refresh(self, load: Callable[[], Optional[List[str]]]):
+        try:
+            with self._load_lock:
+                self._load(load)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _load(self, load: Callable[[], Optional[List[str]]]) -> Optional[List[str]]:
+        with self._lock:
+            generation = self._generation
+        users = load()
+        with self._lock:
+            if users is not None and generation == self._generation:
+                self._users = users
+                self._loaded_at = time.monotonic()
+        return users
+
+    def add(self, username: str):
+        with self._lock:
+            self._generation += 1
+            if self._users is not None and username not in self._users:
+                self._users.append(username)
+
+    def remove(self, username: str):
+        with self._lock:
+            self._generation += 1
+            if self._users is not None and username in self._users:
+                self._users.remove(username)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._users = None
+
+
+users = UserListCache()
@@ -1,26 +1,34 @@
-import os
+import user_cache
+from command import read_command, time_left
+
+SCRIPT_PATH = "/nfs/scripts/automation/get_users.bash"
+
+# defaults of the cache_ttl_sec and cache_stale_sec of the action in config.json:
+# the list is read from the cache for this long after it was loaded
+TTL_SEC = 30
+# after that, for this long the cached list is still served while it is loaded again in the background
+STALE_WHILE_REVALIDATE_SEC = 300
+# get_users.bash is killed after this long, also when it runs as a background refresh without a calling action.
+# Reads waiting for a load are held up to this long
+LOAD_TIMEOUT_SEC = 20
 
 
 def get_users():
     """
     The actual functionality of the script
     """
-    users = []
-    try:
-        stream = os.popen("/nfs/scripts/automation/get_users.bash")
-        for line in stream.readlines():
-            users.append(line.rstrip())
-    except Exception:
-        users = None
-        pass
-    return users
-
-
-def main() -> dict:
+    left = time_left()
+    result, output, _ = read_command([SCRIPT_PATH], LOAD_TIMEOUT_SEC if left is None else min(left, LOAD_TIMEOUT_SEC))
+    if not result:
+        return None
+    return [line.rstrip() for line in output.splitlines()]
+
+
+def main(cache_ttl_sec: float = TTL_SEC, cache_stale_sec: float = STALE_WHILE_REVALIDATE_SEC) -> dict:
     """
     Entry point of the script (from external location)
     """
-    users = get_users()
+    users = user_cache.users.get(get_users, cache_ttl_sec, cache_stale_sec)
     response = {"action": "get_users", "users": users}
 
     if users is None:
@@ -0,0 +1,4 @@
+"""
+Loader module for the lighthouse ASGI application
+"""
+from lighthouse.asgi import app
@@ -0,0 +1,98 @@
+"""
+Contention benchmark for RESTAPITarget
+
+Many reader threads call get_data in a tight loop while a writer thread feeds beacons as fast as it can.
+Reports the feed and read rates and the worst feed latency, for the copy-on-write RESTAPITarget and,
+if readerwriterlock is installed, for the reader-preferring RWLockRead design it replaced.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_contention [--readers 16] [--nodes 64] [--duration-sec 3]
+"""
+import argparse
+import logging
+import threading
+import time
+
+from lighthouse.lighthouse import RESTAPITarget
+
+try:
+    from readerwriterlock.rwlock import RWLockRead
+except ImportError:
+    RWLockRead = None
+
+
+class RWLockTarget:
+    """
+    The former locking scheme of RESTAPITarget, kept as a baseline
+    """
+    def __init__(self, name: str, group_by_attr: str):
+        self.container_name = name[1:]
+        self.group_by_attr = group_by_attr
+        self.persistence = {}
+        self.aging_time_sec = 10
+        self.rw_lock = RWLockRead()
+
+    def get_data(self):
+        with self.rw_lock.gen_rlock():
+            now = time.time()
+            return {self.container_name: [
+                data for data in self.persistence.values() if now - data["timestamp"] < self.aging_time_sec
+            ]}
+
+    def feed(self, data):
+        with self.rw_lock.gen_wlock():
+            data["timestamp"] = time.time()
+            self.persistence[data[self.group_by_attr]] = data
+
+
+def run_case(label: str, target, readers: int, nodes: int, duration_sec: float):
+    stop = threading.Event()
+    reads = [0] * readers
+    feed_stats = {"feeds": 0, "max_latency": 0.0}
+
+    def read(index: int):
+        while not stop.is_set():
+            target.get_data()
+            reads[index] += 1
+
+    def write():
+        i = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            target.feed({"ip_address": f"10.0.0.{i % nodes}", "cpu_load": float(i)})
+            feed_stats["max_latency"] = max(feed_stats["max_latency"], time.perf_counter() - start)
+            feed_stats["feeds"] += 1
+            i += 1
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration_sec)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f"{label:>14}: {feed_stats['feeds'] / duration_sec:10.0f} feeds/s, "
+          f"max feed latency {feed_stats['max_latency'] * 1000:8.2f} ms, "
+          f"{sum(reads) / duration_sec:10.0f} reads/s ({readers} readers, {nodes} nodes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--nodes", type=int, default=64)
+    parser.add_argument("--duration-sec", type=float, default=3.0)
+    args = parser.parse_args()
+    # per request debug logging would dominate the read path
+    logging.getLogger("Lighthouse").setLevel(logging.INFO)
+
+    run_case("copy_on_write", RESTAPITarget("/bench", group_by_attr="ip_address"),
+             args.readers, args.nodes, args.duration_sec)
+    if RWLockRead is not None:
+        run_case("rwlock", RWLockTarget("/bench", group_by_attr="ip_address"),
+                 args.readers, args.nodes, args.duration_sec)
+
+
+if __name__ == "__main__":
+    main()
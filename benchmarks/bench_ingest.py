@@ -0,0 +1,134 @@
+"""
+Ingest benchmark for the Lighthouse main loop
+
+Measures the CPU used by an idle Lighthouse and the rate at which beacon messages are moved from a
+POSIX queue into a RESTAPITarget, for the event-driven loop (per message and batched) and for the old
+busy-spinning loop. Optionally, reader threads poll the target while messages are ingested.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_ingest [--messages 20000] [--idle-sec 2] [--batch-size 64] [--readers 0]
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+
+from ipcqueue.posixmq import Queue, unlink
+
+from lighthouse.lighthouse import Lighthouse
+
+
+class SpinningLighthouse(Lighthouse):
+    """
+    The main loop as it was before waiting on the queue descriptors, kept as a baseline
+    """
+    def run(self):
+        self.is_running = True
+        while self.is_running and self.parent_thread.is_alive():
+            for adapter in self._adapters:
+                adapter.update()
+
+
+def _make_config(queue_name: str, route: str, batch_size: int):
+    return {
+        "ipc_rest_adapters": [
+            {
+                "adapter_name": route[1:],
+                "ipc_queue": queue_name,
+                "rest_route": route,
+                "group_by_attrib": "ip_address",
+                "batch_size": batch_size
+            }
+        ]
+    }
+
+
+def _produce(queue_name: str, count: int, nodes: int):
+    q = Queue(queue_name)
+    for i in range(count):
+        q.put({"ip_address": f"10.0.0.{i % nodes}", "seq": i, "cpu_load": 1.0})
+
+
+def _count_feeds(target):
+    """
+    wrap target.feed with a counter of messages and of calls (i.e. write lock acquisitions)
+    """
+    counter = {"fed": 0, "calls": 0}
+    original_feed, original_feed_many = target.feed, target.feed_many
+
+    def counting_feed(data):
+        counter["fed"] += 1
+        counter["calls"] += 1
+        original_feed(data)
+
+    def counting_feed_many(data):
+        counter["fed"] += len(data)
+        counter["calls"] += 1
+        original_feed_many(data)
+
+    target.feed, target.feed_many = counting_feed, counting_feed_many
+    return counter
+
+
+def _poll(target, stop: threading.Event, interval_sec: float):
+    while not stop.wait(interval_sec):
+        target.get_data()
+
+
+def run_case(lighthouse_cls, label: str, messages: int, idle_sec: float, batch_size: int = 1, readers: int = 0,
+             read_interval_sec: float = 0.001):
+    queue_name = f"/lh_bench_{os.getpid()}_{label}"
+    lighthouse = lighthouse_cls(_make_config(queue_name, f"/bench_{label}", batch_size))
+    target = lighthouse._adapters[0].target
+    counter = _count_feeds(target)
+    lighthouse.start()
+
+    # idle: no producer attached
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    time.sleep(idle_sec)
+    idle_cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+
+    # throughput: a separate process fills the queue as fast as it is drained
+    stop_readers = threading.Event()
+    reader_threads = [
+        threading.Thread(target=_poll, args=(target, stop_readers, read_interval_sec)) for _ in range(readers)
+    ]
+    for reader in reader_threads:
+        reader.start()
+    producer = multiprocessing.Process(target=_produce, args=(queue_name, messages, 64))
+    wall_start = time.perf_counter()
+    producer.start()
+    while counter["fed"] < messages:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - wall_start
+    producer.join()
+    stop_readers.set()
+    for reader in reader_threads:
+        reader.join()
+
+    lighthouse.stop()
+    lighthouse.join()
+    unlink(queue_name)
+    print(f"{label:>14}: idle CPU {idle_cpu * 100:6.2f}% of a core, "
+          f"ingest {messages / elapsed:10.0f} msg/s ({messages} messages in {elapsed:.2f}s, "
+          f"{counter['calls']} write lock acquisitions)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--idle-sec", type=float, default=2.0)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--readers", type=int, default=0, help="threads polling the target during ingest")
+    parser.add_argument("--read-interval-ms", type=float, default=1.0, help="pause between polls of each reader")
+    args = parser.parse_args()
+    read_interval_sec = args.read_interval_ms / 1000
+
+    run_case(Lighthouse, "event_driven", args.messages, args.idle_sec, 1, args.readers, read_interval_sec)
+    run_case(Lighthouse, "batched", args.messages, args.idle_sec, args.batch_size, args.readers, read_interval_sec)
+    run_case(SpinningLighthouse, "spinning", args.messages, args.idle_sec, 1, args.readers, read_interval_sec)
+
+
+if __name__ == "__main__":
+    main()
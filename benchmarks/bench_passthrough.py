@@ -0,0 +1,61 @@
+"""
+Passthrough benchmark: responses encoded from the stored dicts against responses joined from the JSON texts the
+beacons were received as
+
+For a grouped RESTAPITarget holding one beacon per node, repeatedly feeds a beacon and serializes the response,
+as happens for the first GET after every change, and reports the time per response. Also reports the rate at which
+beacons are decoded and fed, unpickled for the dict target and parsed from JSON for the passthrough target.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_passthrough [--nodes 1024,8192] [--responses 200]
+"""
+import argparse
+import json
+import pickle
+import time
+from typing import List
+
+from lighthouse.lighthouse import RESTAPITarget
+from lighthouse.passthrough import JSONPassthrough
+from benchmarks.harness import beacon
+
+
+def _messages(count: int, nodes: int, passthrough: bool) -> List[bytes]:
+    encode = (lambda data: json.dumps(data).encode("utf-8")) if passthrough else pickle.dumps
+    return [encode(beacon(seq % nodes, seq, time.time())) for seq in range(count)]
+
+
+def run_case(label: str, passthrough: bool, nodes: int, responses: int):
+    decode = JSONPassthrough.decode if passthrough else pickle.loads
+    target = RESTAPITarget(f"/bench_{label}_{nodes}", group_by_attr="ip_address", aging_time_sec=3600,
+                           passthrough=passthrough)
+    queued = _messages(nodes, nodes, passthrough)
+    started = time.perf_counter()
+    for message in queued:
+        target.feed(decode(message))
+    fed = nodes / (time.perf_counter() - started)
+
+    queued = _messages(responses, nodes, passthrough)
+    elapsed = 0.0
+    for message in queued:
+        target.feed(decode(message))
+        started = time.perf_counter()
+        body, _ = target.get_serialized_data()
+        elapsed += time.perf_counter() - started
+    print(f"{label:>12} {nodes:6d} nodes: {elapsed / responses * 1000:8.2f} ms per response of {len(body)} bytes, "
+          f"{fed:8.0f} msg/s decoded and fed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", default="1024,8192", help="comma separated cluster sizes")
+    parser.add_argument("--responses", type=int, default=200)
+    args = parser.parse_args()
+
+    for nodes in [int(n) for n in args.nodes.split(",")]:
+        run_case("dict", False, nodes, args.responses)
+        run_case("passthrough", True, nodes, args.responses)
+
+
+if __name__ == "__main__":
+    main()
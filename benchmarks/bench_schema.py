@@ -0,0 +1,94 @@
+"""
+Schema benchmark: beacons stored as the unpickled dicts against records decoded with a schema
+
+For each way of sending beacons (pickled dicts without a schema, pickled dicts with a schema, the struct layout of
+a schema), measures the rate at which queued messages are decoded and fed to a grouped RESTAPITarget through an
+Adapter, and the memory held by the target per node.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_schema [--messages 200000] [--nodes 1024] [--batch-size 64]
+"""
+import argparse
+import gc
+import pickle
+import time
+import tracemalloc
+from typing import List, Optional
+
+from lighthouse.adapter import Adapter, Source
+from lighthouse.lighthouse import RESTAPITarget
+from lighthouse.schema import Schema
+from benchmarks.harness import beacon
+
+FIELDS = [
+    {"name": "ip_address", "type": "str", "size": 15},
+    {"name": "hostname", "type": "str", "size": 32},
+    {"name": "cpu", "type": "str", "size": 16},
+    {"name": "system", "type": "str", "size": 16},
+    {"name": "platform", "type": "str", "size": 64},
+    {"name": "cpu_usage", "type": "float"},
+    {"name": "mem_usage", "type": "float"},
+    {"name": "seq", "type": "int"},
+    {"name": "sent_at", "type": "float"}
+]
+
+
+class ListSource(Source):
+    """
+    serves messages as they are read from the queue: bytes, unpickled by the queue when there is no schema
+    """
+    def __init__(self, messages: List[bytes], unpickle: bool):
+        self._messages = iter(messages)
+        self._unpickle = unpickle
+
+    def get_message(self):
+        message = next(self._messages, None)
+        if message is not None and self._unpickle:
+            return pickle.loads(message)
+        return message
+
+
+def _messages(count: int, nodes: int, schema: Optional[Schema]) -> List[bytes]:
+    encode = schema.encode if schema is not None and schema.format == "struct" else pickle.dumps
+    return [encode(beacon(seq % nodes, seq, time.time())) for seq in range(count)]
+
+
+def run_case(label: str, schema: Optional[Schema], messages: int, nodes: int, batch_size: int):
+    queued = _messages(messages, nodes, schema)
+    target = RESTAPITarget(f"/bench_{label}", group_by_attr="ip_address", aging_time_sec=3600)
+    adapter = Adapter(label, ListSource(queued, unpickle=schema is None), target, batch_size=batch_size,
+                      decoder=schema)
+    started = time.perf_counter()
+    while adapter.update():
+        pass
+    elapsed = time.perf_counter() - started
+
+    # memory held by the records of one message per node, in a target of its own
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    target = RESTAPITarget(f"/bench_{label}_memory", group_by_attr="ip_address", aging_time_sec=3600)
+    adapter = Adapter(label, ListSource(_messages(nodes, nodes, schema), unpickle=schema is None), target,
+                      batch_size=batch_size, decoder=schema)
+    while adapter.update():
+        pass
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{label:>14}: {messages / elapsed:10.0f} msg/s decoded and fed, {held / nodes:6.0f} bytes per node")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--nodes", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    run_case("dict", None, args.messages, args.nodes, args.batch_size)
+    run_case("schema_pickle", Schema("bench_pickle", FIELDS), args.messages, args.nodes, args.batch_size)
+    run_case("schema_struct", Schema("bench_struct", FIELDS, "struct"), args.messages, args.nodes, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Serving benchmark: the WSGI deployment (gunicorn, threaded workers) against the ASGI one (uvicorn)
+
+Both servers run the same Lighthouse config: a grouped adapter fed by a producer process, and an action whose
+script sleeps to stand in for a command run over ssh. Client processes keep persistent connections open and
+poll the target, a fraction of the requests call the action instead. Requests per second and latency
+percentiles are reported per server and request kind.
+
+Usage (from the repository root, needs gunicorn and uvicorn):
+    python -m benchmarks.bench_serving [--duration 10] [--connections 64] [--action-ratio 0.05] [--action-sec 0.2]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+
+from ipcqueue.posixmq import unlink
+
+from benchmarks.harness import SERVERS, ROUTE, write_config, produce, client, free_port, wait_until_serving, \
+    percentile
+
+
+def load(port: int, connections: int, duration_sec: float, action_ratio: float, results: multiprocessing.Queue):
+    """
+    keep the given number of connections busy for duration_sec, put the latencies per request kind on results
+    """
+    action_paths = [f"/bench_action/{node}" for node in range(64)]
+    paths = [ROUTE] + action_paths
+    weights = [1 - action_ratio] + [action_ratio / len(action_paths)] * len(action_paths)
+    latencies = {path: [] for path in paths + ["error"]}
+    deadline = time.monotonic() + duration_sec
+
+    async def run():
+        await asyncio.gather(*[client(port, deadline, paths, weights, latencies) for _ in range(connections)])
+
+    asyncio.run(run())
+    results.put({
+        "read": latencies[ROUTE],
+        "action": [latency for path in action_paths for latency in latencies[path]],
+        "error": latencies["error"]
+    })
+
+
+def run_case(server: str, args) -> dict:
+    port = free_port()
+    queue_name = f"/lh_bench_serving_{os.getpid()}_{server}"
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, LIGHTHOUSE_CONFIG=write_config(directory, queue_name, args.action_sec))
+        process = subprocess.Popen(SERVERS[server](port, args.workers, args.threads), env=env)
+        producer = multiprocessing.Process(
+            target=produce, args=(queue_name, args.nodes, args.nodes, args.duration + 30)
+        )
+        producer.start()
+        try:
+            wait_until_serving(port)
+            time.sleep(1)
+            results = multiprocessing.Queue()
+            per_client = [args.connections // args.clients] * args.clients
+            per_client[0] += args.connections % args.clients
+            clients = [
+                multiprocessing.Process(target=load, args=(port, n, args.duration, args.action_ratio, results))
+                for n in per_client
+            ]
+            for client_process in clients:
+                client_process.start()
+            latencies = {"read": [], "action": [], "error": []}
+            for _ in clients:
+                for kind, values in results.get().items():
+                    latencies[kind] += values
+            for client_process in clients:
+                client_process.join()
+        finally:
+            producer.terminate()
+            process.terminate()
+            process.wait()
+            unlink(queue_name)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per server")
+    parser.add_argument("--connections", type=int, default=64, help="concurrent client connections")
+    parser.add_argument("--clients", type=int, default=2, help="client processes sharing the connections")
+    parser.add_argument("--action-ratio", type=float, default=0.05, help="fraction of requests calling the action")
+    parser.add_argument("--action-sec", type=float, default=0.2, help="time taken by the action script")
+    parser.add_argument("--nodes", type=int, default=64, help="number of groups fed into the target")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=32, help="threads per gunicorn worker")
+    parser.add_argument("--servers", default="wsgi,asgi")
+    args = parser.parse_args()
+
+    for server in args.servers.split(","):
+        latencies = run_case(server, args)
+        for kind in ["read", "action"]:
+            values = latencies[kind]
+            print(f"{server:>5} {kind:>6}: {len(values) / args.duration:8.0f} req/s, "
+                  f"p50 {percentile(values, 0.5) * 1000:8.2f} ms, p99 {percentile(values, 0.99) * 1000:8.2f} ms")
+        if latencies["error"]:
+            print(f"{server:>5}  error: {len(latencies['error'])} responses with a status other than 200")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+End-to-end benchmark of a Lighthouse deployment, for comparing branches
+
+A synthetic producer sends beacons of a number of fake nodes into a local POSIX queue at a set rate, while client
+processes poll the routes of the target over persistent connections and a probe follows the target with ?since=
+to see when each beacon becomes visible. Reported:
+    ingest throughput - messages taken off the queue per second (set --rate above capacity to measure the maximum)
+    freshness lag     - time from a beacon being due at the producer to it being served, p50 and p99. Includes up to
+                        --probe-interval-ms of polling delay
+    requests          - requests per second, p50 and p99 latency per route
+    CPU               - CPU used by each server process, in percent of a core
+
+Results can be written to a JSON file and compared with the file of another branch: the exit status is 1 if any
+result is worse than the baseline by more than --tolerance.
+
+Usage (from the repository root, on Linux, needs gunicorn or uvicorn):
+    python -m benchmarks.bench_suite [--server wsgi] [--duration 10] [--rate 2000] [--nodes 256]
+                                     [--output results.json] [--baseline main.json]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+
+from ipcqueue.posixmq import Queue, unlink
+
+from benchmarks.harness import SERVERS, ROUTE, write_config, produce, http_get, client, free_port, \
+    wait_until_serving, percentile, child_pids, cpu_seconds
+
+# the target is also served with these
+ADAPTER = {
+    "history": {"size": 60, "fields": ["cpu_usage", "mem_usage"]},
+    "aggregates": [
+        {"name": "live_nodes", "function": "count"},
+        {"name": "mean_cpu_usage", "function": "mean", "field": "cpu_usage"}
+    ]
+}
+
+
+def load(port: int, connections: int, duration_sec: float, paths: List[str], results: multiprocessing.Queue):
+    """
+    keep the given number of connections busy for duration_sec, put the latencies per path on results
+    """
+    latencies = {path: [] for path in paths + ["error"]}
+    deadline = time.monotonic() + duration_sec
+
+    async def run():
+        weights = [1] * len(paths)
+        await asyncio.gather(*[client(port, deadline, paths, weights, latencies) for _ in range(connections)])
+
+    asyncio.run(run())
+    results.put(("latencies", latencies))
+
+
+def probe(port: int, duration_sec: float, interval_sec: float, results: multiprocessing.Queue):
+    """
+    Poll the changes of the target every interval_sec, and put the freshness lag of every beacon seen for the
+    first time on results
+    """
+    lags = []
+    started = time.time()
+    deadline = time.monotonic() + duration_sec
+
+    async def run():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        since = 0
+        try:
+            while time.monotonic() < deadline:
+                status, body = await http_get(reader, writer, f"{ROUTE}?since={since}")
+                seen_at = time.time()
+                if status == 200:
+                    changes = json.loads(body)
+                    # beacons sent before the probe started would count the time until the first poll
+                    lags.extend(
+                        seen_at - record["sent_at"] for record in changes[ROUTE[1:]] if record["sent_at"] >= started
+                    )
+                    since = changes["seq"]
+                await asyncio.sleep(interval_sec)
+        finally:
+            writer.close()
+
+    asyncio.run(run())
+    results.put(("lags", lags))
+
+
+def _cpu(pids: List[int]) -> Dict[int, float]:
+    return {pid: cpu_seconds(pid) for pid in pids}
+
+
+def run(args) -> Dict[str, Any]:
+    port = free_port()
+    queue_name = f"/lh_bench_suite_{os.getpid()}"
+    paths = args.paths.split(",")
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, LIGHTHOUSE_CONFIG=write_config(directory, queue_name, 0.0, ADAPTER))
+        server = subprocess.Popen(SERVERS[args.server](port, args.workers, args.threads), env=env)
+        sent = multiprocessing.Value("q", 0, lock=False)
+        producer = multiprocessing.Process(
+            target=produce, args=(queue_name, args.nodes, args.rate, args.warmup + args.duration + 5, sent)
+        )
+        try:
+            wait_until_serving(port)
+            queue = Queue(queue_name)
+            producer.start()
+            time.sleep(args.warmup)
+
+            pids = [server.pid] + child_pids(server.pid)
+            cpu_before = _cpu(pids)
+            sent_before, depth_before = sent.value, queue.qsize()
+            started = time.monotonic()
+
+            results = multiprocessing.Queue()
+            per_client = [args.connections // args.clients] * args.clients
+            per_client[0] += args.connections % args.clients
+            processes = [
+                multiprocessing.Process(target=load, args=(port, n, args.duration, paths, results)) for n in per_client
+            ]
+            processes.append(multiprocessing.Process(
+                target=probe, args=(port, args.duration, args.probe_interval_ms / 1000, results)
+            ))
+            for process in processes:
+                process.start()
+            latencies, lags = {path: [] for path in paths + ["error"]}, []
+            for _ in processes:
+                kind, values = results.get()
+                if kind == "lags":
+                    lags = values
+                else:
+                    for path, path_latencies in values.items():
+                        latencies[path] += path_latencies
+            for process in processes:
+                process.join()
+
+            elapsed = time.monotonic() - started
+            sent_after, depth_after = sent.value, queue.qsize()
+            cpu_after = _cpu(pids)
+            queue.close()
+        finally:
+            producer.terminate()
+            server.terminate()
+            server.wait()
+            unlink(queue_name)
+
+    result = {
+        "ingest_msg_per_sec": ((sent_after - sent_before) - (depth_after - depth_before)) / elapsed,
+        "lag_p50_ms": percentile(lags, 0.5) * 1000,
+        "lag_p99_ms": percentile(lags, 0.99) * 1000
+    }
+    for path in paths:
+        result[f"{path} req_per_sec"] = len(latencies[path]) / elapsed
+        result[f"{path} p50_ms"] = percentile(latencies[path], 0.5) * 1000
+        result[f"{path} p99_ms"] = percentile(latencies[path], 0.99) * 1000
+    result["errors"] = len(latencies["error"])
+    cpu = [(cpu_after[pid] - cpu_before[pid]) / elapsed * 100 for pid in pids]
+    result["cpu_total_pct"] = sum(cpu)
+    result["cpu_per_process_pct"] = cpu
+    return result
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    :return: description of every result worse than the baseline by more than tolerance (a fraction)
+    """
+    regressions = []
+    if result["errors"] > baseline.get("errors", 0):
+        regressions.append(f"errors: {result['errors']} against {baseline.get('errors', 0)}")
+    for name, value in result.items():
+        base = baseline.get(name)
+        if not isinstance(value, float) or not isinstance(base, (int, float)) or base <= 0:
+            continue
+        change = (value - base) / base
+        # rates should not drop, times and CPU should not grow
+        worse = -change if name.endswith("_per_sec") else change
+        if worse > tolerance:
+            regressions.append(f"{name}: {value:.2f} against {base:.2f} ({change * 100:+.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=list(SERVERS), default="wsgi")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of measurement")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of production before measuring")
+    parser.add_argument("--rate", type=float, default=2000, help="beacons sent per second")
+    parser.add_argument("--nodes", type=int, default=256, help="number of fake nodes sending beacons")
+    parser.add_argument("--paths", default=f"{ROUTE},{ROUTE}/aggregate", help="comma separated routes to poll")
+    parser.add_argument("--connections", type=int, default=32, help="concurrent client connections")
+    parser.add_argument("--clients", type=int, default=2, help="client processes sharing the connections")
+    parser.add_argument("--probe-interval-ms", type=float, default=10.0, help="polling interval of the lag probe")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=32, help="threads per gunicorn worker")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed change against the baseline")
+    args = parser.parse_args()
+
+    result = run(args)
+    arguments = {name: value for name, value in vars(args).items() if name not in ["output", "baseline", "tolerance"]}
+    for name, value in result.items():
+        if isinstance(value, list):
+            value = ", ".join(f"{v:.1f}" for v in value)
+        elif isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"{name:>40}: {value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({**result, "arguments": arguments}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("arguments") != arguments:
+            print(f"warning - the baseline was run with other arguments: {baseline.get('arguments')}")
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"regression - {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Pieces shared by the benchmarks that run Lighthouse behind a real server: a config writer, a synthetic beacon
+producer, an HTTP/1.1 keep-alive load generator and helpers to start servers and measure their processes
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from ipcqueue.posixmq import Queue
+
+SERVERS = {
+    "wsgi": lambda port, workers, threads: [
+        sys.executable, "-m", "gunicorn", "-k", "gthread", "-w", str(workers), "--threads", str(threads),
+        "-b", f"127.0.0.1:{port}", "wsgi:app"
+    ],
+    "asgi": lambda port, workers, threads: [
+        sys.executable, "-m", "uvicorn", "--workers", str(workers), "--port", str(port), "--log-level", "warning",
+        "asgi:app"
+    ]
+}
+
+ACTION_SCRIPT = """import time
+
+
+def main(node_number):
+    time.sleep({action_sec})
+    return {{"action": "bench", "target": node_number, "result": "success"}}
+"""
+
+ADAPTER_NAME = "bench_nodes"
+ROUTE = "/bench_nodes"
+
+
+def write_config(directory: str, queue_name: str, action_sec: float, adapter: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Lighthouse config with a grouped adapter fed from queue_name and an action whose script sleeps for action_sec
+    :param directory: where the config, the script and the shared state are written
+    :param queue_name:
+    :param action_sec:
+    :param adapter: settings overriding those of the adapter
+    :return: path of the config file
+    """
+    script_path = os.path.join(directory, "bench_action.py")
+    with open(script_path, "w") as f:
+        f.write(ACTION_SCRIPT.format(action_sec=action_sec))
+    config = {
+        "log_level": "WARNING",
+        "shared_state_dir": os.path.join(directory, "state"),
+        "ipc_rest_adapters": [{
+            "adapter_name": ADAPTER_NAME,
+            "ipc_queue": queue_name,
+            "rest_route": ROUTE,
+            "group_by_attrib": "ip_address",
+            "aging_time_sec": 60,
+            "batch_size": 64,
+            **(adapter or {})
+        }],
+        "rest_actions": [{
+            "action_name": "bench_action",
+            "rest_route": "/bench_action",
+            "script_path": script_path,
+            "argument_list": [{"name": "node_num", "type": "int"}]
+        }]
+    }
+    config_path = os.path.join(directory, "config.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+    return config_path
+
+
+def beacon(node: int, seq: int, sent_at: float) -> Dict[str, Any]:
+    """
+    a message shaped like the beacon of a compute node, sent_at tells readers how fresh it is
+    """
+    return {
+        "ip_address": f"10.0.{node // 256}.{node % 256}",
+        "hostname": f"node{node:03d}",
+        "cpu": "x86_64",
+        "system": "Linux",
+        "platform": "Linux-5.4.0-48-generic-x86_64-with-glibc2.29",
+        "cpu_usage": random.random() * 100,
+        "mem_usage": random.random() * 100,
+        "seq": seq,
+        "sent_at": sent_at
+    }
+
+
+def produce(queue_name: str, nodes: int, rate: float, duration_sec: float, sent=None):
+    """
+    Send rate messages per second for duration_sec, the nodes taking turns. Messages are stamped with the time
+    they were due, so a producer held back by a full queue shows up as freshness lag rather than a lower rate
+    :param sent: optional multiprocessing.Value, set to the number of messages sent so far
+    """
+    q = Queue(queue_name)
+    started = time.time()
+    total = int(rate * duration_sec)
+    for seq in range(total):
+        due = started + seq / rate
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        q.put(beacon(seq % nodes, seq, due))
+        if sent is not None:
+            sent.value = seq + 1
+
+
+async def http_get(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str) -> Tuple[int, bytes]:
+    """
+    one request over a persistent connection
+    :return: status and body
+    """
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    body = await reader.readexactly(length)
+    return int(head.split(b" ", 2)[1]), body
+
+
+async def client(port: int, deadline: float, paths: List[str], weights: List[float],
+                 latencies: Dict[str, List[float]]):
+    """
+    send requests back to back over one connection until deadline, the path of each picked at random
+    :param latencies: latencies of the successful requests per path, the others are added to "error"
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        while time.monotonic() < deadline:
+            path = random.choices(paths, weights)[0]
+            started = time.perf_counter()
+            status, _ = await http_get(reader, writer, path)
+            latencies[path if status == 200 else "error"].append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_serving(port: int, timeout_sec: float = 20):
+    deadline = time.monotonic() + timeout_sec
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def child_pids(pid: int) -> List[int]:
+    """
+    processes started by pid, e.g. the workers of a server
+    """
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # the command name may contain spaces, the fields after it don't
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def cpu_seconds(pid: int) -> float:
+    """
+    user plus system CPU time used by pid so far, 0 if it exited
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
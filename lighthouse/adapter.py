@@ -1,5 +1,13 @@
+import logging
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Union
+
+from lighthouse.metrics import IngestMetrics
+from lighthouse.schema import Schema, MessageRejectedError
+from lighthouse.passthrough import JSONPassthrough
+
+_logger = logging.getLogger("Lighthouse")
 
 
 class Target(ABC):
@@ -23,6 +31,45 @@ class Target(ABC):
         """
         pass
 
+    def feed_many(self, data: List[Dict[Any, Any]]):
+        """
+        Feed a batch of messages, in the order they were received, to this component
+        :param data:
+        :return:
+        """
+        for message in data:
+            self.feed(message)
+
+    def begin_ingest(self):
+        """
+        Called once before this process starts feeding the component, e.g. to take over state
+        published by a previous ingest process
+        :return:
+        """
+        pass
+
+    def expire(self):
+        """
+        Drop information that has aged, called periodically by the ingest loop
+        :return:
+        """
+        pass
+
+    def refresh(self):
+        """
+        Called periodically in processes that don't ingest, to pick up the information published by
+        the ingest process
+        :return:
+        """
+        pass
+
+    def publish(self):
+        """
+        Make the information fed so far visible to readers in other processes
+        :return:
+        """
+        pass
+
 
 class Source(ABC):
     """
@@ -36,21 +83,95 @@ class Source(ABC):
         """
         pass
 
+    def fileno(self) -> Optional[int]:
+        """
+        File descriptor that becomes readable when a message is available, used to wait on several
+        sources at once. Sources that can't be waited on return None and are polled instead
+        :return:
+        """
+        return None
+
+    def size(self) -> Optional[int]:
+        """
+        Number of messages waiting in this source, None if unknown
+        :return:
+        """
+        return None
+
 
 class Adapter:
     """
-    An adapter between a source and a target components
+    An adapter between a source and a target components.
+    With a batch_size larger than 1, each update drains up to batch_size messages (or as many as arrive within
+    batch_time_usec) from the source and passes them to the target at once.
+    With a decoder (a Schema, or JSONPassthrough), the source provides raw messages which are decoded into
+    records, messages the decoder rejects are dropped
     """
-    def __init__(self, name: str, source, target):
+    # messages rejected by the decoder are logged at most this often
+    REJECTED_LOG_INTERVAL_SEC = 10
+
+    def __init__(self, name: str, source, target, batch_size: int = 1, batch_time_usec: int = 1000,
+                 decoder: Optional[Union[Schema, JSONPassthrough]] = None):
         self.name = name
         self.source = source
         self.target = target
+        self.batch_size = batch_size
+        self.batch_time_usec = batch_time_usec
+        self.decoder = decoder
+        self.metrics = IngestMetrics()
+        self._rejected_logged_at = 0.0
 
-    def update(self):
+    def update(self) -> bool:
         """
-        Get a message from the source and pass it to target
-        :return:
+        Get a message (or a batch of messages) from the source and pass it to target
+        :return: True if a message was taken from the source
         """
+        if self.batch_size > 1:
+            return self._update_batch()
+
+        started = time.perf_counter()
         msg = self.source.get_message()
-        if msg:
-            self.target.feed(msg)
+        if not msg:
+            return False
+        if self.decoder is not None:
+            msg = self._decode(msg)
+            if msg is None:
+                return True
+        self.target.feed(msg)
+        self.metrics.record(1, time.perf_counter() - started)
+        return True
+
+    def _update_batch(self) -> bool:
+        batch = []
+        rejected = self.metrics.rejected
+        started = time.perf_counter()
+        deadline = started + self.batch_time_usec / 1e6
+        while len(batch) < self.batch_size:
+            msg = self.source.get_message()
+            if not msg:
+                break
+            if self.decoder is not None:
+                msg = self._decode(msg)
+            if msg is not None:
+                batch.append(msg)
+            if time.perf_counter() >= deadline:
+                break
+        if batch:
+            self.target.feed_many(batch)
+            self.metrics.record(len(batch), time.perf_counter() - started)
+            return True
+        return self.metrics.rejected != rejected
+
+    def _decode(self, msg: bytes):
+        """
+        the record of a raw message, None if the decoder rejects it
+        """
+        try:
+            return self.decoder.decode(msg)
+        except MessageRejectedError as e:
+            self.metrics.rejected += 1
+            now = time.monotonic()
+            if now - self._rejected_logged_at >= self.REJECTED_LOG_INTERVAL_SEC:
+                self._rejected_logged_at = now
+                _logger.warning(f"Adapter {self.name} rejected a message ({self.metrics.rejected} so far): {e}")
+            return None
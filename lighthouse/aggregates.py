@@ -0,0 +1,122 @@
+import heapq
+import math
+from collections import Counter
+from typing import Dict, Any, List, Optional, Iterable
+
+FUNCTIONS = ["sum", "mean", "min", "max", "count"]
+
+
+class Aggregate:
+    """
+    A cluster-wide value computed over the current record of every group, updated incrementally
+    as records are replaced or removed.
+    count without a field counts the groups, with a field the groups reporting a numeric value for it.
+    NaN and infinite values are ignored like values that aren't numbers: they would stick in the sum after their
+    record is replaced, and aren't valid JSON
+    """
+    def __init__(self, name: str, function: str, field: Optional[str] = None):
+        if function not in FUNCTIONS:
+            raise ValueError(f"Unknown aggregate function: {function}")
+        self.name = name
+        self.function = function
+        self.field = field
+        self._sum = 0.0
+        self._count = 0
+        # min/max: heap of the current values, removed values are only dropped once they reach the top
+        self._heap: List[float] = []
+        self._removed: Counter = Counter()
+
+    def add(self, record: Dict[Any, Any]):
+        value = self._value_of(record)
+        if value is None:
+            return
+        self._count += 1
+        self._sum += value
+        if self.function in ["min", "max"]:
+            heapq.heappush(self._heap, value if self.function == "min" else -value)
+
+    def remove(self, record: Dict[Any, Any]):
+        value = self._value_of(record)
+        if value is None:
+            return
+        self._count -= 1
+        # start over from zero to keep rounding errors from accumulating
+        self._sum = self._sum - value if self._count else 0.0
+        if self.function in ["min", "max"]:
+            self._removed[value if self.function == "min" else -value] += 1
+            if len(self._heap) > 2 * self._count + 16:
+                self._compact()
+
+    def _compact(self):
+        """
+        drop the removed values from the heap, so that it doesn't grow with every replaced record
+        """
+        heap = []
+        for value in self._heap:
+            if self._removed[value]:
+                self._removed[value] -= 1
+            else:
+                heap.append(value)
+        heapq.heapify(heap)
+        self._heap = heap
+        self._removed = Counter()
+
+    def result(self) -> Optional[float]:
+        if self.function == "count":
+            return self._count
+        if not self._count:
+            return None
+        if self.function == "sum":
+            return self._sum
+        if self.function == "mean":
+            return self._sum / self._count
+        while self._removed[self._heap[0]]:
+            self._removed[heapq.heappop(self._heap)] -= 1
+        return self._heap[0] if self.function == "min" else -self._heap[0]
+
+    def _value_of(self, record: Dict[Any, Any]) -> Optional[float]:
+        if self.field is None:
+            return 1.0
+        value = record.get(self.field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            return value
+        return None
+
+
+class Aggregates:
+    """
+    All aggregates of a target
+    """
+    def __init__(self, config: List[Dict[str, str]]):
+        self._config = config
+        self._aggregates = self._create_aggregates()
+
+    def _create_aggregates(self) -> List[Aggregate]:
+        return [
+            Aggregate(name=aggregate["name"], function=aggregate["function"], field=aggregate.get("field"))
+            for aggregate in self._config
+        ]
+
+    def replace(self, old_record: Optional[Dict[Any, Any]], new_record: Optional[Dict[Any, Any]]):
+        """
+        Account for a group's record being replaced by a newer one, or being removed if new_record is None
+        :param old_record:
+        :param new_record:
+        :return:
+        """
+        for aggregate in self._aggregates:
+            if old_record is not None:
+                aggregate.remove(old_record)
+            if new_record is not None:
+                aggregate.add(new_record)
+
+    def rebuild(self, records: Iterable[Dict[Any, Any]]):
+        """
+        Start over from the given records
+        """
+        self._aggregates = self._create_aggregates()
+        for record in records:
+            self.replace(None, record)
+
+    def results(self) -> Dict[str, Optional[float]]:
+        return {aggregate.name: aggregate.result() for aggregate in self._aggregates}
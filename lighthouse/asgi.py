@@ -0,0 +1,200 @@
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from flask import Flask
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, quote_etag
+
+from lighthouse.lighthouse import app as flask_app, RESTAPITarget, RESTAction, route_metrics
+from lighthouse.shared_state import StateUnavailableError
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class LighthouseASGI:
+    """
+    ASGI application serving the routes registered with the Flask app, for asyncio servers such as uvicorn.
+
+    Requests are still answered by the Flask views, but not all of them in the same place: target routes only
+    read the current snapshot and are answered on the event loop, actions (which may shell out for seconds)
+    run in a thread pool, and streams wait for events on the event loop instead of holding a thread each
+    """
+    # max. number of actions running at the same time, further calls wait for a free thread
+    ACTION_WORKERS = 32
+
+    def __init__(self, wsgi_app: Flask, action_workers: int = ACTION_WORKERS):
+        self.wsgi_app = wsgi_app
+        self._executor = ThreadPoolExecutor(max_workers=action_workers, thread_name_prefix="lighthouse_action")
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        environ = _to_environ(scope, await _read_body(receive))
+        rule, view = self._match(environ)
+        if isinstance(getattr(view, "__self__", None), RESTAPITarget) \
+                and view.__func__ is RESTAPITarget.serve_stream:
+            await self._serve_stream(view.__self__, environ, receive, send)
+            return
+        if isinstance(view, RESTAPITarget) and not environ["QUERY_STRING"]:
+            started = time.perf_counter()
+            try:
+                status, headers, body = self._serve_target(view, environ)
+            except StateUnavailableError:
+                # answered by the error handler of the Flask app
+                status, headers, body = self._call_wsgi(environ)
+            else:
+                # the other routes are measured by the Flask app
+                route_metrics.observe(rule, environ["REQUEST_METHOD"], status, time.perf_counter() - started)
+        elif isinstance(view, RESTAction):
+            loop = asyncio.get_running_loop()
+            status, headers, body = await loop.run_in_executor(self._executor, self._call_wsgi, environ)
+        else:
+            status, headers, body = self._call_wsgi(environ)
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def _match(self, environ: Dict[str, Any]) -> Tuple[Optional[str], Optional[Callable]]:
+        """
+        the URL rule matching this request and the view the Flask app would call for it, None if there is none
+        """
+        try:
+            rule, _ = self.wsgi_app.url_map.bind_to_environ(environ).match(return_rule=True)
+        except HTTPException:
+            return None, None
+        return rule.rule, self.wsgi_app.view_functions.get(rule.endpoint)
+
+    @staticmethod
+    def _serve_target(target: RESTAPITarget, environ: Dict[str, Any]) -> Tuple[int, Headers, bytes]:
+        """
+        Same response as RESTAPITarget.__call__, straight from the cached serialized data. Polling the targets is
+        by far the most frequent request, this spares it the Flask request handling
+        """
+        body, etag, encoding = target.get_encoded_data(environ.get("HTTP_ACCEPT_ENCODING"))
+        headers = [
+            (b"etag", quote_etag(etag).encode("latin-1")),
+            (b"cache-control", b"no-cache"),
+            (b"vary", b"Accept-Encoding"),
+            (b"access-control-allow-origin", b"*")
+        ]
+        if parse_etags(environ.get("HTTP_IF_NONE_MATCH")).contains(etag):
+            return 304, headers, b""
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1"))]
+        if encoding is not None:
+            headers.append((b"content-encoding", encoding.encode("latin-1")))
+        return 200, headers, body
+
+    def _call_wsgi(self, environ: Dict[str, Any]) -> Tuple[int, Headers, bytes]:
+        response_start = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            response_start[:] = [status, headers]
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            body = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        status, headers = response_start
+        headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        return int(status.split(" ", 1)[0]), headers, body
+
+    @staticmethod
+    async def _serve_stream(target: RESTAPITarget, environ: Dict[str, Any], receive: Callable, send: Callable):
+        last_event_id = environ.get("HTTP_LAST_EVENT_ID", "")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+                (b"access-control-allow-origin", b"*")
+            ]
+        })
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        stream = target.stream_async(int(last_event_id) if last_event_id.isdigit() else None)
+        try:
+            while True:
+                # stop waiting for the next event as soon as the client is gone
+                next_chunk = asyncio.ensure_future(stream.__anext__())
+                await asyncio.wait([next_chunk, disconnected], return_when=asyncio.FIRST_COMPLETED)
+                if not next_chunk.done():
+                    next_chunk.cancel()
+                    await asyncio.wait([next_chunk])
+                    return
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+            await stream.aclose()
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _read_body(receive: Callable) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def _wait_for_disconnect(receive: Callable):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _to_environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    """
+    WSGI environ of an ASGI http request
+    """
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name not in ["CONTENT_TYPE", "CONTENT_LENGTH"]:
+            name = "HTTP_" + name
+        environ[name] = environ[name] + "," + value if name in environ else value
+    return environ
+
+
+app = LighthouseASGI(flask_app)
@@ -0,0 +1,100 @@
+import gzip
+import threading
+from typing import Dict, List, Optional, Callable
+
+from flask import Response
+from werkzeug.http import parse_accept_header
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# bodies smaller than this are sent as they are, compressing them saves less than it costs
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def _gzip(body: bytes) -> bytes:
+    # without a modification time the output only depends on the body, so that all workers agree on the ETag
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _zstd(body: bytes) -> bytes:
+    # compressors are not thread-safe, each call gets its own
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+
+# available content encodings, in order of preference
+ENCODINGS: Dict[str, Callable[[bytes], bytes]] = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = _zstd
+ENCODINGS["gzip"] = _gzip
+# encodings that may be configured, zstd needs the zstandard package
+KNOWN_ENCODINGS = ["zstd", "gzip"]
+
+
+class Compression:
+    """
+    Compression of response bodies, negotiated with the client through Accept-Encoding
+    """
+    def __init__(self, min_size: int = MIN_SIZE, encodings: Optional[List[str]] = None):
+        """
+        :param min_size: bodies smaller than this many bytes are not compressed
+        :param encodings: encodings to offer, in order of preference, all available ones if None. Encodings that
+         aren't available are left out
+        """
+        self.min_size = min_size
+        self.encodings = [e for e in (KNOWN_ENCODINGS if encodings is None else encodings) if e in ENCODINGS]
+
+    def choose(self, accept_encoding: Optional[str], size: int) -> Optional[str]:
+        """
+        :param accept_encoding: Accept-Encoding header of the request
+        :param size: of the body
+        :return: the encoding to send a body of this size in, None to send it as it is
+        """
+        if size < self.min_size or not accept_encoding or not self.encodings:
+            return None
+        return parse_accept_header(accept_encoding).best_match(self.encodings)
+
+    def compress_response(self, response: Response, accept_encoding: Optional[str]) -> Response:
+        """
+        Compress the body of a response that isn't cached, e.g. the result of an action
+        :param response:
+        :param accept_encoding: Accept-Encoding header of the request
+        :return: the response
+        """
+        if response.is_streamed or response.direct_passthrough or "Content-Encoding" in response.headers:
+            return response
+        response.vary.add("Accept-Encoding")
+        body = response.get_data()
+        encoding = self.choose(accept_encoding, len(body))
+        if encoding is not None:
+            response.set_data(ENCODINGS[encoding](body))
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+
+class CompressedBodies:
+    """
+    A response body and its compressed variants, each compressed once, by the first request asking for it, and
+    shared by all requests after
+    """
+    def __init__(self, body: bytes):
+        self._bodies: Dict[Optional[str], bytes] = {None: body}
+        self._lock = threading.Lock()
+
+    def get(self, encoding: Optional[str]) -> bytes:
+        """
+        :param encoding: one of ENCODINGS, None for the body as it is
+        :return:
+        """
+        body = self._bodies.get(encoding)
+        if body is None:
+            # concurrent requests for a new variant wait for it instead of compressing it too
+            with self._lock:
+                body = self._bodies.get(encoding)
+                if body is None:
+                    body = self._bodies[encoding] = ENCODINGS[encoding](self._bodies[None])
+        return body
@@ -0,0 +1,31 @@
+import threading
+import time
+from typing import Any, Callable, Optional
+
+_local = threading.local()
+
+
+def call_with_deadline(deadline: float, function: Callable, *arguments) -> Any:
+    """
+    Call function, letting it (and anything it calls in this thread) know by when it has to be done
+    :param deadline: time.monotonic() value
+    :param function:
+    :param arguments:
+    :return:
+    """
+    _local.deadline = deadline
+    try:
+        return function(*arguments)
+    finally:
+        _local.deadline = None
+
+
+def time_left() -> Optional[float]:
+    """
+    Seconds until the deadline of the current call, None if there is none. Used by action scripts to bound
+    the commands they run
+    """
+    deadline = getattr(_local, "deadline", None)
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
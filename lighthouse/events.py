@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+
+
+class EventBroadcaster:
+    """
+    Fan-out of server-sent events to any number of subscribers.
+
+    Every event is serialized once by the producer and appended to a bounded backlog, subscribers only keep
+    a cursor into it. An event covers the versions (from_version, to_version] of its target, so a subscriber
+    that fell further behind than the backlog reaches (a slow consumer, or a reconnect after a long time)
+    is detected by the gap in versions and should skip to the latest state instead
+    """
+    def __init__(self, backlog: int = 64):
+        self._events: deque = deque(maxlen=backlog)
+        self._condition = threading.Condition()
+        # (loop, future) of the subscribers waiting in wait_async
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.subscribers = 0
+
+    def publish(self, from_version: int, to_version: int, event: bytes):
+        with self._condition:
+            self._events.append((from_version, to_version, event))
+            self._condition.notify_all()
+            for loop, future in self._async_waiters:
+                loop.call_soon_threadsafe(_wake, future)
+
+    def clear(self):
+        """
+        Forget the backlog, e.g. when events were not produced for a while
+        """
+        with self._condition:
+            self._events.clear()
+
+    def subscribe(self):
+        with self._condition:
+            self.subscribers += 1
+
+    def unsubscribe(self):
+        with self._condition:
+            self.subscribers -= 1
+
+    def wait(self, version: int, timeout: float) -> Optional[List[Tuple[int, bytes]]]:
+        """
+        Wait for the events following the given version
+        :param version: the version the subscriber is up to date with
+        :param timeout:
+        :return: list of (version, event), empty on timeout, None if the subscriber fell behind the backlog
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._events and self._events[-1][1] > version, timeout)
+            return self._events_after(version)
+
+    async def wait_async(self, version: int, timeout: float) -> Optional[List[Tuple[int, bytes]]]:
+        """
+        Same as wait, without blocking the event loop
+        """
+        loop = asyncio.get_running_loop()
+        waiter = None
+        with self._condition:
+            if not (self._events and self._events[-1][1] > version):
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(waiter[1], timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    self._async_waiters.remove(waiter)
+        with self._condition:
+            return self._events_after(version)
+
+    def _events_after(self, version: int) -> Optional[List[Tuple[int, bytes]]]:
+        newer = [(from_version, to_version, event) for from_version, to_version, event in self._events
+                 if to_version > version]
+        if newer and newer[0][0] > version:
+            # the events between version and the oldest one in the backlog are gone
+            return None
+        return [(to_version, event) for _, to_version, event in newer]
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
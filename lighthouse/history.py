@@ -0,0 +1,211 @@
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Iterable
+
+# how long the series of a group that stopped reporting is kept after it expired
+EXPIRED_RETENTION_SEC = 3600
+# max. number of groups that stopped reporting whose series are kept, those that expired first are dropped first
+MAX_EXPIRED_GROUPS = 256
+
+
+class SeriesRing:
+    """
+    Fixed size, array backed ring buffer of samples of one group: a timestamp plus one value per field.
+    Takes (1 + number of fields) * 8 * capacity bytes, regardless of the number of samples recorded
+    """
+    def __init__(self, capacity: int, fields: Iterable[str]):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.values: Dict[str, array] = {field: array("d", bytes(8 * capacity)) for field in fields}
+        self._next = 0
+        self.count = 0
+
+    def append(self, timestamp: float, data: Dict[Any, Any]):
+        self.timestamps[self._next] = timestamp
+        for field, values in self.values.items():
+            value = data.get(field)
+            values[self._next] = value if _is_number(value) else math.nan
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def oldest_timestamp(self) -> float:
+        return self.timestamps[(self._next - self.count) % self.capacity]
+
+    def indices(self, start: float, end: float) -> List[int]:
+        """
+        positions of the samples with start <= timestamp < end, oldest first
+        """
+        first = (self._next - self.count) % self.capacity
+        positions = ((first + i) % self.capacity for i in range(self.count))
+        return [i for i in positions if start <= self.timestamps[i] < end]
+
+    def export_state(self) -> tuple:
+        return self.timestamps[:], {field: values[:] for field, values in self.values.items()}, self._next, self.count
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "SeriesRing":
+        timestamps, values, next_index, count = state
+        series = cls(0, [])
+        series.capacity = len(timestamps)
+        series.timestamps, series.values, series._next, series.count = timestamps, values, next_index, count
+        return series
+
+
+class History:
+    """
+    Recent numeric values of every group of a target, one SeriesRing per group.
+    When fields is None, the numeric fields of the first message of a group are tracked.
+    The series of a group that stopped reporting is kept for a while, that is when it is looked at the most
+    """
+    def __init__(self, size: int, fields: Optional[List[str]] = None, retention_sec: float = EXPIRED_RETENTION_SEC,
+                 max_expired: int = MAX_EXPIRED_GROUPS):
+        """
+        :param size: number of samples kept per group
+        :param fields: fields to keep, None for the numeric fields of the first message of every group
+        :param retention_sec: how long the series of a group is kept after the group expired
+        :param max_expired: max. number of expired groups whose series are kept
+        """
+        self.size = size
+        self.fields = fields
+        self.retention_sec = retention_sec
+        self.max_expired = max_expired
+        self._series: Dict[Any, SeriesRing] = {}
+        # groups that expired and weren't recorded since, in the order they expired, with the time they did
+        self._expired: Dict[Any, float] = OrderedDict()
+        # rings are updated in place, the lock keeps queries from seeing a half written sample
+        self._lock = threading.Lock()
+
+    def record(self, group: Any, data: Dict[Any, Any], timestamp: float):
+        with self._lock:
+            series = self._series.get(group)
+            if series is None:
+                fields = self.fields
+                if fields is None:
+                    fields = [field for field, value in data.items() if field != "timestamp" and _is_number(value)]
+                series = self._series[group] = SeriesRing(self.size, fields)
+            elif self._expired:
+                self._expired.pop(group, None)
+            series.append(timestamp, data)
+
+    def oldest_timestamp(self) -> Optional[float]:
+        with self._lock:
+            return min((series.oldest_timestamp() for series in self._series.values() if series.count), default=None)
+
+    def expire(self, group: Any, timestamp: float):
+        """
+        The group stopped reporting: keep its series for retention_sec, unless more than max_expired groups
+        expired since
+        """
+        with self._lock:
+            if group not in self._series:
+                return
+            self._expired[group] = timestamp
+            while len(self._expired) > self.max_expired:
+                dropped, _ = self._expired.popitem(last=False)
+                del self._series[dropped]
+
+    def prune(self, now: float):
+        """
+        Drop the series of the groups that expired more than retention_sec ago
+        """
+        with self._lock:
+            for group, expired_at in list(self._expired.items()):
+                if now - expired_at < self.retention_sec:
+                    break
+                del self._expired[group]
+                del self._series[group]
+
+    def query(self, start: float, end: float, buckets: Optional[int] = None, group: Any = None,
+              fields: Optional[List[str]] = None) -> Dict[Any, Dict[str, Any]]:
+        """
+        Get the samples recorded in [start, end) per group, optionally downsampled into buckets of equal width.
+        Without downsampling each field maps to a list of values, with downsampling to lists of min/max/mean
+        :param start:
+        :param end:
+        :param buckets:
+        :param group: only return this group
+        :param fields: only return these fields
+        :return:
+        """
+        result = {}
+        with self._lock:
+            groups = self._series.items() if group is None else [(group, self._series.get(group))]
+            for key, series in groups:
+                if series is None:
+                    continue
+                indices = series.indices(start, end)
+                timestamps = [series.timestamps[i] for i in indices]
+                values = {
+                    field: [series.values[field][i] for i in indices]
+                    for field in series.values if fields is None or field in fields
+                }
+                if buckets:
+                    result[key] = _downsample(timestamps, values, start, end, buckets)
+                else:
+                    values = {field: [_to_json(value) for value in samples] for field, samples in values.items()}
+                    result[key] = {"timestamp": timestamps, **values}
+        return result
+
+    def export_state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "series": {group: series.export_state() for group, series in self._series.items()},
+                "expired": list(self._expired.items())
+            }
+
+    def load_state(self, state: Dict[str, Any]):
+        series_states, expired_groups = state.get("series"), state.get("expired")
+        if not isinstance(series_states, dict) or not isinstance(expired_groups, list):
+            # shared by a process of a previous version, which only kept the series
+            series_states, expired_groups = state, []
+        series_by_group = {}
+        for group, series_state in series_states.items():
+            series = SeriesRing.from_state(series_state)
+            # skip series saved before the size was changed in the config
+            if series.capacity == self.size:
+                series_by_group[group] = series
+        expired = OrderedDict((group, at) for group, at in expired_groups if group in series_by_group)
+        with self._lock:
+            self._series = series_by_group
+            self._expired = expired
+
+
+def _downsample(timestamps: List[float], values: Dict[str, List[float]], start: float, end: float,
+                buckets: int) -> Dict[str, Any]:
+    width = (end - start) / buckets
+    bucket_of_sample = [min(int((timestamp - start) / width), buckets - 1) for timestamp in timestamps]
+    result: Dict[str, Any] = {"timestamp": [start + i * width for i in range(buckets)]}
+    for field, samples in values.items():
+        minimums: List[Optional[float]] = [None] * buckets
+        maximums: List[Optional[float]] = [None] * buckets
+        sums = [0.0] * buckets
+        counts = [0] * buckets
+        for bucket, value in zip(bucket_of_sample, samples):
+            if math.isnan(value):
+                continue
+            if counts[bucket] == 0:
+                minimums[bucket] = maximums[bucket] = value
+            else:
+                minimums[bucket] = min(minimums[bucket], value)
+                maximums[bucket] = max(maximums[bucket], value)
+            sums[bucket] += value
+            counts[bucket] += 1
+        result[field] = {
+            "min": minimums,
+            "max": maximums,
+            "mean": [total / count if count else None for total, count in zip(sums, counts)]
+        }
+    return result
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _to_json(value: float) -> Optional[float]:
+    """
+    NaN marks a missing value, which is not valid JSON
+    """
+    return None if math.isnan(value) else value
@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+_logger = logging.getLogger("Lighthouse")
+
+
+class JobsBusyError(Exception):
+    """
+    Raised when as many jobs as allowed are queued or running
+    """
+    pass
+
+
+class JobManager:
+    """
+    Runs actions in the background on a bounded pool of threads and keeps a record of every job: its status
+    (queued, running, finished or failed), result or error, and timings.
+
+    When a directory is given, job records are also written there (one JSON file per job, replaced atomically,
+    readable by the owner only), so that a job submitted through one worker process can be looked up through any
+    other one. Records leave out the arguments of the job, which may be secrets such as the password of a new user.
+    Finished jobs are forgotten once more than max_jobs are kept, or after max_age_sec. At most max_pending jobs
+    are queued or running, further jobs are rejected
+    """
+    def __init__(self, workers: int = 4, max_jobs: int = 1000, max_age_sec: float = 3600,
+                 directory: Optional[str] = None, max_pending: int = 100):
+        self.max_jobs = max_jobs
+        self.max_age_sec = max_age_sec
+        self.directory = directory
+        self.max_pending = max_pending
+        # number of jobs queued or running, the queue of the executor itself is unbounded
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lighthouse_job")
+        # records of the jobs submitted in this process, oldest first
+        self._jobs: Dict[str, Dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            self._remove_old_files()
+
+    def submit(self, action: str, function: Callable, arguments: List[Any]) -> Dict[str, Any]:
+        """
+        Queue function(*arguments) for execution
+        :param action: name of the action, for the job record
+        :param function:
+        :param arguments:
+        :return: the record of the new job
+        :raise JobsBusyError: if max_pending jobs are queued or running
+        """
+        job = {
+            "id": uuid.uuid4().hex,
+            "action": action,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "duration_sec": None,
+            "result": None,
+            "error": None
+        }
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise JobsBusyError()
+            self.pending += 1
+            self._jobs[job["id"]] = job
+            self._save(job)
+            self._remove_old_jobs()
+        self._executor.submit(self._run, job, function, arguments)
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the record of a job, None if it is unknown or was forgotten
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.directory and job_id.isalnum():
+            try:
+                with open(self._path(job_id), "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return None
+
+    def _run(self, job: Dict[str, Any], function: Callable, arguments: List[Any]):
+        self._update(job, status="running", started_at=time.time())
+        try:
+            result = function(*arguments)
+        except Exception as e:
+            _logger.error(f"Job {job['id']} of action {job['action']} failed: {traceback.format_exc()}")
+            self._update(job, status="failed", error=repr(e))
+        else:
+            self._update(job, status="finished", result=result)
+
+    def _update(self, job: Dict[str, Any], **changes):
+        with self._lock:
+            job.update(changes)
+            if job["status"] in ["finished", "failed"]:
+                self.pending -= 1
+                job["finished_at"] = time.time()
+                job["duration_sec"] = job["finished_at"] - job["started_at"]
+            self._save(job)
+
+    def _remove_old_jobs(self):
+        """
+        forget the oldest finished jobs beyond max_jobs or max_age_sec, jobs that didn't finish are kept
+        """
+        deadline = time.time() - self.max_age_sec
+        excess = len(self._jobs) - self.max_jobs
+        for job_id, job in list(self._jobs.items()):
+            if job["finished_at"] is None:
+                continue
+            if excess <= 0 and job["finished_at"] > deadline:
+                break
+            del self._jobs[job_id]
+            excess -= 1
+            if self.directory:
+                try:
+                    os.remove(self._path(job_id))
+                except OSError:
+                    pass
+
+    def _remove_old_files(self):
+        """
+        drop the records left behind by earlier processes
+        """
+        deadline = time.time() - self.max_age_sec
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _save(self, job: Dict[str, Any]):
+        if not self.directory:
+            return
+        path = self._path(job["id"])
+        try:
+            with open(os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                json.dump(job, f, default=repr)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            _logger.error(f"Failed to save job {job['id']}: {e}")
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id + ".json")
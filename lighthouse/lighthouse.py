@@ -1,4 +1,4 @@
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Union, Tuple, NamedTuple, Callable
 import json
 import threading
 import time
@@ -6,15 +6,63 @@ import os
 import logging
 import pathlib
 import sys
-import importlib
+import importlib.util
+import inspect
+import selectors
+import pickle
+import hashlib
+import functools
+import keyword
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 
-from flask import Flask, make_response
+from flask import Flask, make_response, request, Response, g
+from flask.json.provider import DefaultJSONProvider
 from ipcqueue.posixmq import queue, Queue
-from readerwriterlock.rwlock import RWLockRead
+from ipcqueue.serializers import PickleSerializer, RawSerializer
 
 from lighthouse.adapter import Target, Source, Adapter
+from lighthouse.shared_state import SharedStateStore, IngestLock, StateUnavailableError
+from lighthouse.history import History, EXPIRED_RETENTION_SEC as HISTORY_EXPIRED_RETENTION_SEC, \
+    MAX_EXPIRED_GROUPS as HISTORY_MAX_EXPIRED_GROUPS
+from lighthouse.aggregates import Aggregates, FUNCTIONS as AGGREGATE_FUNCTIONS
+from lighthouse.events import EventBroadcaster
+from lighthouse.jobs import JobManager, JobsBusyError
+from lighthouse.single_flight import SingleFlight
+from lighthouse.limits import ConcurrencyLimit, ActionBusyError, ActionQueueTimeoutError, ActionTimeoutError
+from lighthouse.deadline import call_with_deadline
+from lighthouse.metrics import IngestMetrics, RouteMetrics, ActionMetrics, MetricsWriter
+from lighthouse.schema import Schema, Record, TYPES as SCHEMA_TYPES, FORMATS as SCHEMA_FORMATS, \
+    RESERVED_NAMES as SCHEMA_RESERVED_NAMES
+from lighthouse.passthrough import JSONPassthrough
+from lighthouse.query import Query, QueryError, FieldIndex, Change
+from lighthouse.snapshots import SnapshotFile
+from lighthouse.compression import Compression, CompressedBodies, MIN_SIZE as COMPRESSION_MIN_SIZE, \
+    KNOWN_ENCODINGS as COMPRESSION_ENCODINGS
+
+
+class LighthouseJSONProvider(DefaultJSONProvider):
+    """
+    Serializes the records of adapters with a schema like the dicts they replace.
+    Always compact, so that the bodies cached by the targets, the stream events and the responses built by
+    make_response are encoded alike
+    """
+    compact = True
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.as_dict()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        kwargs.setdefault("separators", (",", ":"))
+        return super().dumps(obj, **kwargs)
+
 
 app = Flask(__name__)
+app.json = LighthouseJSONProvider(app)
 logging.basicConfig(
     filename=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'lighthouse.log'),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s ',
@@ -22,6 +70,33 @@ logging.basicConfig(
 )
 _logger = logging.getLogger("Lighthouse")
 
+# latency of the requests answered by this process, reported on /metrics
+route_metrics = RouteMetrics()
+
+
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def _observe_request(response: Response) -> Response:
+    started = g.get("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        route_metrics.observe(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
+def _handle_state_unavailable(e):
+    return {
+        "status": "unavailable",
+        "description": "The state of this route could not be read, retry later"
+    }, 503, {"Retry-After": "1", "Access-Control-Allow-Origin": "*"}
+
+
+app.before_request(_start_request_timer)
+app.after_request(_observe_request)
+app.register_error_handler(StateUnavailableError, _handle_state_unavailable)
+
 
 class ConfigFileInvalidError(Exception):
     """
@@ -30,74 +105,857 @@ class ConfigFileInvalidError(Exception):
     pass
 
 
+class TargetSnapshot(NamedTuple):
+    """
+    Immutable state of a RESTAPITarget, replaced as a whole whenever the target changes
+    """
+    version: int
+    persistence: Dict[Any, Any]
+    # results of the configured aggregates over the records of this snapshot
+    aggregates: Dict[str, Any] = {}
+    # grouped only: version at which each group was last fed, in the same order as persistence
+    changed_at: Dict[Any, int] = {}
+    # grouped only: (version, group) of the most recently expired groups, oldest first
+    expired: Tuple[Tuple[int, Any], ...] = ()
+    # expired lists every group expired after this version, older ones were dropped
+    expired_complete_since: int = 0
+    # number of groups (or records, when not grouped) expired since the target was created
+    expired_count: int = 0
+    # grouped only: indexes of the fields queries filter on, by field. Rebuilt by every process instead of shared
+    indexes: Dict[str, FieldIndex] = {}
+
+
+# serialized response of a target: (version, valid until, body, etag, compressed bodies)
+CachedResponse = Tuple[int, float, bytes, str, CompressedBodies]
+
+
 class RESTAPITarget(Target):
     """
-    Information target to be used as a REST API endpoint
+    Information target to be used as a REST API endpoint.
+
+    State is copy-on-write: writers build a new TargetSnapshot and publish it by replacing a single reference,
+    readers take no lock and work on whichever snapshot was current when they started
     """
-    def __init__(self, name: str, group_by_attr: Optional[str] = None):
+    # the history is large compared to the snapshot, so it is shared between processes less often
+    HISTORY_PUBLISH_INTERVAL_SEC = 1.0
+    # replicas reload the snapshot at most this often for metrics and plain requests (which are answered from the
+    # response published by the ingest process when it is current). Queries, aggregates and ?since= with a newer
+    # seq than the snapshot reload it at once, so that they are as current as on the ingest process
+    REPLICA_SYNC_INTERVAL_SEC = 0.5
+    # a stream is closed after this time (clients reconnect) so that it doesn't hold a thread forever
+    STREAM_MAX_DURATION_SEC = 300
+    # a comment is sent on idle streams at this interval, which also detects disconnected clients
+    STREAM_HEARTBEAT_SEC = 15
+    # number of expired groups remembered for ?since= queries
+    MAX_EXPIRED_GROUPS = 1024
+    # number of queries (?fields= and filters) whose serialized response is cached
+    QUERY_CACHE_SIZE = 64
+    # records dropped as they lack the group_by_attr are logged at most this often
+    DROPPED_LOG_INTERVAL_SEC = 10
+
+    def __init__(self, name: str, group_by_attr: Optional[str] = None, aging_time_sec: float = 10,
+                 history: Optional[History] = None, aggregates: Optional[Aggregates] = None,
+                 events: Optional[EventBroadcaster] = None, passthrough: bool = False,
+                 indexes: Optional[List[str]] = None, compression: Optional[Compression] = None):
         _logger.debug(msg=f"Creating new RESTAPITarget with name:{name}, group_by_attr:{group_by_attr}")
         self.name = name
         self.group_by_attr = group_by_attr
-        self.persistence: Dict[Any, Any] = {}
         self.container_name = self.name[1:]
         self.response: Dict[str, Any] = {self.container_name: None}
-        self.aging_time_sec = 10
-        self.rw_lock = RWLockRead()
+        self.aging_time_sec = aging_time_sec
+        # when grouped, records are kept in the order they were last fed. As all records of a target age after
+        # the same time, this is also the order in which they expire, so the dict doubles as expiry queue
+        self.index_fields = (indexes or []) if group_by_attr else []
+        self._snapshot = TargetSnapshot(version=0, persistence=OrderedDict(), indexes=self._build_indexes({}))
+        # only serializes writers, readers never take it
+        self._write_lock = threading.Lock()
+        # shared memory store the state is published to (ingest process) or replicated from (other processes)
+        self.store: Optional[SharedStateStore] = None
+        self.is_replica = False
+        self._store_sequence = 0
+        self._synced_at = 0.0
+        self._published_version = 0
+        # serialized response published by the ingest process along with the snapshot, served by replicas as is
+        self.response_store: Optional[SharedStateStore] = None
+        self._response_store_sequence = 0
+        self._published_response: Optional[CachedResponse] = None
+        # optional time series of the numeric fields of every group
+        self.history = history
+        self.history_store: Optional[SharedStateStore] = None
+        self._history_store_sequence = 0
+        self._history_published_version = 0
+        self._history_published_at = 0.0
+        self._dropped_logged_at = 0.0
+        # optional cluster-wide values, updated along with every change of the records
+        self.aggregates = aggregates
+        # optional push of changes to subscribers of <rest_route>/stream
+        self.events = events
+        # replicas diff the old and new snapshot to produce events, only one thread should do so at a time
+        self._sync_lock = threading.Lock()
+        # serialized response for the current version
+        self._cached_response: Optional[CachedResponse] = None
+        # records are EncodedRecords, responses are joined from their JSON texts instead of being encoded
+        self.passthrough = passthrough
+        self._encoded_container_name = json.dumps(self.container_name).encode("utf-8")
+        # serialized responses of the most recent queries (?fields= and filters), same tuples by query
+        self._query_cache: Dict[Query, CachedResponse] = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self.compression = compression or Compression()
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def persistence(self) -> Dict[Any, Any]:
+        """
+        records of the current snapshot, must not be modified
+        """
+        return self._snapshot.persistence
 
     def __call__(self, *args, **kwargs):
-        response = make_response(self.get_data())
+        since = request.args.get("since", None, type=int)
+        if since is not None:
+            response = make_response(self.get_changes_since(since))
+            response.headers["Cache-Control"] = "no-cache"
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            return self.compression.compress_response(response, request.headers.get("Accept-Encoding"))
+        try:
+            query = Query.from_args(request.args)
+        except QueryError as e:
+            response = make_response({"status": "application error", "description": str(e)}, 400)
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            return response
+        body, etag, encoding = self.get_encoded_data(request.headers.get("Accept-Encoding"), query)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype="application/json")
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        # clients should revalidate on every poll, which is cheap thanks to the ETag
+        response.headers["Cache-Control"] = "no-cache"
         response.headers["Access-Control-Allow-Origin"] = "*"
         return response
 
+    def get_serialized_data(self, query: Optional[Query] = None) -> Tuple[bytes, str]:
+        """
+        Get the response serialized to JSON along with its ETag. The serialized response is cached until
+        new data is fed or until one of the records it contains ages
+        :param query: optional projection and filters of the records, the response is cached per query
+        :return:
+        """
+        _, _, body, etag, _ = self._get_cached(query)
+        return body, etag
+
+    def get_encoded_data(self, accept_encoding: Optional[str], query: Optional[Query] = None) \
+            -> Tuple[bytes, str, Optional[str]]:
+        """
+        Get the serialized response like get_serialized_data, compressed in an encoding the client accepts if it
+        is large enough. Compressed bodies are cached along with the serialized response
+        :param accept_encoding: Accept-Encoding header of the request
+        :param query: optional projection and filters of the records
+        :return: body, ETag (one per encoding) and the encoding, None if the body is not compressed
+        """
+        _, _, body, etag, bodies = self._get_cached(query)
+        encoding = self.compression.choose(accept_encoding, len(body))
+        if encoding is None:
+            return body, etag, None
+        return bodies.get(encoding), f"{etag}-{encoding}", encoding
+
+    def _get_cached(self, query: Optional[Query]) -> CachedResponse:
+        if query is None:
+            return self._get_cached_response()
+        return self._get_cached_query_response(query)
+
+    def _get_cached_response(self, published: bool = True) -> CachedResponse:
+        """
+        :param published: a replica may answer with the response published by the ingest process, which can be
+         of a newer version than its own snapshot
+        """
+        if self.is_replica:
+            cached = self._get_published_response() if published else None
+            if cached is not None:
+                return cached
+            self._sync_from_store()
+        now = time.time()
+        snapshot = self._snapshot
+        cached = self._cached_response
+        if cached and cached[0] == snapshot.version and now < cached[1]:
+            return cached
+
+        response = self._prepare_new_response(snapshot)
+        if self.passthrough:
+            body = self._join_encoded(response)
+        else:
+            body = app.json.dumps(response).encode("utf-8")
+        # derived from the content, so that all workers agree on the ETag of the same data
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        cached = self._cached_response = (
+            snapshot.version, self._valid_until(response), body, etag, CompressedBodies(body)
+        )
+        return cached
+
+    def _get_cached_query_response(self, query: Query) -> CachedResponse:
+        if self.is_replica:
+            self._sync_from_store(force=True)
+        now = time.time()
+        snapshot = self._snapshot
+        with self._query_cache_lock:
+            cached = self._query_cache.get(query)
+        if cached and cached[0] == snapshot.version and now < cached[1]:
+            return cached
+
+        response = self.get_query_data(query, snapshot)
+        valid_until = self._valid_until(response)
+        if query.fields is not None:
+            projected = response.get(self.container_name)
+            if self.group_by_attr:
+                response[self.container_name] = [query.project(record) for record in projected]
+            elif projected is not None:
+                response[self.container_name] = query.project(projected)
+        if self.passthrough and query.fields is None:
+            body = self._join_encoded(response)
+        else:
+            body = app.json.dumps(response).encode("utf-8")
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        cached = (snapshot.version, valid_until, body, etag, CompressedBodies(body))
+        with self._query_cache_lock:
+            self._query_cache[query] = cached
+            self._query_cache.move_to_end(query)
+            if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return cached
+
+    def _get_published_response(self) -> Optional[CachedResponse]:
+        """
+        the response last published by the ingest process, None if there is none or it contains aged records
+        """
+        if self.response_store is None:
+            return None
+        if self.response_store.sequence != self._response_store_sequence:
+            try:
+                sequence, payload = self.response_store.read()
+            except TimeoutError as e:
+                _logger.warning(f"{e}, answering from the last snapshot read")
+                return None
+            if payload is not None:
+                version, valid_until, body, etag = pickle.loads(payload)
+                self._published_response = (version, valid_until, body, etag, CompressedBodies(body))
+            self._response_store_sequence = sequence
+        cached = self._published_response
+        if cached is not None and time.time() < cached[1]:
+            return cached
+        return None
+
+    def get_query_data(self, query: Query, snapshot: Optional[TargetSnapshot] = None) -> Dict[str, Any]:
+        """
+        Get the records that haven't aged and match the filters of the query, not projected to its fields
+        :param query:
+        :param snapshot: the current one if None
+        :return:
+        """
+        if snapshot is None:
+            if self.is_replica:
+                self._sync_from_store(force=True)
+            snapshot = self._snapshot
+        response = {}
+        oldest = time.time() - self.aging_time_sec
+        persistence = snapshot.persistence
+        if self.group_by_attr:
+            records = query.select(persistence, snapshot.indexes, self.group_by_attr)
+            response[self.container_name] = [record for record in records if record["timestamp"] > oldest]
+        elif persistence and persistence["timestamp"] > oldest and query.matches(persistence):
+            response[self.container_name] = persistence
+        return response
+
+    def _valid_until(self, response: Dict[str, Any]) -> float:
+        """
+        time at which the first record contained in the response ages
+        """
+        records = response.get(self.container_name)
+        if not records:
+            # nothing that could age, only new data changes the response
+            return float("inf")
+        if not self.group_by_attr:
+            records = [records]
+        return min(record["timestamp"] for record in records) + self.aging_time_sec
+
+    def _join_encoded(self, response: Dict[str, Any]) -> bytes:
+        """
+        response serialized from the JSON texts of its records, as received by a passthrough adapter
+        """
+        records = response.get(self.container_name)
+        if records is None:
+            return b"{}"
+        if self.group_by_attr:
+            return b"{" + self._encoded_container_name + b":[" + b",".join(r.encoded for r in records) + b"]}"
+        return b"{" + self._encoded_container_name + b":" + records.encoded + b"}"
+
     def get_data(self) -> Dict[Any, Any]:
         """
         copy the data that hasn't aged from storage to response
         """
-        # allow multiple reads from self.persistence
-        with self.rw_lock.gen_rlock():
-            _logger.debug(f"Generating new response for API request {self.name}")
-            return self._prepare_new_response()
+        if self.is_replica:
+            self._sync_from_store()
+        return self._prepare_new_response(self._snapshot)
 
-    def _prepare_new_response(self):
+    def _prepare_new_response(self, snapshot: TargetSnapshot):
         response = {}
         now = time.time()
+        persistence = snapshot.persistence
         if self.group_by_attr:
             # if grouped then request contains a list of objects
             response[self.container_name] = []
-            
-            # only copy data records that haven't aged
-            for group, data in self.persistence.items():
-                if now - data["timestamp"] < self.aging_time_sec:
-                    response[self.container_name].append(data)
+
+            # only copy data records that haven't aged, starting from the most recent one
+            for data in reversed(persistence.values()):
+                if now - data["timestamp"] >= self.aging_time_sec:
+                    break
+                response[self.container_name].append(data)
+            response[self.container_name].reverse()
         else:
             # when not grouped, response contains only a single object.
-            if self.persistence:
-                if now - self.persistence["timestamp"] < self.aging_time_sec:
-                    response[self.container_name] = self.persistence
+            if persistence:
+                if now - persistence["timestamp"] < self.aging_time_sec:
+                    response[self.container_name] = persistence
         return response
 
+    def get_changes_since(self, since: int) -> Dict[str, Any]:
+        """
+        Get the records fed and the groups expired after the given version, along with the current version
+        as "seq" to pass as since on the next call. When the changes since that version are no longer known
+        (or the target is not grouped), the full response is returned instead, with "full" set
+        :param since: "seq" of a previous call, 0 to get everything
+        :return:
+        """
+        if self.is_replica:
+            # a seq handed out by a process with a newer snapshot must not get the full response
+            self._sync_from_store(force=since > self._snapshot.version)
+        snapshot = self._snapshot
+        if not self.group_by_attr or not snapshot.expired_complete_since <= since <= snapshot.version \
+                or len(snapshot.changed_at) != len(snapshot.persistence):
+            response = self._prepare_new_response(snapshot)
+            response.update(expired=[], seq=snapshot.version, full=True)
+            return response
+
+        now = time.time()
+        records = []
+        # groups are ordered by the version they were last fed at, the changed ones are at the end
+        for group, version in reversed(snapshot.changed_at.items()):
+            if version <= since:
+                break
+            record = snapshot.persistence[group]
+            if now - record["timestamp"] < self.aging_time_sec:
+                records.append(record)
+        records.reverse()
+        expired = []
+        for version, group in reversed(snapshot.expired):
+            if version <= since:
+                break
+            # a group fed again after it expired is reported as changed only
+            if group not in snapshot.persistence:
+                expired.append(group)
+        expired.reverse()
+        return {self.container_name: records, "expired": expired, "seq": snapshot.version, "full": False}
+
     def feed(self, data: Dict[Any, Any]):
         """
 
         :param data:
         :return:
         """
-        # sync writing to self.persistence
-        with self.rw_lock.gen_wlock():
-            data["timestamp"] = time.time()
+        self.feed_many([data])
+
+    def feed_many(self, data: List[Dict[Any, Any]]):
+        """
+        Feed a batch of messages as a single new snapshot. Only the last message of each group is kept, messages
+        without the group_by_attr are dropped
+        :param data:
+        :return:
+        """
+        now = time.time()
+        if self.group_by_attr:
+            # checked before anything is changed, the aggregates and the history are updated in place
+            grouped = [record for record in data if self.group_by_attr in record]
+            if len(grouped) != len(data):
+                self._log_dropped(len(data) - len(grouped))
+                if not grouped:
+                    return
+                data = grouped
+        with self._write_lock:
+            snapshot = self._snapshot
+            version = snapshot.version + 1
+            changed_at = None
+            index_changes = []
             if self.group_by_attr:
-                self.persistence[data[self.group_by_attr]] = data
+                persistence = OrderedDict(snapshot.persistence)
+                changed_at = OrderedDict(snapshot.changed_at)
+                for record in data:
+                    self._set_timestamp(record, now)
+                    group = record[self.group_by_attr]
+                    if self.index_fields:
+                        index_changes.append((group, persistence.get(group), record))
+                    if self.aggregates is not None:
+                        self.aggregates.replace(persistence.get(group), record)
+                    persistence[group] = record
+                    persistence.move_to_end(group)
+                    changed_at[group] = version
+                    changed_at.move_to_end(group)
+                    if self.history is not None:
+                        self.history.record(group, record, now)
             else:
-                self.persistence = data
+                persistence = data[-1]
+                self._set_timestamp(persistence, now)
+                if self.aggregates is not None:
+                    self.aggregates.replace(snapshot.persistence or None, persistence)
+                if self.history is not None:
+                    self.history.record(None, persistence, now)
+            self._snapshot = self._new_snapshot(snapshot, version, persistence, changed_at=changed_at,
+                                                index_changes=index_changes)
+            if self.events is not None:
+                self._publish_event(snapshot.version, lambda: self._changes(data, []))
+
+    def _log_dropped(self, count: int):
+        now = time.monotonic()
+        if now - self._dropped_logged_at >= self.DROPPED_LOG_INTERVAL_SEC:
+            self._dropped_logged_at = now
+            _logger.warning(f"Dropped {count} messages of {self.name} without {self.group_by_attr}")
+
+    def _set_timestamp(self, record: Dict[Any, Any], now: float):
+        if self.passthrough:
+            record.stamp(now)
+        else:
+            record["timestamp"] = now
+
+    def _build_indexes(self, persistence: Dict[Any, Any]) -> Dict[str, FieldIndex]:
+        return {field: FieldIndex.build(field, persistence.items()) for field in self.index_fields}
+
+    def _records(self, snapshot: TargetSnapshot) -> List[Dict[Any, Any]]:
+        if self.group_by_attr:
+            return list(snapshot.persistence.values())
+        return [snapshot.persistence] if snapshot.persistence else []
+
+    def _new_snapshot(self, previous: TargetSnapshot, version: int, persistence: Dict[Any, Any],
+                      changed_at: Optional[Dict[Any, int]] = None,
+                      expired_groups: Optional[List[Any]] = None,
+                      index_changes: Optional[List[Change]] = None) -> TargetSnapshot:
+        """
+        snapshot following previous, with the given records and change tracking
+        :param previous:
+        :param version:
+        :param persistence:
+        :param changed_at: new change versions of the groups, unchanged if None
+        :param expired_groups: groups expired at this version
+        :param index_changes: changes of the records to apply to the indexes
+        :return:
+        """
+        aggregates = self.aggregates.results() if self.aggregates is not None else {}
+        expired = previous.expired
+        expired_complete_since = previous.expired_complete_since
+        if expired_groups and self.group_by_attr:
+            expired = expired + tuple((version, group) for group in expired_groups)
+            if len(expired) > self.MAX_EXPIRED_GROUPS:
+                dropped = len(expired) - self.MAX_EXPIRED_GROUPS
+                expired_complete_since = expired[dropped - 1][0]
+                expired = expired[dropped:]
+        return TargetSnapshot(
+            version=version,
+            persistence=persistence,
+            aggregates=aggregates,
+            changed_at=previous.changed_at if changed_at is None else changed_at,
+            expired=expired,
+            expired_complete_since=expired_complete_since,
+            expired_count=previous.expired_count + len(expired_groups or []),
+            indexes={
+                field: index.updated(index_changes) for field, index in previous.indexes.items()
+            } if index_changes else previous.indexes
+        )
+
+    def expire(self):
+        """
+        Evict the records that have aged, oldest first
+        :return:
+        """
+        now = time.time()
+        deadline = now - self.aging_time_sec
+        if self.history is not None:
+            self.history.prune(now)
+        with self._write_lock:
+            snapshot = self._snapshot
+            if self.group_by_attr:
+                expired = 0
+                for data in snapshot.persistence.values():
+                    if data["timestamp"] > deadline:
+                        break
+                    expired += 1
+                if expired:
+                    persistence = OrderedDict(snapshot.persistence)
+                    changed_at = OrderedDict(snapshot.changed_at)
+                    groups = []
+                    index_changes = []
+                    for _ in range(expired):
+                        group, record = persistence.popitem(last=False)
+                        changed_at.pop(group, None)
+                        groups.append(group)
+                        if self.index_fields:
+                            index_changes.append((group, record, None))
+                        if self.aggregates is not None:
+                            self.aggregates.replace(record, None)
+                        if self.history is not None:
+                            self.history.expire(group, now)
+                    self._snapshot = self._new_snapshot(snapshot, snapshot.version + 1, persistence,
+                                                        changed_at=changed_at, expired_groups=groups,
+                                                        index_changes=index_changes)
+                    if self.events is not None:
+                        self._publish_event(snapshot.version, lambda: self._changes([], groups))
+            elif snapshot.persistence and snapshot.persistence["timestamp"] <= deadline:
+                if self.aggregates is not None:
+                    self.aggregates.replace(snapshot.persistence, None)
+                if self.history is not None:
+                    self.history.expire(None, now)
+                self._snapshot = self._new_snapshot(snapshot, snapshot.version + 1, {}, expired_groups=[None])
+                if self.events is not None:
+                    self._publish_event(snapshot.version, lambda: self._changes([], [None]))
+
+    def _changes(self, records: List[Dict[Any, Any]], expired_groups: List[Any]) -> Dict[str, Any]:
+        """
+        payload of an update event: the new records, and the groups that expired
+        """
+        if not self.group_by_attr:
+            return {self.container_name: records[-1] if records else None, "expired": bool(expired_groups)}
+        # last record of each group only
+        latest = {record[self.group_by_attr]: record for record in records}
+        return {self.container_name: list(latest.values()), "expired": expired_groups}
+
+    def _publish_event(self, from_version: int, get_changes):
+        """
+        Push the changes from from_version to the current version to the stream subscribers.
+        The changes are only built and serialized if there are subscribers
+        """
+        if not self.events.subscribers:
+            # nobody to tell, subscribers joining later start from a full state anyway
+            self.events.clear()
+            return
+        version = self._snapshot.version
+        event = f"id: {version}\nevent: update\ndata: {app.json.dumps(get_changes())}\n\n".encode("utf-8")
+        self.events.publish(from_version, version, event)
+
+    def serve_stream(self, *args, **kwargs):
+        """
+        Called by Flask for <rest_route>/stream. Server-sent events: a "snapshot" event with the full response
+        first, then "update" events with the changed records and the expired groups.
+        Clients that fall behind, or reconnect with a Last-Event-ID that is no longer known, get a new snapshot.
+        Refused by servers answering one request at a time per worker (e.g. gunicorn sync workers): a subscriber
+        would hold the worker, and the worker would be killed for not answering in time
+        """
+        if not request.environ.get("wsgi.multithread", False):
+            response = make_response({
+                "status": "application error",
+                "description": f"Streams need a threaded or asyncio server (gunicorn -k gthread, or asgi:app), "
+                               f"poll {self.name}?since=<seq> instead"
+            }, 501)
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            return response
+        last_event_id = request.headers.get("Last-Event-ID", None, type=int)
+        response = Response(self._stream(last_event_id), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        return response
+
+    def _stream(self, version: Optional[int]):
+        self.events.subscribe()
+        try:
+            deadline = time.monotonic() + self.STREAM_MAX_DURATION_SEC
+            timeout = 0
+            while time.monotonic() < deadline:
+                events = self.events.wait(version, timeout=timeout) if version is not None else None
+                version, chunks = self._stream_chunks(version, events, timeout == 0)
+                yield from chunks
+                timeout = self.STREAM_HEARTBEAT_SEC
+        finally:
+            self.events.unsubscribe()
+
+    async def stream_async(self, version: Optional[int]):
+        """
+        Same as the stream served on <rest_route>/stream, for asyncio servers: waits for events without a thread
+        :param version: Last-Event-ID of the client, if any
+        """
+        self.events.subscribe()
+        try:
+            deadline = time.monotonic() + self.STREAM_MAX_DURATION_SEC
+            timeout = 0
+            while time.monotonic() < deadline:
+                events = await self.events.wait_async(version, timeout=timeout) if version is not None else None
+                version, chunks = self._stream_chunks(version, events, timeout == 0)
+                for chunk in chunks:
+                    yield chunk
+                timeout = self.STREAM_HEARTBEAT_SEC
+        finally:
+            self.events.unsubscribe()
+
+    def _stream_chunks(self, version: Optional[int], events: Optional[List[Tuple[int, bytes]]],
+                       first: bool) -> Tuple[Optional[int], List[bytes]]:
+        """
+        what to send to a subscriber up to date with version, given the events that followed it
+        :return: the version the subscriber is up to date with afterwards, and the chunks to send
+        """
+        if events is None or (not events and version != self.version and first):
+            # new subscriber, too slow to follow the changes one by one, or unknown Last-Event-ID
+            version, event = self._snapshot_event()
+            return version, [event]
+        if not events:
+            return version, [b": heartbeat\n\n"]
+        return events[-1][0], [event for _, event in events]
+
+    def _snapshot_event(self) -> Tuple[int, bytes]:
+        # the events that follow are those of the snapshot of this process
+        version, _, body, _, _ = self._get_cached_response(published=False)
+        return version, f"id: {version}\nevent: snapshot\ndata: ".encode("utf-8") + body + b"\n\n"
+
+    def group_counts(self) -> Tuple[int, int]:
+        """
+        Number of groups held (or 1 if a record is held, when not grouped), and number of groups expired so far
+        """
+        if self.is_replica:
+            self._sync_from_store()
+        snapshot = self._snapshot
+        live = len(snapshot.persistence) if self.group_by_attr else int(bool(snapshot.persistence))
+        return live, snapshot.expired_count
+
+    def get_aggregates(self) -> Dict[str, Any]:
+        """
+        Get the current results of the configured aggregates, which are kept up to date by feed and expire
+        """
+        if self.is_replica:
+            self._sync_from_store(force=True)
+        return {self.container_name: self._snapshot.aggregates}
+
+    def serve_aggregates(self, *args, **kwargs):
+        """
+        Called by Flask for <rest_route>/aggregate
+        """
+        response = make_response(self.get_aggregates())
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        return self.compression.compress_response(response, request.headers.get("Accept-Encoding"))
+
+    def get_history(self, start: Optional[float], end: float, buckets: Optional[int] = None, group: Any = None,
+                    fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Get the recorded history of this target, see History.query
+        """
+        if self.is_replica:
+            self._sync_history_from_store()
+        if start is None:
+            start = self.history.oldest_timestamp() or end
+        series = self.history.query(start, end, buckets, group, fields)
+        if not self.group_by_attr:
+            series = series.get(None, {})
+        return {self.container_name: series}
+
+    def serve_history(self, *args, **kwargs):
+        """
+        Called by Flask for <rest_route>/history. Query parameters:
+        start, end - time range as unix timestamps, defaults to everything recorded
+        buckets - downsample into this many buckets of min/max/mean values
+        group - only return the history of this group
+        fields - comma separated list of fields to return
+        """
+        end = request.args.get("end", time.time(), type=float)
+        start = request.args.get("start", None, type=float)
+        buckets = request.args.get("buckets", None, type=int)
+        fields = request.args.get("fields", None)
+        response = make_response(self.get_history(
+            start=start,
+            end=end,
+            buckets=buckets if buckets and buckets > 0 else None,
+            group=request.args.get("group", None),
+            fields=fields.split(",") if fields else None
+        ))
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        return self.compression.compress_response(response, request.headers.get("Accept-Encoding"))
+
+    def attach_store(self, store: SharedStateStore, history_store: Optional[SharedStateStore] = None,
+                     response_store: Optional[SharedStateStore] = None):
+        """
+        Share the state of this target between processes. Until begin_ingest() is called, this target
+        is a read-only replica of the state published to the store by the ingest process
+        :param store:
+        :param history_store: store for the history, if kept
+        :param response_store: store for the serialized response, so that replicas serve it without loading the
+         snapshot
+        :return:
+        """
+        self.store = store
+        self.history_store = history_store
+        self.response_store = response_store
+        self.is_replica = True
+
+    def refresh(self):
+        if self.is_replica and self.events is not None and self.events.subscribers:
+            # push the changes published by the ingest process without waiting for a request. Bounded by the
+            # refresh interval of the caller instead of REPLICA_SYNC_INTERVAL_SEC
+            try:
+                self._sync_from_store(force=True)
+            except StateUnavailableError:
+                pass
+
+    def begin_ingest(self):
+        if self.is_replica:
+            # continue from the state left by the previous ingest process
+            try:
+                self._sync_from_store(force=True)
+                if self.history_store is not None:
+                    self._sync_history_from_store()
+            except StateUnavailableError:
+                # e.g. the previous ingest process died while publishing, the next publish repairs the store
+                _logger.warning(f"Could not read the shared state of {self.name}, starting without it")
+            if self.aggregates is not None:
+                self.aggregates.rebuild(self._records(self._snapshot))
+            self.is_replica = False
+
+    def publish(self):
+        snapshot = self._snapshot
+        if self.store is None:
+            return
+        if self._published_version != snapshot.version:
+            payload = pickle.dumps({**snapshot._asdict(), "indexes": {}}, protocol=pickle.HIGHEST_PROTOCOL)
+            self.store.publish(payload)
+            if self.response_store is not None:
+                version, valid_until, body, etag, _ = self._get_cached_response()
+                self.response_store.publish(
+                    pickle.dumps((version, valid_until, body, etag), protocol=pickle.HIGHEST_PROTOCOL)
+                )
+            self._published_version = snapshot.version
+
+        now = time.time()
+        if self.history_store is not None and self._history_published_version != snapshot.version \
+                and now - self._history_published_at >= self.HISTORY_PUBLISH_INTERVAL_SEC:
+            self.history_store.publish(pickle.dumps(self.history.export_state(), protocol=pickle.HIGHEST_PROTOCOL))
+            self._history_published_version = snapshot.version
+            self._history_published_at = now
+
+    def _sync_from_store(self, force: bool = False):
+        """
+        reload the state from the store, only if it was published to since the last reload
+        :param force: reload even if the last reload was less than REPLICA_SYNC_INTERVAL_SEC ago
+        :raise StateUnavailableError: if the store can't be read and no state was read from it before
+        """
+        if self.store.sequence == self._store_sequence:
+            return
+        if not force and time.monotonic() - self._synced_at < self.REPLICA_SYNC_INTERVAL_SEC:
+            # serve the snapshot read last instead of unpickling and indexing every published version
+            return
+        with self._sync_lock:
+            try:
+                sequence, payload = self.store.read()
+            except TimeoutError as e:
+                if not self._store_sequence:
+                    raise StateUnavailableError(str(e)) from e
+                _logger.warning(f"{e}, serving the last snapshot read")
+                return
+            self._synced_at = time.monotonic()
+            if sequence == self._store_sequence:
+                # another thread synced in the meantime
+                return
+            if payload is not None:
+                state = pickle.loads(payload)
+                persistence = state["persistence"]
+                if self.group_by_attr and not isinstance(persistence, OrderedDict):
+                    persistence = OrderedDict(sorted(persistence.items(), key=lambda i: i[1]["timestamp"]))
+                previous_snapshot = self._snapshot
+                self._snapshot = TargetSnapshot(**{
+                    **state, "persistence": persistence, "indexes": self._build_indexes(persistence)
+                })
+                if self.events is not None:
+                    self._publish_replica_events(previous_snapshot)
+            self._store_sequence = sequence
+
+    def export_state(self) -> Dict[str, Any]:
+        """
+        State to restore this target from after a restart: the current snapshot and the history, if kept
+        """
+        snapshot = self._snapshot
+        return {
+            "group_by_attr": self.group_by_attr,
+            "passthrough": self.passthrough,
+            "snapshot": {**snapshot._asdict(), "indexes": {}},
+            "history": self.history.export_state() if self.history is not None else None
+        }
+
+    def restore_state(self, state: Dict[str, Any]) -> bool:
+        """
+        Continue from an exported state. Records keep their timestamps, so that those that aged in the meantime
+        expire as usual
+        :param state: see export_state
+        :return: False if the state is of a target configured differently, and was not restored
+        """
+        if state["group_by_attr"] != self.group_by_attr or state["passthrough"] != self.passthrough:
+            return False
+        snapshot = TargetSnapshot(**state["snapshot"])
+        with self._write_lock:
+            # the aggregates and indexes may have been configured differently
+            if self.aggregates is not None:
+                self.aggregates.rebuild(self._records(snapshot))
+            self._snapshot = snapshot._replace(
+                aggregates=self.aggregates.results() if self.aggregates is not None else {},
+                indexes=self._build_indexes(snapshot.persistence)
+            )
+            if self.history is not None and state["history"] is not None:
+                self.history.load_state(state["history"])
+        return True
+
+    def _publish_replica_events(self, previous: TargetSnapshot):
+        """
+        Derive the events of the ingest process from the difference between two snapshots
+        """
+        current = self._snapshot
+
+        def changes():
+            if not self.group_by_attr:
+                if current.persistence:
+                    return self._changes([current.persistence], [])
+                return self._changes([], [None])
+            return self._changes(
+                [
+                    record for group, record in current.persistence.items()
+                    if previous.persistence.get(group, {}).get("timestamp") != record["timestamp"]
+                ],
+                [group for group in previous.persistence if group not in current.persistence]
+            )
+
+        self._publish_event(previous.version, changes)
+
+    def _sync_history_from_store(self):
+        if self.history_store.sequence == self._history_store_sequence:
+            return
+        try:
+            sequence, payload = self.history_store.read()
+        except TimeoutError as e:
+            if not self._history_store_sequence:
+                raise StateUnavailableError(str(e)) from e
+            _logger.warning(f"{e}, serving the last history read")
+            return
+        if payload is not None:
+            self.history.load_state(pickle.loads(payload))
+        self._history_store_sequence = sequence
 
 
 class IPCQueueSource(Source):
     """
     Uses an IPC queue as an information source
     """
-    def __init__(self, name: str):
+    def __init__(self, name: str, raw: bool = False):
+        """
+        :param name:
+        :param raw: provide the messages as bytes, e.g. for an adapter with a schema or passthrough, instead of
+         unpickling them
+        """
         _logger.debug(f"Creating a new IPCQueueSource for POSIX queue with name {name}")
-        self.ipc_queue = Queue(name)
+        self.ipc_queue = Queue(name, serializer=RawSerializer if raw else PickleSerializer)
 
     def get_message(self) -> Optional[Dict[Any, Any]]:
         """
@@ -108,52 +966,381 @@ class IPCQueueSource(Source):
         except queue.Empty:
             return None
 
+    def fileno(self) -> Optional[int]:
+        """
+        On Linux a POSIX message queue descriptor is a file descriptor and can be used with select/epoll
+        :return:
+        """
+        return self.ipc_queue._queue_id
+
+    def size(self) -> Optional[int]:
+        return self.ipc_queue.qsize()
+
 
 class Lighthouse(threading.Thread):
+    # longest time the main loop sleeps without checking that the parent thread is still alive
+    IDLE_TIMEOUT_SEC = 0.5
+    # polling interval used for sources that don't provide a file descriptor
+    POLL_INTERVAL_SEC = 0.01
+    # how often a process that doesn't ingest refreshes its targets from the shared state
+    REFRESH_INTERVAL_SEC = 0.1
+    # max. number of messages moved from a single adapter before the other adapters get a turn
+    MAX_DRAIN = 100
+    # how often the state of the targets is written to snapshot_dir by default
+    SNAPSHOT_INTERVAL_SEC = 10
+
     def __init__(self, config: Dict[Any, Any]):
         self._adapters: List[Adapter] = []
+        # when set, a single process (holding the ingest lock) consumes the queues and shares its state
+        self._shared_state_dir = config.get("shared_state_dir", None)
+        self._ingest_lock: Optional[IngestLock] = None
+        if self._shared_state_dir:
+            os.makedirs(self._shared_state_dir, exist_ok=True)
+            self._ingest_lock = IngestLock(os.path.join(self._shared_state_dir, "ingest.lock"))
+        self.is_ingesting = False
+        # when set, the ingest process writes the state of every target to a file in this directory from time to
+        # time, and restores it on start
+        self._snapshot_dir = config.get("snapshot_dir", None)
+        self._snapshot_interval_sec = config.get("snapshot_interval_sec", self.SNAPSHOT_INTERVAL_SEC)
+        self._snapshot_files: List[Tuple[RESTAPITarget, SnapshotFile]] = []
+        self._snapshot_writer: Optional[threading.Thread] = None
+        self._snapshot_writer_stop = threading.Event()
+        if self._snapshot_dir:
+            os.makedirs(self._snapshot_dir, exist_ok=True)
+        self._actions: List[RESTAction] = []
+        # of the responses of the targets and actions
+        compression = config.get("compression", {})
+        self._compression = Compression(
+            min_size=compression.get("min_size", COMPRESSION_MIN_SIZE), encodings=compression.get("encodings", None)
+        )
+        for encoding in compression.get("encodings", []):
+            if encoding not in self._compression.encodings:
+                _logger.warning(f"Compression encoding {encoding} is not available, install the zstandard package")
         self._init_adapters(config.get("ipc_rest_adapters", []))
-        self._init_actions(config.get("rest_actions", []))
-        self.is_running = False
+        self._init_actions(config.get("rest_actions", []), config.get("jobs", {}))
+        # set from the start, so that a stop() called before the thread runs isn't lost
+        self.is_running = True
         self.parent_thread = threading.current_thread()
+        # written to by stop() in order to wake up the main loop
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._create_metrics_route()
         super().__init__()
 
     def _init_adapters(self, config: List[Dict[Any, Any]]):
         for adapter in config:
             # create target and an API endpoint for it
-            target = RESTAPITarget(name=adapter["rest_route"], group_by_attr=adapter.get("group_by_attrib", None))
+            history = None
+            if "history" in adapter:
+                history = History(
+                    size=adapter["history"].get("size", 360),
+                    fields=adapter["history"].get("fields"),
+                    retention_sec=adapter["history"].get("expired_retention_sec", HISTORY_EXPIRED_RETENTION_SEC),
+                    max_expired=adapter["history"].get("max_expired_groups", HISTORY_MAX_EXPIRED_GROUPS)
+                )
+            target = RESTAPITarget(
+                name=adapter["rest_route"],
+                group_by_attr=adapter.get("group_by_attrib", None),
+                aging_time_sec=adapter.get("aging_time_sec", 10),
+                history=history,
+                aggregates=Aggregates(adapter["aggregates"]) if "aggregates" in adapter else None,
+                events=EventBroadcaster() if adapter.get("stream", False) else None,
+                passthrough=adapter.get("passthrough", False),
+                indexes=adapter.get("indexes"),
+                compression=self._compression
+            )
+            if self._shared_state_dir:
+                state_path = os.path.join(self._shared_state_dir, adapter["adapter_name"])
+                target.attach_store(
+                    SharedStateStore(state_path + ".state"),
+                    SharedStateStore(state_path + ".history") if history is not None else None,
+                    SharedStateStore(state_path + ".response")
+                )
             self._create_route(target)
+            if self._snapshot_dir:
+                snapshot_path = os.path.join(self._snapshot_dir, adapter["adapter_name"] + ".snapshot")
+                self._snapshot_files.append((target, SnapshotFile(snapshot_path)))
 
-            source = IPCQueueSource(name=adapter["ipc_queue"])
-            self._adapters.append(Adapter(name=adapter["adapter_name"], source=source, target=target))
+            decoder = None
+            if "schema" in adapter:
+                decoder = Schema(
+                    name=adapter["adapter_name"],
+                    fields=adapter["schema"]["fields"],
+                    message_format=adapter["schema"].get("format", "pickle")
+                )
+            elif adapter.get("passthrough", False):
+                decoder = JSONPassthrough()
+            source = IPCQueueSource(name=adapter["ipc_queue"], raw=decoder is not None)
+            ipc_rest_adapter = Adapter(
+                name=adapter["adapter_name"],
+                source=source,
+                target=target,
+                batch_size=adapter.get("batch_size", 1),
+                batch_time_usec=adapter.get("batch_time_usec", 1000),
+                decoder=decoder
+            )
+            if self._shared_state_dir:
+                ipc_rest_adapter.metrics.attach_store(SharedStateStore(state_path + ".metrics"))
+            self._adapters.append(ipc_rest_adapter)
+
+    def _init_actions(self, config: List[Dict[Any, Any]], jobs_config: Dict[str, Any]):
+        jobs = None
+        if any(action.get("async", False) for action in config):
+            jobs = JobManager(
+                workers=jobs_config.get("workers", 4),
+                max_jobs=jobs_config.get("max_jobs", 1000),
+                max_age_sec=jobs_config.get("max_age_sec", 3600),
+                max_pending=jobs_config.get("max_pending", 100),
+                # so that any worker process can report the jobs of the others
+                directory=os.path.join(self._shared_state_dir, "jobs") if self._shared_state_dir else None
+            )
+            self._create_jobs_route(jobs, self._compression)
 
-    @staticmethod
-    def _init_actions(config: List[Dict[Any, Any]]):
         for action in config:
             rest_action = RESTAction(
                 name=action["action_name"],
                 route=action["rest_route"],
                 script_path=action["script_path"],
-                argument_list=action["argument_list"]
+                argument_list=action["argument_list"],
+                jobs=jobs if action.get("async", False) else None,
+                coalesce=action.get("coalesce", False),
+                timeout_sec=action.get("timeout_sec", None),
+                max_concurrency=action.get("max_concurrency", None),
+                max_queue=action.get("max_queue", 0),
+                max_parallel=action.get("max_parallel", None),
+                cache_ttl_sec=action.get("cache_ttl_sec", None),
+                cache_stale_sec=action.get("cache_stale_sec", None),
+                compression=self._compression
             )
             rest_action.register()  # make this rest action operational
-            # self._create_action_route(rest_action)
+            self._actions.append(rest_action)
+
+    @staticmethod
+    def _create_jobs_route(jobs: JobManager, compression: Compression):
+        def serve_job(job_id: str):
+            job = jobs.get(job_id)
+            if job is None:
+                response = make_response({"status": "application error", "description": "Unknown job"}, 404)
+            else:
+                response = make_response({"status": "OK", "response": job})
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            return compression.compress_response(response, request.headers.get("Accept-Encoding"))
+
+        app.add_url_rule("/jobs/<string:job_id>", "jobs", serve_job)
+
+    def _create_metrics_route(self):
+        if "metrics" in app.view_functions:
+            # a Lighthouse created again in the same process, e.g. in tests, reports its own metrics
+            app.view_functions["metrics"] = self.serve_metrics
+        else:
+            app.add_url_rule("/metrics", "metrics", self.serve_metrics)
 
     @staticmethod
     def _create_route(endpoint: RESTAPITarget):
         _logger.debug(f"Adding new URL rule. name:{endpoint.name}")
         app.add_url_rule(endpoint.name, endpoint.name[1:], endpoint)
+        if endpoint.history is not None:
+            app.add_url_rule(endpoint.name + "/history", endpoint.name[1:] + "_history", endpoint.serve_history)
+        if endpoint.events is not None:
+            app.add_url_rule(endpoint.name + "/stream", endpoint.name[1:] + "_stream", endpoint.serve_stream)
+        if endpoint.aggregates is not None:
+            app.add_url_rule(
+                endpoint.name + "/aggregate", endpoint.name[1:] + "_aggregate", endpoint.serve_aggregates
+            )
 
     def run(self):
-        self.is_running = True
         _logger.debug("Starting Lighthouse main loop")
-        while self.is_running and self.parent_thread.is_alive():
-            for adapter in self._adapters:
-                adapter.update()
+
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup_read, selectors.EVENT_READ)
+        polled_adapters = []
+        timeout = self.IDLE_TIMEOUT_SEC
+
+        try:
+            while self.is_running and self.parent_thread.is_alive():
+                if not self.is_ingesting:
+                    if self._ingest_lock is not None and not self._ingest_lock.try_acquire():
+                        # another process is ingesting, retry in case it exits
+                        if selector.select(self.REFRESH_INTERVAL_SEC):
+                            self._clear_wakeup()
+                        for adapter in self._adapters:
+                            adapter.target.refresh()
+                        continue
+                    polled_adapters = self._begin_ingest(selector)
+                    timeout = self.POLL_INTERVAL_SEC if polled_adapters else self.IDLE_TIMEOUT_SEC
+
+                for key, _ in selector.select(timeout):
+                    if key.data is not None:
+                        self._drain(key.data)
+                    else:
+                        self._clear_wakeup()
+                for adapter in polled_adapters:
+                    self._drain(adapter)
+                for adapter in self._adapters:
+                    adapter.target.expire()
+                    adapter.target.publish()
+                    adapter.metrics.publish()
+        finally:
+            self._shut_down(selector)
+
+    def _shut_down(self, selector: selectors.BaseSelector):
+        """
+        Clean up after the main loop, also when it died: the ingest lock is released so that another process
+        takes over ingesting
+        """
+        selector.close()
+        if self._snapshot_writer is not None:
+            self._snapshot_writer_stop.set()
+            self._snapshot_writer.join()
+            # keep what was fed since the last snapshot
+            self._write_snapshots()
+        if self._ingest_lock is not None:
+            self._ingest_lock.release()
         _logger.debug("Lighthouse main loop exiting")
 
+    def _begin_ingest(self, selector: selectors.BaseSelector) -> List[Adapter]:
+        """
+        Start consuming the sources: wait on all source descriptors together, adapters without one are polled
+        :return: the adapters that have to be polled
+        """
+        _logger.info("This process is now ingesting messages")
+        self.is_ingesting = True
+        polled_adapters = []
+        for adapter in self._adapters:
+            adapter.target.begin_ingest()
+            # continue the counters of the previous ingest process
+            adapter.metrics.sync()
+            fd = adapter.source.fileno()
+            if fd is None:
+                polled_adapters.append(adapter)
+            else:
+                selector.register(fd, selectors.EVENT_READ, adapter)
+        self._restore_snapshots()
+        if self._snapshot_files:
+            self._snapshot_writer = threading.Thread(
+                target=self._write_snapshots_periodically, name="lighthouse_snapshots", daemon=True
+            )
+            self._snapshot_writer.start()
+        return polled_adapters
+
+    def _restore_snapshots(self):
+        """
+        Restore the targets that start empty, i.e. not taking over from another ingest process, from their snapshots
+        """
+        for target, snapshot_file in self._snapshot_files:
+            # nothing to write until data is fed, an empty target must not replace an earlier snapshot
+            snapshot_file.written_version = target.version
+            if target.version != 0:
+                continue
+            state = snapshot_file.read()
+            if state is None:
+                continue
+            if target.restore_state(state):
+                snapshot_file.written_version = target.version
+                _logger.info(f"Restored {target.group_counts()[0]} records of {target.name} from {snapshot_file.path}")
+            else:
+                _logger.warning(f"Ignoring snapshot {snapshot_file.path} of a target configured differently")
+
+    def _write_snapshots_periodically(self):
+        # runs in a thread of its own, so that serializing and writing the state doesn't delay ingesting
+        while not self._snapshot_writer_stop.wait(self._snapshot_interval_sec):
+            self._write_snapshots()
+
+    def _write_snapshots(self):
+        for target, snapshot_file in self._snapshot_files:
+            if target.version == snapshot_file.written_version:
+                continue
+            state = target.export_state()
+            try:
+                snapshot_file.write(state)
+            except OSError as e:
+                _logger.warning(f"Could not write snapshot {snapshot_file.path}: {e}")
+                continue
+            snapshot_file.written_version = state["snapshot"]["version"]
+
+    def _drain(self, adapter: Adapter):
+        for _ in range(self.MAX_DRAIN):
+            try:
+                if not adapter.update():
+                    break
+            except Exception:
+                # one bad message must not stop ingesting, the messages taken from the source are lost
+                _logger.error(f"Adapter {adapter.name} failed to feed its target: {traceback.format_exc()}")
+                break
+
+    def _clear_wakeup(self):
+        # a byte left in the pipe would keep every select from waiting
+        os.read(self._wakeup_read, 4096)
+
     def stop(self):
         self.is_running = False
+        os.write(self._wakeup_write, b"\0")
+
+    def get_metrics(self) -> str:
+        """
+        Metrics of the adapters, targets, routes and actions in the Prometheus text format.
+        Route and action metrics are those of this process, adapter and target metrics those of the ingest process
+        :return:
+        """
+        writer = MetricsWriter()
+        writer.family("lighthouse_ingesting", "gauge", "1 if this process consumes the IPC queues")
+        writer.sample("lighthouse_ingesting", {}, int(self.is_ingesting))
+
+        if not self.is_ingesting:
+            for adapter in self._adapters:
+                adapter.metrics.sync()
+        writer.family("lighthouse_adapter_messages_total", "counter", "Messages fed to the target of the adapter")
+        for adapter in self._adapters:
+            writer.sample("lighthouse_adapter_messages_total", {"adapter": adapter.name}, adapter.metrics.messages)
+        writer.family("lighthouse_adapter_messages_rejected_total", "counter",
+                      "Messages dropped as they couldn't be decoded by the adapter")
+        for adapter in self._adapters:
+            writer.sample("lighthouse_adapter_messages_rejected_total", {"adapter": adapter.name},
+                          adapter.metrics.rejected)
+        writer.family("lighthouse_adapter_messages_per_second", "gauge",
+                      f"Messages fed per second over the last {IngestMetrics.RATE_WINDOW_SEC}s")
+        for adapter in self._adapters:
+            writer.sample("lighthouse_adapter_messages_per_second", {"adapter": adapter.name}, adapter.metrics.rate())
+        writer.family("lighthouse_adapter_queue_depth", "gauge", "Messages waiting in the IPC queue of the adapter")
+        for adapter in self._adapters:
+            depth = adapter.source.size()
+            if depth is not None:
+                writer.sample("lighthouse_adapter_queue_depth", {"adapter": adapter.name}, depth)
+        writer.family("lighthouse_adapter_feed_latency_seconds", "histogram",
+                      "Time from taking a message (batch) off the queue to it being served")
+        for adapter in self._adapters:
+            writer.histogram("lighthouse_adapter_feed_latency_seconds", {"adapter": adapter.name},
+                             adapter.metrics.feed_latency)
+
+        counts = {
+            adapter.target.container_name: adapter.target.group_counts()
+            for adapter in self._adapters if isinstance(adapter.target, RESTAPITarget)
+        }
+        writer.family("lighthouse_target_live_groups", "gauge", "Groups currently held by the target")
+        for target, (live, _) in counts.items():
+            writer.sample("lighthouse_target_live_groups", {"target": target}, live)
+        writer.family("lighthouse_target_expired_groups_total", "counter", "Groups that expired from the target")
+        for target, (_, expired) in counts.items():
+            writer.sample("lighthouse_target_expired_groups_total", {"target": target}, expired)
+
+        writer.family("lighthouse_http_request_duration_seconds", "histogram", "Time to answer a request")
+        for (route, method, status), histogram in route_metrics.items():
+            writer.histogram("lighthouse_http_request_duration_seconds",
+                             {"route": route, "method": method, "status": status}, histogram)
+
+        writer.family("lighthouse_action_duration_seconds", "histogram", "Execution time of the script of the action")
+        for action in self._actions:
+            writer.histogram("lighthouse_action_duration_seconds", {"action": action.name}, action.metrics.duration)
+        writer.family("lighthouse_action_failures_total", "counter", "Failed calls of the action, by reason")
+        for action in self._actions:
+            for reason, count in action.metrics.failures.items():
+                writer.sample("lighthouse_action_failures_total", {"action": action.name, "reason": reason}, count)
+        return writer.text()
+
+    def serve_metrics(self):
+        """
+        Called by Flask for /metrics
+        """
+        return Response(self.get_metrics(), content_type=MetricsWriter.CONTENT_TYPE)
 
 
 class RESTAction:
@@ -161,12 +1348,56 @@ class RESTAction:
     Represents a REST API call that performes some action by calling a python script stored somewhere
     with the given list of parameters. This object is responsible for registering the rest endpoint
     and invoking the actual action via the __call__ method.
+
+    The script is imported once, when the action is registered, and imported again whenever its
+    modification time changes, so that scripts can be updated without restarting Lighthouse
     """
-    def __init__(self, name: str, route: str, script_path: str, argument_list: List[Dict]):
+    # how often the scripts of all registered actions are checked for changes
+    SCRIPT_CHECK_INTERVAL_SEC = 2.0
+    # time given to a script past its timeout to kill its commands and report it itself
+    TIMEOUT_GRACE_SEC = 1.0
+    # threads running the scripts of actions with a timeout but no concurrency limit
+    DEFAULT_TIMEOUT_WORKERS = 32
+    _registered: List["RESTAction"] = []
+    _watcher: Optional[threading.Thread] = None
+
+    def __init__(self, name: str, route: str, script_path: str, argument_list: List[Dict],
+                 jobs: Optional[JobManager] = None, coalesce: bool = False, timeout_sec: Optional[float] = None,
+                 max_concurrency: Optional[int] = None, max_queue: int = 0,
+                 compression: Optional[Compression] = None, max_parallel: Optional[int] = None,
+                 cache_ttl_sec: Optional[float] = None, cache_stale_sec: Optional[float] = None):
         self.name = name
         self.route = route
         self.script_path = script_path
         self.argument_list = argument_list
+        # when set, the script runs as a background job and calls return the id of the job right away
+        self.jobs = jobs
+        # when coalescing, concurrent calls with the same arguments share a single run of the script
+        self._in_flight: Optional[SingleFlight] = SingleFlight() if coalesce else None
+        # scripts learn their deadline through lighthouse.deadline.time_left() and should kill their commands by then
+        self.timeout_sec = timeout_sec
+        # settings of the script, passed to main() as keyword arguments: max_parallel for scripts acting on many
+        # targets at once (e.g. bulk_power), cache_ttl_sec and cache_stale_sec for scripts caching what they load
+        # (e.g. user_list)
+        self.script_options = {
+            key: value for key, value in [
+                ("max_parallel", max_parallel), ("cache_ttl_sec", cache_ttl_sec), ("cache_stale_sec", cache_stale_sec)
+            ] if value is not None
+        }
+        self._limit: Optional[ConcurrencyLimit] = ConcurrencyLimit(max_concurrency, max_queue) \
+            if max_concurrency else None
+        # runs the scripts of calls with a timeout, so that a call can return while its script is still running
+        self._timeout_executor: Optional[ThreadPoolExecutor] = None
+        if timeout_sec is not None:
+            self._timeout_executor = ThreadPoolExecutor(
+                max_workers=max_concurrency or self.DEFAULT_TIMEOUT_WORKERS, thread_name_prefix=f"action_{name}"
+            )
+        self.module_name = os.path.basename(self.script_path[:-3])  # remove .py suffix
+        # main() of the loaded script, None until it was loaded successfully
+        self._main: Optional[Callable] = None
+        self._loaded_mtime: Optional[float] = None
+        self.metrics = ActionMetrics()
+        self.compression = compression or Compression()
         self._append_arguments_to_url()
         self._register_exception_handlers()
 
@@ -175,14 +1406,10 @@ class RESTAction:
         Called by Flask. Does what this action is expected to do i.e.
         invoke the required script, with the given argument, and provide the appropriate response
         """
-        # try:
-        # get directory path of script, add to sys.path
-        script_home = os.path.dirname(self.script_path)
-        sys.path.insert(0, script_home)
-
-        # import module
-        module_name = os.path.basename(self.script_path[:-3])  # remove .py suffix
-        module = importlib.import_module(module_name)
+        main = self._main
+        if main is None:
+            # the script couldn't be loaded at startup, e.g. it didn't exist yet. Raises if it still can't
+            main = self.load()
 
         arguments = []
         for k, v in kwargs.items():
@@ -190,10 +1417,28 @@ class RESTAction:
                 arguments.append(v)
             else:
                 raise ValueError(f"Unexpected argument provided: {k} with value: {v}")
-        # run module.main() with args
 
-        _logger.debug(msg=f"Invoking main method of module in path: {script_home}/{module_name}, with arguments: {arguments}")
-        result = module.main(*arguments)
+        if self.script_options:
+            main = functools.partial(main, **self.script_options)
+        main = functools.partial(self._execute_measured, main)
+        if self._limit is not None or self.timeout_sec is not None:
+            main = functools.partial(self._execute_limited, main)
+        if self._in_flight is not None:
+            main = functools.partial(self._execute_once, main)
+
+        if self.jobs is not None:
+            job = self.jobs.submit(self.name, main, arguments)
+            response = make_response({
+                "status": "accepted",
+                "job_id": job["id"],
+                "url": f"/jobs/{job['id']}"
+            }, 202)
+            response.headers["Location"] = f"/jobs/{job['id']}"
+            response.headers["Access-Control-Allow-Origin"] = "*"
+            return response
+
+        _logger.debug(msg=f"Invoking main method of {self.script_path}, with arguments: {arguments}")
+        result = main(*arguments)
         _logger.debug(msg=f"Result: {result}")
 
         response = {
@@ -203,12 +1448,94 @@ class RESTAction:
         response = make_response(response)
         response.headers["Access-Control-Allow-Origin"] = "*"
 
-        return response
+        return self.compression.compress_response(response, request.headers.get("Accept-Encoding"))
+
+    def _execute_measured(self, main: Callable, *arguments):
+        """
+        run main, recording its execution time and whether it failed
+        """
+        started = time.perf_counter()
+        try:
+            result = main(*arguments)
+        except Exception:
+            self.metrics.failed("error")
+            raise
+        finally:
+            self.metrics.duration.observe(time.perf_counter() - started)
+        if isinstance(result, dict) and result.get("result") == "failed":
+            self.metrics.failed("failed")
+        return result
+
+    def _execute_once(self, main: Callable, *arguments):
+        """
+        run main, unless it is already running with the same arguments, in which case wait for its result
+        """
+        return self._in_flight.do(tuple(arguments), lambda: main(*arguments))
+
+    def _execute_limited(self, main: Callable, *arguments):
+        """
+        run main within the concurrency limit and the timeout of this action
+        """
+        if self._limit is not None:
+            try:
+                self._limit.acquire(timeout=self.timeout_sec)
+            except (ActionBusyError, ActionQueueTimeoutError):
+                self.metrics.failed("rejected")
+                raise
+        if self.timeout_sec is None:
+            try:
+                return main(*arguments)
+            finally:
+                self._limit.release()
+
+        deadline = time.monotonic() + self.timeout_sec
+        future = self._timeout_executor.submit(call_with_deadline, deadline, main, *arguments)
+        if self._limit is not None:
+            # the slot is held until the script returned, even if the call timed out before
+            future.add_done_callback(lambda _: self._limit.release())
+        try:
+            return future.result(timeout=self.timeout_sec + self.TIMEOUT_GRACE_SEC)
+        except FutureTimeoutError:
+            _logger.error(f"Action {self.name} with arguments {arguments} timed out after {self.timeout_sec}s")
+            self.metrics.failed("timeout")
+            raise ActionTimeoutError(self.timeout_sec)
 
     def _register_exception_handlers(self):
         app.register_error_handler(ModuleNotFoundError, self._handle_module_not_found_error)
         app.register_error_handler(AttributeError, self._handle_module_does_comply_with_expected_format)
         app.register_error_handler(ValueError, self._handle_unexpected_argument_provided)
+        app.register_error_handler(ActionBusyError, self._handle_action_busy)
+        app.register_error_handler(ActionQueueTimeoutError, self._handle_action_queue_timeout)
+        app.register_error_handler(ActionTimeoutError, self._handle_action_timeout)
+        app.register_error_handler(JobsBusyError, self._handle_jobs_busy)
+
+    @staticmethod
+    def _handle_action_busy(e):
+        return {
+            "status": "busy",
+            "description": "This action is already running as often as allowed, retry later"
+        }, 429, {"Retry-After": "1", "Access-Control-Allow-Origin": "*"}
+
+    @staticmethod
+    def _handle_action_queue_timeout(e):
+        return {
+            "status": "busy",
+            "description": "This action did not get its turn in time, retry later"
+        }, 503, {"Retry-After": "1", "Access-Control-Allow-Origin": "*"}
+
+    @staticmethod
+    def _handle_jobs_busy(e):
+        return {
+            "status": "busy",
+            "description": "Too many jobs are queued or running, retry later"
+        }, 503, {"Retry-After": "1", "Access-Control-Allow-Origin": "*"}
+
+    @staticmethod
+    def _handle_action_timeout(e):
+        return {
+            "status": "timeout",
+            "description": f"This action did not finish within {e.args[0]}s"
+        }, 504, {"Access-Control-Allow-Origin": "*"}
 
     @staticmethod
     def _handle_module_not_found_error(e):
@@ -235,12 +1562,76 @@ class RESTAction:
         for arg in self.argument_list:
             self.route += "/<" + arg["type"] + ":" + arg["name"] + ">"
 
+    def load(self) -> Callable:
+        """
+        Import the script and check that its main() can be called with the arguments of this action
+        :return: main() of the script
+        :raise ModuleNotFoundError: if the script can't be imported
+        :raise AttributeError: if the script has no main() taking the arguments of this action
+        """
+        try:
+            mtime = os.stat(self.script_path).st_mtime
+            spec = importlib.util.spec_from_file_location(self.module_name, self.script_path)
+            module = importlib.util.module_from_spec(spec)
+            # scripts may import modules next to them
+            script_home = os.path.dirname(self.script_path)
+            if script_home not in sys.path:
+                sys.path.insert(0, script_home)
+            spec.loader.exec_module(module)
+        except Exception as e:
+            # includes errors raised by the script itself, e.g. a syntax error after it was edited
+            raise ModuleNotFoundError(f"Could not import {self.script_path}: {e}") from e
+
+        main = getattr(module, "main")
+        try:
+            inspect.signature(main).bind(*self.argument_list, **self.script_options)
+        except TypeError as e:
+            raise AttributeError(f"main() of {self.script_path} does not take the arguments of {self.name}") from e
+
+        sys.modules[self.module_name] = module
+        self._main, self._loaded_mtime = main, mtime
+        _logger.info(f"Loaded {self.script_path} for action {self.name}")
+        return main
+
+    def reload_if_changed(self):
+        """
+        Load the script again if it was modified since it was loaded. If the new version can't be loaded,
+        the previous one is kept
+        """
+        try:
+            mtime = os.stat(self.script_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        try:
+            self.load()
+        except (ModuleNotFoundError, AttributeError) as e:
+            _logger.error(f"Failed to reload action {self.name}: {e}")
+            self._loaded_mtime = mtime
+
+    @classmethod
+    def _watch_scripts(cls):
+        while True:
+            time.sleep(cls.SCRIPT_CHECK_INTERVAL_SEC)
+            for action in list(cls._registered):
+                action.reload_if_changed()
+
     def register(self):
         """
-        makes this REST action operational by registering its URL + arguments with Flask, as well as setting
-        __call__ as the called method on this endpoint
+        makes this REST action operational by loading its script, registering its URL + arguments with Flask,
+        as well as setting __call__ as the called method on this endpoint
         """
+        try:
+            self.load()
+        except (ModuleNotFoundError, AttributeError) as e:
+            # keep serving the other routes, calls of this action fail until the script can be loaded
+            _logger.error(f"Failed to load action {self.name}: {e}")
         self._register_endpoint()
+        RESTAction._registered.append(self)
+        if RESTAction._watcher is None:
+            RESTAction._watcher = threading.Thread(target=RESTAction._watch_scripts, daemon=True)
+            RESTAction._watcher.start()
 
     def _register_endpoint(self):
         app.add_url_rule(rule=self.route, endpoint=self.name, view_func=self)
@@ -268,6 +1659,25 @@ class LighthouseFactory:
         if config["log_level"] not in ["DEBUG", "INFO", "WARNING", "ERROR"]:
             raise ConfigFileInvalidError("unknown log level in config file")
 
+        if "shared_state_dir" in config.keys() and not isinstance(config["shared_state_dir"], str):
+            raise ConfigFileInvalidError("shared_state_dir expected to be a path")
+        if "snapshot_dir" in config.keys() and not isinstance(config["snapshot_dir"], str):
+            raise ConfigFileInvalidError("snapshot_dir expected to be a path")
+        if "snapshot_interval_sec" in config.keys():
+            interval = config["snapshot_interval_sec"]
+            if not isinstance(interval, (int, float)) or isinstance(interval, bool) or interval <= 0:
+                raise ConfigFileInvalidError("snapshot_interval_sec expected to be a positive number")
+        if "compression" in config.keys():
+            compression = config["compression"]
+            if not isinstance(compression, dict):
+                raise ConfigFileInvalidError("compression expected to be a dictionary")
+            min_size = compression.get("min_size", COMPRESSION_MIN_SIZE)
+            if not isinstance(min_size, int) or isinstance(min_size, bool) or min_size < 0:
+                raise ConfigFileInvalidError("compression min_size expected to be a non-negative integer")
+            encodings = compression.get("encodings", COMPRESSION_ENCODINGS)
+            if not isinstance(encodings, list) or any(e not in COMPRESSION_ENCODINGS for e in encodings):
+                raise ConfigFileInvalidError(f"compression encodings expected to be a list of {COMPRESSION_ENCODINGS}")
+
         if "ipc_rest_adapters" in config.keys():
             adapters = config["ipc_rest_adapters"]
             if not isinstance(adapters, list):
@@ -280,6 +1690,79 @@ class LighthouseFactory:
                     raise ConfigFileInvalidError(f"ipc_queue missing in adapter: {adapter['adapter_name']}")
                 if "rest_route" not in adapter.keys():
                     raise ConfigFileInvalidError(f"rest_route missing in adapter: {adapter['adapter_name']}")
+                for key in ["batch_size", "batch_time_usec"]:
+                    if key in adapter.keys() and (not isinstance(adapter[key], int) or adapter[key] < 1):
+                        raise ConfigFileInvalidError(
+                            f"{key} expected to be a positive integer in adapter: {adapter['adapter_name']}"
+                        )
+                if "history" in adapter.keys():
+                    history = adapter["history"]
+                    if not isinstance(history, dict):
+                        raise ConfigFileInvalidError(
+                            f"history expected to be a dictionary in adapter: {adapter['adapter_name']}"
+                        )
+                    if not isinstance(history.get("size", 360), int) or history.get("size", 360) < 1:
+                        raise ConfigFileInvalidError(
+                            f"history size expected to be a positive integer in adapter: {adapter['adapter_name']}"
+                        )
+                    if not isinstance(history.get("fields", []), list):
+                        raise ConfigFileInvalidError(
+                            f"history fields expected to be a list in adapter: {adapter['adapter_name']}"
+                        )
+                    retention = history.get("expired_retention_sec", HISTORY_EXPIRED_RETENTION_SEC)
+                    if not isinstance(retention, (int, float)) or isinstance(retention, bool) or retention < 0:
+                        raise ConfigFileInvalidError(
+                            f"history expired_retention_sec expected to be a non-negative number in adapter: "
+                            f"{adapter['adapter_name']}"
+                        )
+                    max_expired = history.get("max_expired_groups", HISTORY_MAX_EXPIRED_GROUPS)
+                    if not isinstance(max_expired, int) or isinstance(max_expired, bool) or max_expired < 0:
+                        raise ConfigFileInvalidError(
+                            f"history max_expired_groups expected to be a non-negative integer in adapter: "
+                            f"{adapter['adapter_name']}"
+                        )
+                if "aggregates" in adapter.keys():
+                    if not isinstance(adapter["aggregates"], list):
+                        raise ConfigFileInvalidError(
+                            f"aggregates expected to be a list in adapter: {adapter['adapter_name']}"
+                        )
+                    for aggregate in adapter["aggregates"]:
+                        if "name" not in aggregate.keys():
+                            raise ConfigFileInvalidError(f"name missing in aggregate of: {adapter['adapter_name']}")
+                        if aggregate.get("function") not in AGGREGATE_FUNCTIONS:
+                            raise ConfigFileInvalidError(
+                                f"unknown function in aggregate {aggregate['name']}, "
+                                f"expected one of {AGGREGATE_FUNCTIONS}"
+                            )
+                        if aggregate["function"] != "count" and "field" not in aggregate.keys():
+                            raise ConfigFileInvalidError(f"field missing in aggregate {aggregate['name']}")
+                if "schema" in adapter.keys():
+                    LighthouseFactory._validate_schema(adapter)
+                if "indexes" in adapter.keys():
+                    if not isinstance(adapter["indexes"], list) \
+                            or not all(isinstance(field, str) for field in adapter["indexes"]):
+                        raise ConfigFileInvalidError(
+                            f"indexes expected to be a list of fields in adapter: {adapter['adapter_name']}"
+                        )
+                    if "group_by_attrib" not in adapter.keys():
+                        raise ConfigFileInvalidError(
+                            f"indexes need group_by_attrib in adapter: {adapter['adapter_name']}"
+                        )
+                if "passthrough" in adapter.keys():
+                    if not isinstance(adapter["passthrough"], bool):
+                        raise ConfigFileInvalidError(
+                            f"passthrough expected to be a boolean in adapter: {adapter['adapter_name']}"
+                        )
+                    if adapter["passthrough"] and "schema" in adapter.keys():
+                        raise ConfigFileInvalidError(
+                            f"passthrough and schema are exclusive in adapter: {adapter['adapter_name']}"
+                        )
+                if "aging_time_sec" in adapter.keys():
+                    aging_time_sec = adapter["aging_time_sec"]
+                    if not isinstance(aging_time_sec, (int, float)) or aging_time_sec <= 0:
+                        raise ConfigFileInvalidError(
+                            f"aging_time_sec expected to be a positive number in adapter: {adapter['adapter_name']}"
+                        )
 
         if "rest_actions" in config.keys():
             actions = config["rest_actions"]
@@ -297,8 +1780,74 @@ class LighthouseFactory:
                     raise ConfigFileInvalidError(
                         f"argument_list expected to be list, instead: {type(action['argument_list'])}"
                     )
+                for key in ["async", "coalesce"]:
+                    if not isinstance(action.get(key, False), bool):
+                        raise ConfigFileInvalidError(
+                            f"{key} expected to be a boolean in action: {action['action_name']}"
+                        )
+                timeout_sec = action.get("timeout_sec", 1)
+                if not isinstance(timeout_sec, (int, float)) or isinstance(timeout_sec, bool) or timeout_sec <= 0:
+                    raise ConfigFileInvalidError(
+                        f"timeout_sec expected to be a positive number in action: {action['action_name']}"
+                    )
+                if not isinstance(action.get("max_concurrency", 1), int) or action.get("max_concurrency", 1) < 1:
+                    raise ConfigFileInvalidError(
+                        f"max_concurrency expected to be a positive integer in action: {action['action_name']}"
+                    )
+                if not isinstance(action.get("max_queue", 0), int) or action.get("max_queue", 0) < 0:
+                    raise ConfigFileInvalidError(
+                        f"max_queue expected to be a non-negative integer in action: {action['action_name']}"
+                    )
+                max_parallel = action.get("max_parallel", 1)
+                if not isinstance(max_parallel, int) or isinstance(max_parallel, bool) or max_parallel < 1:
+                    raise ConfigFileInvalidError(
+                        f"max_parallel expected to be a positive integer in action: {action['action_name']}"
+                    )
+                for key in ["cache_ttl_sec", "cache_stale_sec"]:
+                    value = action.get(key, 0)
+                    if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                        raise ConfigFileInvalidError(
+                            f"{key} expected to be a non-negative number in action: {action['action_name']}"
+                        )
+
+        if "jobs" in config.keys():
+            jobs = config["jobs"]
+            if not isinstance(jobs, dict):
+                raise ConfigFileInvalidError("jobs expected to be a dictionary")
+            for key in ["workers", "max_jobs", "max_age_sec", "max_pending"]:
+                if key in jobs.keys() and (not isinstance(jobs[key], int) or jobs[key] < 1):
+                    raise ConfigFileInvalidError(f"jobs {key} expected to be a positive integer")
+
+    @staticmethod
+    def _validate_schema(adapter: Dict[str, Any]):
+        schema = adapter["schema"]
+        name = adapter["adapter_name"]
+        if not isinstance(schema, dict) or not isinstance(schema.get("fields"), list) or not schema["fields"]:
+            raise ConfigFileInvalidError(f"schema expected to be a dictionary with a list of fields in adapter: {name}")
+        if schema.get("format", "pickle") not in SCHEMA_FORMATS:
+            raise ConfigFileInvalidError(f"unknown schema format in adapter: {name}, expected one of {SCHEMA_FORMATS}")
+        names = []
+        for field in schema["fields"]:
+            if not isinstance(field, dict) or not str(field.get("name", "")).isidentifier() \
+                    or keyword.iskeyword(field["name"]):
+                raise ConfigFileInvalidError(f"schema field without a valid name in adapter: {name}")
+            if field["name"] in names or field["name"] in SCHEMA_RESERVED_NAMES:
+                raise ConfigFileInvalidError(f"schema field {field['name']} declared twice or reserved in: {name}")
+            names.append(field["name"])
+            if field.get("type") not in SCHEMA_TYPES:
+                raise ConfigFileInvalidError(
+                    f"unknown type of schema field {field['name']}, expected one of {list(SCHEMA_TYPES)}"
+                )
+            size = field.get("size")
+            if schema.get("format") == "struct" and field["type"] == "str" \
+                    and (not isinstance(size, int) or isinstance(size, bool) or size < 1):
+                raise ConfigFileInvalidError(f"size of str field {field['name']} expected to be a positive integer")
+        if adapter.get("group_by_attrib", names[0]) not in names:
+            raise ConfigFileInvalidError(f"group_by_attrib is not a field of the schema of adapter: {name}")
 
 
 factory = LighthouseFactory()
-lh = factory.create_from_config_file(str(pathlib.Path(__file__).parent) + "/config.json")
+lh = factory.create_from_config_file(
+    os.environ.get("LIGHTHOUSE_CONFIG", str(pathlib.Path(__file__).parent) + "/config.json")
+)
 lh.start()
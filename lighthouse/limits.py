@@ -0,0 +1,58 @@
+import threading
+
+
+class ActionBusyError(Exception):
+    """
+    Raised when an action already runs as often as allowed and its queue is full
+    """
+    pass
+
+
+class ActionQueueTimeoutError(Exception):
+    """
+    Raised when a call waited for a free slot for longer than allowed
+    """
+    pass
+
+
+class ActionTimeoutError(Exception):
+    """
+    Raised when a call did not finish in time
+    """
+    pass
+
+
+class ConcurrencyLimit:
+    """
+    At most max_concurrency holders at a time, and at most max_queue callers waiting for their turn.
+    Callers beyond that are rejected at once rather than piling up
+    """
+    def __init__(self, max_concurrency: int, max_queue: int = 0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: float = None):
+        """
+        :param timeout: max. time to wait in the queue, forever if None
+        :raise ActionBusyError: if the queue is full
+        :raise ActionQueueTimeoutError: if no slot was free in time
+        """
+        with self._condition:
+            if self.running >= self.max_concurrency:
+                if self.waiting >= self.max_queue:
+                    raise ActionBusyError()
+                self.waiting += 1
+                try:
+                    if not self._condition.wait_for(lambda: self.running < self.max_concurrency, timeout):
+                        raise ActionQueueTimeoutError()
+                finally:
+                    self.waiting -= 1
+            self.running += 1
+
+    def release(self):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
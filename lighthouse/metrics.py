@@ -0,0 +1,219 @@
+import bisect
+import pickle
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from lighthouse.shared_state import SharedStateStore
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """
+    Number of observed values per bucket and their sum, in the layout of a Prometheus histogram.
+    Counts are per bucket here and only made cumulative when rendered, so that observing is a single increment
+    """
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # one more for the values above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def export_state(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+    def load_state(self, state: Tuple[List[int], float]):
+        counts, total = state
+        if len(counts) == len(self.counts):
+            with self._lock:
+                self.counts, self.sum = list(counts), total
+
+
+class IngestMetrics:
+    """
+    Messages moved from the source to the target of an adapter. Only the ingest thread records, so the message
+    counter is a plain integer. Other processes get a copy through a shared state store
+    """
+    # the rate is the number of messages fed over this many seconds
+    RATE_WINDOW_SEC = 10
+    # how often the ingest process shares the metrics, at most
+    PUBLISH_INTERVAL_SEC = 1.0
+
+    def __init__(self):
+        self.messages = 0
+        # messages dropped as they didn't match the schema of the adapter
+        self.rejected = 0
+        # time from taking the first message of a batch off the queue to the batch being visible to readers
+        self.feed_latency = Histogram()
+        # (second, messages at the end of that second) of the recent seconds in which messages were fed
+        self._totals: deque = deque(maxlen=64)
+        self.store: Optional[SharedStateStore] = None
+        self._store_sequence = 0
+        self._published_messages = 0
+        self._published_at = 0.0
+
+    def record(self, messages: int, duration_sec: float, now: Optional[float] = None):
+        """
+        :param messages: number of messages fed at once
+        :param duration_sec: feed latency of these messages
+        :param now:
+        """
+        self.messages += messages
+        self.feed_latency.observe(duration_sec)
+        second = int(time.time() if now is None else now)
+        if self._totals and self._totals[-1][0] == second:
+            self._totals[-1] = (second, self.messages)
+        else:
+            self._totals.append((second, self.messages))
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """
+        messages per second over the last RATE_WINDOW_SEC seconds
+        """
+        start = (time.time() if now is None else now) - self.RATE_WINDOW_SEC
+        # copying a deque doesn't release the GIL, so this is consistent even while the ingest thread records
+        totals = list(self._totals)
+        before = 0
+        for second, messages in reversed(totals):
+            if second + 1 <= start:
+                before = messages
+                break
+        return ((totals[-1][1] if totals else 0) - before) / self.RATE_WINDOW_SEC
+
+    def export_state(self) -> tuple:
+        return self.messages, list(self._totals), self.feed_latency.export_state(), self.rejected
+
+    def load_state(self, state: tuple):
+        messages, totals, feed_latency, rejected = state
+        self._totals = deque(totals, maxlen=self._totals.maxlen)
+        self.messages, self.rejected = messages, rejected
+        self.feed_latency.load_state(feed_latency)
+
+    def attach_store(self, store: SharedStateStore):
+        self.store = store
+
+    def publish(self):
+        """
+        share the metrics recorded by the ingest process, if they changed
+        """
+        now = time.monotonic()
+        if self.store is None or self.messages + self.rejected == self._published_messages \
+                or now - self._published_at < self.PUBLISH_INTERVAL_SEC:
+            return
+        self.store.publish(pickle.dumps(self.export_state(), protocol=pickle.HIGHEST_PROTOCOL))
+        self._published_messages = self.messages + self.rejected
+        self._published_at = now
+
+    def sync(self):
+        """
+        load the metrics published by the ingest process, in the other processes
+        """
+        if self.store is None or self.store.sequence == self._store_sequence:
+            return
+        sequence, payload = self.store.read()
+        if payload is not None:
+            self.load_state(pickle.loads(payload))
+        self._store_sequence = sequence
+
+
+class RouteMetrics:
+    """
+    Latency of the requests answered by this process, per route, method and status
+    """
+    def __init__(self):
+        self._latency: Dict[Tuple[str, str, int], Histogram] = {}
+        # only taken the first time a route, method and status is seen
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, method: str, status: int, duration_sec: float):
+        key = (route, method, status)
+        histogram = self._latency.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._latency.setdefault(key, Histogram())
+        histogram.observe(duration_sec)
+
+    def items(self) -> List[Tuple[Tuple[str, str, int], Histogram]]:
+        with self._lock:
+            return list(self._latency.items())
+
+
+class ActionMetrics:
+    """
+    Execution time of the script of an action and number of failed calls, per reason:
+    error - the script raised, failed - the script reported a failure, timeout, rejected - busy action
+    """
+    FAILURE_REASONS = ("error", "failed", "timeout", "rejected")
+
+    def __init__(self):
+        self.duration = Histogram()
+        self.failures: Dict[str, int] = {reason: 0 for reason in self.FAILURE_REASONS}
+        self._lock = threading.Lock()
+
+    def failed(self, reason: str):
+        with self._lock:
+            self.failures[reason] += 1
+
+
+class MetricsWriter:
+    """
+    Builds a page in the Prometheus text exposition format
+    """
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    def family(self, name: str, kind: str, description: str):
+        """
+        start a metric, its samples follow
+        :param name:
+        :param kind: counter, gauge or histogram
+        :param description:
+        """
+        self._lines.append(f"# HELP {name} {description}")
+        self._lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, labels: Dict[str, Any], value: float):
+        self._lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def histogram(self, name: str, labels: Dict[str, Any], histogram: Histogram):
+        counts, total = histogram.export_state()
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), counts):
+            cumulative += count
+            self.sample(name + "_bucket", {**labels, "le": _format_value(bound)}, cumulative)
+        self.sample(name + "_sum", labels, total)
+        self.sample(name + "_count", labels, cumulative)
+
+    def text(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,55 @@
+import json
+from typing import Any
+
+from lighthouse.schema import MessageRejectedError
+
+
+class EncodedRecord(dict):
+    """
+    A message received as a JSON object: read like any other record, and kept as the JSON text it was received
+    as, so that responses can be built by joining the texts of the records instead of encoding the records again
+    """
+    __slots__ = ("encoded",)
+
+    def __init__(self, data: dict, encoded: bytes):
+        super().__init__(data)
+        self.encoded = encoded
+
+    def stamp(self, timestamp: float):
+        """
+        Set the timestamp, in the fields and at the end of the JSON text. Called once, when fed to a target
+        """
+        separator = b"," if self else b""
+        self["timestamp"] = timestamp
+        self.encoded = self.encoded[:-1] + separator + b'"timestamp":' + repr(timestamp).encode("ascii") + b"}"
+
+
+class JSONPassthrough:
+    """
+    Decodes the messages of a passthrough adapter: JSON objects, UTF-8 encoded, sent as raw bytes on the queue
+    """
+    @staticmethod
+    def decode(message: bytes) -> EncodedRecord:
+        """
+        :param message:
+        :return: the record
+        :raise MessageRejectedError: if the message isn't a UTF-8 encoded JSON object
+        """
+        try:
+            # strictly UTF-8: json.loads would also accept other encodings of bytes, whose text can't be served as is
+            text = message.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise MessageRejectedError(f"Expected UTF-8: {e}")
+        if text.startswith("\ufeff"):
+            raise MessageRejectedError("Expected UTF-8 without a byte order mark")
+        try:
+            data: Any = json.loads(text)
+        except ValueError as e:
+            raise MessageRejectedError(f"Could not decode JSON message: {e}")
+        if not isinstance(data, dict):
+            raise MessageRejectedError("Expected a JSON object")
+        if "timestamp" in data:
+            # replaced on feed, re-encoded so that the text doesn't hold it twice
+            del data["timestamp"]
+            return EncodedRecord(data, json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        return EncodedRecord(data, message.rstrip())
@@ -0,0 +1,239 @@
+import bisect
+import math
+from typing import Dict, Any, List, Optional, Tuple, NamedTuple, Iterable, Mapping
+
+# query parameters with these suffixes select the records whose field is greater or less than the value
+RANGE_SUFFIXES = ["_gt", "_lt"]
+# query parameters that aren't filters. "_" is the cache buster some HTTP clients (e.g. jQuery) append to every
+# request, it would otherwise empty the response and take a place in the query cache
+RESERVED_PARAMETERS = ["since", "fields", "_"]
+
+_MISSING = object()
+
+# (group, record replaced or removed, record added) for every change of the records of a target
+Change = Tuple[Any, Optional[Mapping[str, Any]], Optional[Mapping[str, Any]]]
+
+
+class QueryError(ValueError):
+    """
+    Raised for query parameters that can't be applied, e.g. a range filter on something that isn't a number
+    """
+    pass
+
+
+def _is_nan(value: Any) -> bool:
+    # NaN isn't equal to itself, it couldn't be found in the index nor removed from it
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and not _is_nan(value)
+
+
+def _candidates(text: str) -> Tuple[Any, ...]:
+    """
+    the values a query parameter may stand for: the string itself, and the number or boolean it spells
+    """
+    candidates = [text]
+    for convert in [int, float]:
+        try:
+            candidates.append(convert(text))
+        except ValueError:
+            pass
+    if text in ["true", "false"]:
+        candidates.append(text == "true")
+    return tuple(candidates)
+
+
+class FieldIndex:
+    """
+    Groups of a target by the value of one of their fields, for the filters of queries: by value for equality,
+    and sorted by value for the ranges of numeric fields.
+
+    Copy-on-write like the snapshots it is part of: updated() returns a new index, the old one stays valid for
+    the readers still using it
+    """
+    def __init__(self, field: str):
+        self.field = field
+        # groups by value, in the order they were fed like the records of the snapshot
+        self._groups_by_value: Dict[Any, Dict[Any, None]] = {}
+        # numeric values in ascending order, and their groups
+        self._numbers: List[float] = []
+        self._number_groups: List[Any] = []
+
+    @classmethod
+    def build(cls, field: str, records: Iterable[Tuple[Any, Mapping[str, Any]]]) -> "FieldIndex":
+        """
+        :param field:
+        :param records: (group, record) in the order they were fed
+        :return:
+        """
+        return cls(field).updated([(group, None, record) for group, record in records])
+
+    def updated(self, changes: List[Change]) -> "FieldIndex":
+        """
+        :param changes: in the order they were made
+        :return: a new index with the changes applied
+        """
+        index = FieldIndex(self.field)
+        index._groups_by_value = dict(self._groups_by_value)
+        index._numbers = list(self._numbers)
+        index._number_groups = list(self._number_groups)
+        # the group dicts shared with this index are copied before their first change
+        copied = set()
+        for group, removed, added in changes:
+            if removed is not None:
+                index._remove(group, removed.get(self.field, _MISSING), copied)
+            if added is not None:
+                index._add(group, added.get(self.field, _MISSING), copied)
+        return index
+
+    def _groups_of(self, value: Any, copied: set) -> Dict[Any, None]:
+        groups = self._groups_by_value.get(value)
+        if groups is None or value not in copied:
+            groups = self._groups_by_value[value] = dict(groups or {})
+            copied.add(value)
+        return groups
+
+    def _add(self, group: Any, value: Any, copied: set):
+        if value is _MISSING or _is_nan(value):
+            return
+        try:
+            self._groups_of(value, copied)[group] = None
+        except TypeError:
+            # unhashable, e.g. a list: only found by scanning
+            return
+        if _is_number(value):
+            i = bisect.bisect_right(self._numbers, value)
+            self._numbers.insert(i, value)
+            self._number_groups.insert(i, group)
+
+    def _remove(self, group: Any, value: Any, copied: set):
+        if value is _MISSING or _is_nan(value):
+            return
+        try:
+            groups = self._groups_of(value, copied)
+        except TypeError:
+            return
+        groups.pop(group, None)
+        if not groups:
+            del self._groups_by_value[value]
+        if _is_number(value):
+            i = bisect.bisect_left(self._numbers, value)
+            while self._number_groups[i] != group:
+                i += 1
+            del self._numbers[i]
+            del self._number_groups[i]
+
+    def equal(self, candidates: Tuple[Any, ...]) -> List[Any]:
+        """
+        groups whose value is one of the candidates, in the order they were fed
+        """
+        groups: Dict[Any, None] = {}
+        for candidate in candidates:
+            groups.update(self._groups_by_value.get(candidate, {}))
+        return list(groups)
+
+    def range(self, suffix: str, bound: float) -> List[Any]:
+        """
+        groups whose value is greater (_gt) or less (_lt) than bound, in ascending order of the value
+        """
+        if suffix == "_gt":
+            return self._number_groups[bisect.bisect_right(self._numbers, bound):]
+        return self._number_groups[:bisect.bisect_left(self._numbers, bound)]
+
+
+class Query(NamedTuple):
+    """
+    Field projection and filters of a request to a target, hashable to cache the response per query
+    """
+    # fields to return of every record, all if None
+    fields: Optional[Tuple[str, ...]]
+    # (field, value) the field must be equal to, sorted
+    equal: Tuple[Tuple[str, str], ...]
+    # (field, suffix, bound) of the numeric ranges the field must be in, sorted
+    ranges: Tuple[Tuple[str, str, float], ...]
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> Optional["Query"]:
+        """
+        :param args: query parameters of the request, ?since= is not part of a query
+        :return: None if there are neither fields nor filters
+        :raise QueryError: if the bound of a range filter is not a number
+        """
+        fields = args.get("fields")
+        equal = []
+        ranges = []
+        for name, value in args.items():
+            if name in RESERVED_PARAMETERS:
+                continue
+            suffix = name[-3:]
+            if suffix in RANGE_SUFFIXES and len(name) > 3:
+                try:
+                    ranges.append((name[:-3], suffix, float(value)))
+                except ValueError:
+                    raise QueryError(f"{name} expected to be a number")
+            else:
+                equal.append((name, value))
+        if fields is None and not equal and not ranges:
+            return None
+        return cls(
+            fields=tuple(field for field in fields.split(",") if field) if fields is not None else None,
+            equal=tuple(sorted(equal)),
+            ranges=tuple(sorted(ranges))
+        )
+
+    def select(self, persistence: Mapping[Any, Mapping[str, Any]], indexes: Dict[str, FieldIndex],
+               group_by_attr: str) -> List[Mapping[str, Any]]:
+        """
+        Records of a grouped target that match the filters. Candidates are looked up by the group, or by the first
+        indexed field filtered on, and only scanned for when no filter can use an index. Records are in the
+        order they were fed, or in ascending order of the field when looked up by a range
+        :param persistence: records by group
+        :param indexes: by field
+        :param group_by_attr:
+        :return:
+        """
+        equal = [(field, _candidates(value)) for field, value in self.equal]
+        groups = None
+        for field, candidates in equal:
+            if field == group_by_attr:
+                groups = list(dict.fromkeys(c for c in candidates if c in persistence))
+                break
+        if groups is None:
+            for field, candidates in equal:
+                if field in indexes:
+                    groups = indexes[field].equal(candidates)
+                    break
+        if groups is None:
+            for field, suffix, bound in self.ranges:
+                if field in indexes:
+                    groups = indexes[field].range(suffix, bound)
+                    break
+        records = persistence.values() if groups is None else [persistence[group] for group in groups]
+        return [record for record in records if self.matches(record, equal)]
+
+    def matches(self, record: Mapping[str, Any], equal: Optional[List[Tuple[str, Tuple[Any, ...]]]] = None) -> bool:
+        """
+        :param record:
+        :param equal: the equality filters with the candidate values of each, computed if None
+        :return: True if the record passes all filters
+        """
+        if equal is None:
+            equal = [(field, _candidates(value)) for field, value in self.equal]
+        for field, candidates in equal:
+            if record.get(field, _MISSING) not in candidates:
+                return False
+        for field, suffix, bound in self.ranges:
+            value = record.get(field, _MISSING)
+            if not _is_number(value) or not (value > bound if suffix == "_gt" else value < bound):
+                return False
+        return True
+
+    def project(self, record: Mapping[str, Any]) -> Mapping[str, Any]:
+        """
+        the fields of the record that were asked for
+        """
+        if self.fields is None:
+            return record
+        return {field: record[field] for field in self.fields if field in record}
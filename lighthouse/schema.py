@@ -0,0 +1,181 @@
+import pickle
+import struct
+from collections.abc import Mapping
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+# field type: (python type, struct format character)
+TYPES = {
+    "int": (int, "q"),
+    "float": (float, "d"),
+    "bool": (bool, "?"),
+    "str": (str, "s")
+}
+FORMATS = ["pickle", "struct"]
+
+# record classes by schema name, so that records can be unpickled in other processes that loaded the same config
+_record_classes: Dict[str, type] = {}
+
+
+class MessageRejectedError(ValueError):
+    """
+    Raised for a message that doesn't match the schema of its adapter
+    """
+    pass
+
+
+class Record(Mapping):
+    """
+    Base of the record classes of the schemas: the declared fields plus the timestamp added on feed, stored in
+    __slots__ instead of a per record dict. Read like the dict a message would otherwise be stored as
+    """
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+    SLOTS: frozenset = frozenset()
+    SCHEMA_NAME = ""
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self.SLOTS:
+            raise KeyError(name)
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setitem__(self, name: str, value: Any):
+        if name not in self.SLOTS:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return (name for name in self.__slots__ if hasattr(self, name))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.as_dict()})"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self}
+
+    def __reduce__(self):
+        return _rebuild_record, (self.SCHEMA_NAME, self.as_dict())
+
+
+# names fields can't have: the timestamp added on feed, the first argument of __init__, and the attributes of
+# records (e.g. get or keys), which the slot of the field would shadow
+RESERVED_NAMES = frozenset(["timestamp", "self"]) | frozenset(dir(Record))
+
+
+def _rebuild_record(schema_name: str, values: Dict[str, Any]) -> Record:
+    record = _record_classes[schema_name].__new__(_record_classes[schema_name])
+    for name, value in values.items():
+        setattr(record, name, value)
+    return record
+
+
+def _make_init(names: Tuple[str, ...]):
+    """
+    __init__ of a record class taking the fields as arguments. Generated from source like those of namedtuple
+    and dataclasses: an assignment per field is several times faster than setting the fields in a loop
+    """
+    arguments = ", ".join(names)
+    assignments = "".join(f"    self.{name} = {name}\n" for name in names)
+    namespace = {}
+    exec(f"def __init__(self, {arguments}):\n{assignments}", namespace)
+    return namespace["__init__"]
+
+
+class Schema:
+    """
+    Fields and types of the messages of an adapter. Messages are pickled dicts (format "pickle") or packed with
+    a fixed binary layout (format "struct", little endian, str fields padded to their size in bytes) and are
+    decoded into records of a class generated for the schema. Messages with missing, unknown or mistyped fields
+    are rejected
+    """
+    def __init__(self, name: str, fields: List[Dict[str, Any]], message_format: str = "pickle"):
+        """
+        :param name: unique in the config, e.g. the name of the adapter
+        :param fields: name, type (one of TYPES) and, for str fields of the struct format, size
+        :param message_format: one of FORMATS
+        """
+        self.name = name
+        self.format = message_format
+        self.fields = [(field["name"], field["type"]) for field in fields]
+        self._types = {name: TYPES[field_type][0] for name, field_type in self.fields}
+        self._names = frozenset(self._types)
+        self._str_fields = [i for i, (_, field_type) in enumerate(self.fields) if field_type == "str"]
+        self._sizes = {field["name"]: field.get("size") for field in fields}
+        self._struct: Optional[struct.Struct] = None
+        if message_format == "struct":
+            self._struct = struct.Struct("<" + "".join(
+                f"{field['size']}s" if field["type"] == "str" else TYPES[field["type"]][1] for field in fields
+            ))
+        names = tuple(name for name, _ in self.fields)
+        self.record_class = type(f"{name.title().replace('_', '')}Record", (Record,), {
+            "__slots__": names + ("timestamp",),
+            "__init__": _make_init(names),
+            "FIELDS": names,
+            "SLOTS": frozenset(names + ("timestamp",)),
+            "SCHEMA_NAME": name
+        })
+        _record_classes[name] = self.record_class
+
+    def decode(self, message: bytes) -> Record:
+        """
+        :param message: message as read from the queue
+        :return: the record
+        :raise MessageRejectedError: if the message doesn't match the schema
+        """
+        if self._struct is not None:
+            return self._decode_struct(message)
+        try:
+            data = pickle.loads(message)
+        except Exception as e:
+            raise MessageRejectedError(f"Could not unpickle message: {e}")
+        return self.from_dict(data)
+
+    def _decode_struct(self, message: bytes) -> Record:
+        if len(message) != self._struct.size:
+            raise MessageRejectedError(f"Expected a message of {self._struct.size} bytes, got {len(message)}")
+        values = list(self._struct.unpack(message))
+        try:
+            for i in self._str_fields:
+                values[i] = values[i].rstrip(b"\0").decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise MessageRejectedError(f"Invalid string in message: {e}")
+        return self.record_class(*values)
+
+    def from_dict(self, data: Any) -> Record:
+        """
+        :param data: message as a dict
+        :return: the record
+        :raise MessageRejectedError: if the message doesn't match the schema
+        """
+        if not isinstance(data, dict) or data.keys() != self._names:
+            raise MessageRejectedError(f"Expected a dict with the fields {sorted(self._names)}")
+        for name, field_type in self._types.items():
+            value = data[name]
+            if type(value) is not field_type:
+                if field_type is float and type(value) is int:
+                    data = {**data, name: float(value)}
+                else:
+                    raise MessageRejectedError(f"Field {name} expected to be {field_type.__name__}")
+        return self.record_class(**data)
+
+    def encode(self, data: Dict[str, Any]) -> bytes:
+        """
+        Message in the format of this schema, for producers
+        :param data:
+        :return:
+        """
+        record = self.from_dict(data)
+        if self._struct is None:
+            return pickle.dumps(data)
+        values = [getattr(record, name) for name in record.FIELDS]
+        for i in self._str_fields:
+            name = record.FIELDS[i]
+            values[i] = values[i].encode("utf-8")
+            if len(values[i]) > self._sizes[name]:
+                raise MessageRejectedError(f"Field {name} longer than {self._sizes[name]} bytes")
+        return self._struct.pack(*values)
@@ -0,0 +1,119 @@
+import fcntl
+import mmap
+import os
+import struct
+import time
+from typing import Optional, Tuple
+
+
+class StateUnavailableError(Exception):
+    """
+    Raised by a process that doesn't ingest when it has no state to serve, because the shared state could not be
+    read
+    """
+    pass
+
+
+class SharedStateStore:
+    """
+    A file backed shared memory region holding a single serialized state blob, written by one process and
+    read by many. Writes are guarded by a seqlock: the sequence number in the header is odd while a write is
+    in progress and readers retry until they copied the payload between two identical, even sequence numbers.
+
+    Layout: | sequence (u64) | payload length (u64) | payload ... |
+    """
+    _HEADER = struct.Struct("<QQ")
+    INITIAL_SIZE = 64 * 1024
+    # how long a reader keeps retrying while a write is in progress
+    READ_RETRY_SEC = 1.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < self.INITIAL_SIZE:
+            os.ftruncate(self._fd, self.INITIAL_SIZE)
+        self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    @property
+    def sequence(self) -> int:
+        """
+        Sequence number of the last completed write, cheap enough to be checked on every read
+        """
+        return self._HEADER.unpack_from(self._map, 0)[0] & ~1
+
+    def publish(self, payload: bytes):
+        """
+        Replace the stored payload. Only a single process may write to a store
+        :param payload:
+        :return:
+        """
+        sequence, _ = self._HEADER.unpack_from(self._map, 0)
+        sequence |= 1
+        struct.pack_into("<Q", self._map, 0, sequence)
+        if self._HEADER.size + len(payload) > len(self._map):
+            self._grow(self._HEADER.size + len(payload))
+        self._map[self._HEADER.size:self._HEADER.size + len(payload)] = payload
+        self._HEADER.pack_into(self._map, 0, sequence + 1, len(payload))
+
+    def read(self) -> Tuple[int, Optional[bytes]]:
+        """
+        Get a consistent copy of the stored payload
+        :return: tuple of sequence number and payload, payload is None if nothing was written yet
+        """
+        deadline = time.monotonic() + self.READ_RETRY_SEC
+        while True:
+            sequence, length = self._HEADER.unpack_from(self._map, 0)
+            if not sequence & 1:
+                if self._HEADER.size + length > len(self._map):
+                    # the writer grew the file since it was mapped here
+                    self._remap()
+                    continue
+                payload = self._map[self._HEADER.size:self._HEADER.size + length]
+                if self._HEADER.unpack_from(self._map, 0)[0] == sequence:
+                    return sequence, payload if sequence else None
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Shared state {self.path} is stuck in a write")
+            time.sleep(0)
+
+    def _grow(self, min_size: int):
+        size = len(self._map)
+        while size < min_size:
+            size *= 2
+        os.ftruncate(self._fd, size)
+        self._remap()
+
+    def _remap(self):
+        self._map.close()
+        self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+
+
+class IngestLock:
+    """
+    Inter-process lock electing the single process that consumes the IPC queues.
+    The lock is released by the OS when the holding process exits, so another process can take over.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.is_held = False
+
+    def try_acquire(self) -> bool:
+        """
+        :return: True if this process holds the lock
+        """
+        if not self.is_held:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.is_held = True
+            except BlockingIOError:
+                pass
+        return self.is_held
+
+    def release(self):
+        if self.is_held:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self.is_held = False
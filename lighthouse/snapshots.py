@@ -0,0 +1,53 @@
+import logging
+import os
+import pickle
+from typing import Dict, Any, Optional
+
+_logger = logging.getLogger("Lighthouse")
+
+
+class SnapshotFile:
+    """
+    State of a target kept on disk, to serve the last known records right after a restart instead of waiting for
+    every node to report again.
+
+    The state is written as a whole to a temporary file which then replaces the previous one, so that a crash
+    while writing leaves the previous snapshot intact
+    """
+    # bumped whenever the layout of the state changes, snapshots of other formats are ignored
+    FORMAT = 2
+
+    def __init__(self, path: str):
+        self.path = path
+        # version of the target last written, to skip writing unchanged targets
+        self.written_version: Optional[int] = None
+
+    def write(self, state: Dict[str, Any]):
+        """
+        :param state: see RESTAPITarget.export_state
+        :raise OSError:
+        """
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            pickle.dump({"format": self.FORMAT, **state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """
+        :return: the state last written, None if there is none or it can't be read
+        """
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # e.g. truncated, or holding the records of a schema that was changed since
+            _logger.warning(f"Could not read snapshot {self.path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get("format") != self.FORMAT:
+            _logger.warning(f"Ignoring snapshot {self.path} of another format")
+            return None
+        return state
@@ -18,11 +18,13 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.8',
     install_requires=[
         "gunicorn",
         "ipcqueue",
-        "flask",
-        "readerwriterlock"
-    ]
+        "flask>=2.2"
+    ],
+    extras_require={
+        "asgi": ["uvicorn[standard]"]
+    }
 )
@@ -37,3 +37,20 @@ class AdapterTest(TestCase):
         adapter.source.get_message.assert_called_once()
         # feed shouldn't be called when None is obtained from source
         adapter.target.feed.assert_not_called()
+
+    @staticmethod
+    def test_adapter_update_batch():
+        """
+        In batch mode, update drains up to batch_size messages and feeds them to target at once
+        """
+        source = Mock(spec=Source)
+        target = Mock(spec=Target)
+        messages = [{"test_key": i} for i in range(5)]
+        source.get_message.side_effect = messages + [None]
+        adapter = Adapter(name="test_adapter", source=source, target=target, batch_size=3)
+
+        assert adapter.update()
+        target.feed_many.assert_called_once_with(messages[:3])
+        assert adapter.update()
+        target.feed_many.assert_called_with(messages[3:])
+        target.feed.assert_not_called()
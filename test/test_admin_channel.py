@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "adapter_scripts"))
+import admin_channel  # noqa: E402
+import batch_users  # noqa: E402
+
+# local stand-in for the shell on the admin host
+LOCAL_SHELL = ["bash", "--noprofile", "--norc"]
+
+
+class AdminChannelTest(TestCase):
+    def setUp(self):
+        self.channel = admin_channel.AdminChannel(LOCAL_SHELL, timeout_sec=5)
+
+    def tearDown(self):
+        self.channel.close()
+
+    def test_commands_share_one_shell(self):
+        first = self.channel.execute("sh", "-c", "echo $PPID; echo oops >&2")
+        self.assertEqual(first.returncode, 0)
+        self.assertEqual(first.stderr, "oops\n")
+        second = self.channel.execute("sh", "-c", "echo $PPID; exit 3")
+        self.assertEqual(second.returncode, 3)
+        self.assertEqual(first.stdout, second.stdout)
+
+    def test_arguments_are_quoted(self):
+        result = self.channel.execute("printf", "%s|", "a b", "$HOME", "; false")
+        self.assertEqual(result.stdout, "a b|$HOME|; false|")
+
+    def test_timeout_and_reconnect(self):
+        result = self.channel.execute("sleep", "5", timeout_sec=0.2)
+        self.assertIsNone(result.returncode)
+        self.assertIn("timed out", result.stderr)
+        self.assertEqual(self.channel.execute("true").returncode, 0)
+
+        # the shell exits, e.g. because the connection dropped
+        self.channel.execute("true")
+        self.channel._process.kill()
+        self.channel._process.wait()
+        self.assertEqual(self.channel.execute("echo", "back").stdout, "back\n")
+
+    def test_waits_bounded_by_deadline(self):
+        """
+        A command waiting for a free channel gives up at the deadline of its action, without running at all
+        """
+        pool = admin_channel.ChannelPool(LOCAL_SHELL, size=1)
+        with pool.channel() as held, patch.object(admin_channel, "time_left", return_value=0.2), \
+                patch.object(admin_channel, "_pool", pool):
+            started = time.monotonic()
+            result = pool.execute("true")
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertIsNone(result.returncode)
+            self.assertIn("became free", result.stderr)
+            self.assertIn("became free", batch_users.main("remove", "alice")["error"])
+            held.close()
+        self.assertEqual(pool.execute("true", timeout_sec=1).returncode, 0)
+
+        result = self.channel.execute("true", timeout_sec=0)
+        self.assertEqual((result.returncode, self.channel._process), (None, None))
+
+    def test_batch_users_over_one_channel(self):
+        pool = admin_channel.ChannelPool(LOCAL_SHELL, size=1)
+        with patch.object(admin_channel, "_pool", pool), patch.object(batch_users.remove_user, "SCRIPT_PATH", "test"):
+            # runs "test <username>", which succeeds for any non-empty username
+            response = batch_users.main("remove", "alice,bob")
+            self.assertEqual(response["result"], "success")
+            self.assertEqual([result["target"] for result in response["results"]], ["alice", "bob"])
+            self.assertEqual(batch_users.main("create", "alice:secret")["result"], "failed")
+        with pool.channel() as channel:
+            channel.close()
@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from lighthouse.aggregates import Aggregate, Aggregates
+
+
+class AggregatesTest(TestCase):
+    def test_aggregate_min_max_with_removals(self):
+        minimum = Aggregate("min_temp", "min", "temperature")
+        maximum = Aggregate("max_temp", "max", "temperature")
+        records = [{"temperature": t} for t in [40, 35, 50]]
+        for record in records:
+            minimum.add(record)
+            maximum.add(record)
+        self.assertEqual((minimum.result(), maximum.result()), (35, 50))
+
+        minimum.remove(records[1])
+        maximum.remove(records[2])
+        self.assertEqual((minimum.result(), maximum.result()), (40, 40))
+
+    def test_aggregate_heap_stays_bounded(self):
+        """
+        Replacing the same record over and over doesn't grow the heap of a min aggregate
+        """
+        minimum = Aggregate("min_load", "min", "cpu_load")
+        record = {"cpu_load": 0.0}
+        minimum.add(record)
+        for i in range(1000):
+            new_record = {"cpu_load": float(i)}
+            minimum.remove(record)
+            minimum.add(new_record)
+            record = new_record
+        self.assertEqual(minimum.result(), 999.0)
+        self.assertLess(len(minimum._heap), 50)
+
+    def test_aggregate_ignores_nan(self):
+        """
+        NaN and infinite values don't count, and don't stay in the results once their record is replaced
+        """
+        for function in ["sum", "mean", "min", "max", "count"]:
+            aggregate = Aggregate("load", function, "cpu_load")
+            aggregate.add({"cpu_load": 2.0})
+            aggregate.add({"cpu_load": float("nan")})
+            aggregate.add({"cpu_load": float("inf")})
+            self.assertEqual(aggregate.result(), 1 if function == "count" else 2.0)
+            aggregate.remove({"cpu_load": float("nan")})
+            aggregate.add({"cpu_load": 4.0})
+            expected = {"sum": 6.0, "mean": 3.0, "min": 2.0, "max": 4.0, "count": 2}[function]
+            self.assertEqual(aggregate.result(), expected)
+
+    def test_aggregates_replace(self):
+        aggregates = Aggregates([
+            {"name": "nodes", "function": "count"},
+            {"name": "mean_load", "function": "mean", "field": "cpu_load"},
+            {"name": "total_load", "function": "sum", "field": "cpu_load"},
+        ])
+        first, second = {"cpu_load": 10}, {"cpu_load": 30, "hostname": "johnny02"}
+        aggregates.replace(None, first)
+        aggregates.replace(None, second)
+        self.assertEqual(aggregates.results(), {"nodes": 2, "mean_load": 20, "total_load": 40})
+
+        aggregates.replace(first, {"cpu_load": "n/a"})
+        aggregates.replace(second, None)
+        self.assertEqual(aggregates.results(), {"nodes": 1, "mean_load": None, "total_load": None})
@@ -0,0 +1,110 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from flask import Flask
+
+from lighthouse.asgi import LighthouseASGI
+from lighthouse.events import EventBroadcaster
+from lighthouse.lighthouse import RESTAPITarget, RESTAction
+
+
+async def _request(asgi_app: LighthouseASGI, path: str, headers=(), chunks: int = 1, on_chunk=None):
+    """
+    send a GET request to the ASGI app, disconnect after the given number of body chunks
+    :return: status, headers and body chunks of the response
+    """
+    disconnect = asyncio.Event()
+    request_sent = False
+    messages = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+        if message["type"] == "http.response.body":
+            if on_chunk is not None:
+                on_chunk(len(messages) - 1)
+            if len(messages) > chunks:
+                disconnect.set()
+
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers]
+    }
+    await asyncio.wait_for(asgi_app(scope, receive, send), timeout=5)
+    start = messages[0]
+    return start["status"], dict(start["headers"]), [message["body"] for message in messages[1:]]
+
+
+class ASGITest(TestCase):
+    def setUp(self):
+        self.flask_app = Flask("test_asgi")
+        self.asgi_app = LighthouseASGI(self.flask_app, action_workers=2)
+        self.target = RESTAPITarget("/test_target", group_by_attr="ip_address", events=EventBroadcaster())
+        self.flask_app.add_url_rule("/test_target", "test_target", self.target)
+        self.flask_app.add_url_rule("/test_target/stream", "test_target_stream", self.target.serve_stream)
+
+    def test_target_route(self):
+        self.target.feed({"ip_address": "127.0.0.1"})
+        status, headers, body = asyncio.run(_request(self.asgi_app, "/test_target"))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body[0])["test_target"][0]["ip_address"], "127.0.0.1")
+
+        if_none_match = [("If-None-Match", headers[b"etag"].decode())]
+        status, _, _ = asyncio.run(_request(self.asgi_app, "/test_target", if_none_match))
+        self.assertEqual(status, 304)
+        status, _, _ = asyncio.run(_request(self.asgi_app, "/unknown"))
+        self.assertEqual(status, 404)
+
+        self.target.feed_many([{"ip_address": f"127.0.0.{n}", "hostname": f"node{n:03d}"} for n in range(100)])
+        status, headers, body = asyncio.run(_request(self.asgi_app, "/test_target", [("Accept-Encoding", "gzip")]))
+        self.assertEqual(headers[b"content-encoding"], b"gzip")
+        self.assertEqual(gzip.decompress(body[0]), self.target.get_serialized_data()[0])
+
+    def test_action_runs_outside_event_loop(self):
+        with tempfile.TemporaryDirectory() as script_dir:
+            script_path = os.path.join(script_dir, "asgi_test_action.py")
+            with open(script_path, "w") as f:
+                f.write("import threading\n\ndef main(number):\n    return [number, threading.current_thread().name]\n")
+            action = RESTAction("asgi_test_action", "/asgi_test_action", script_path, [{"name": "n", "type": "int"}])
+            self.flask_app.add_url_rule(action.route, action.name, action)
+
+            status, _, body = asyncio.run(_request(self.asgi_app, "/asgi_test_action/3"))
+        self.assertEqual(status, 200)
+        number, thread_name = json.loads(body[0])["response"]
+        self.assertEqual(number, 3)
+        self.assertNotEqual(thread_name, threading.current_thread().name)
+
+    def test_stream(self):
+        """
+        A stream gets the snapshot, then the fed changes, and ends when the client disconnects
+        """
+        self.target.feed({"ip_address": "127.0.0.1"})
+
+        def feed_after_snapshot(chunk):
+            if chunk == 1:
+                threading.Thread(target=self.target.feed, args=({"ip_address": "127.0.0.2"},)).start()
+
+        status, headers, body = asyncio.run(
+            _request(self.asgi_app, "/test_target/stream", chunks=2, on_chunk=feed_after_snapshot)
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"content-type"], b"text/event-stream; charset=utf-8")
+        self.assertTrue(body[0].startswith(b"id: 1\nevent: snapshot\n"))
+        self.assertTrue(body[1].startswith(b"id: 2\nevent: update\n"))
+        self.assertEqual(self.target.events.subscribers, 0)
@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "adapter_scripts"))
+import bulk_power  # noqa: E402
+
+
+def _slow_reset(node_number):
+    time.sleep(0.2)
+    return {"action": "reset", "target": node_number, "result": "failed" if node_number == 3 else "success"}
+
+
+class BulkPowerTest(TestCase):
+    def test_parse_nodes(self):
+        self.assertEqual(bulk_power.parse_nodes("1-4,6,2"), [1, 2, 3, 4, 6])
+        with self.assertRaises(ValueError):
+            bulk_power.parse_nodes("4-1")
+        with self.assertRaises(ValueError):
+            bulk_power.parse_nodes("1-1000")
+
+    def test_nodes_run_concurrently(self):
+        with patch.object(bulk_power.reset, "main", side_effect=_slow_reset):
+            response = bulk_power.main("reset", "1-4")
+        self.assertLess(response["duration_sec"], 0.6)
+        self.assertEqual([result["target"] for result in response["results"]], [1, 2, 3, 4])
+        self.assertGreaterEqual(response["results"][0]["duration_sec"], 0.2)
+        self.assertEqual((response["result"], response["failed_targets"]), ("failed", [3]))
+
+    def test_max_parallel(self):
+        with patch.object(bulk_power.reset, "main", side_effect=_slow_reset):
+            response = bulk_power.main("reset", "1-2", max_parallel=1)
+        self.assertGreaterEqual(response["duration_sec"], 0.4)
+
+    def test_unknown_operation(self):
+        self.assertEqual(bulk_power.main("explode", "1")["result"], "failed")
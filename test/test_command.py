@@ -0,0 +1,27 @@
+import os
+import sys
+import time
+from unittest import TestCase
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "adapter_scripts"))
+from command import exec_command, read_command  # noqa: E402
+from lighthouse.deadline import call_with_deadline  # noqa: E402
+
+
+class CommandTest(TestCase):
+    def test_result_and_error(self):
+        self.assertEqual(exec_command(["true"]), (True, None))
+        self.assertEqual(exec_command(["sh", "-c", "echo failed >&2; exit 1"]), (False, "failed\n"))
+        self.assertFalse(exec_command(["/nonexistent/command"])[0])
+
+    def test_read_output(self):
+        self.assertEqual(read_command(["sh", "-c", "echo alice; echo bob"]), (True, "alice\nbob\n", None))
+        self.assertEqual(read_command(["sh", "-c", "echo alice; exit 1"])[:2], (False, None))
+
+    def test_command_is_killed_at_deadline_of_action(self):
+        started = time.monotonic()
+        # the shell's child (sleep) is killed along with it
+        result, error = call_with_deadline(time.monotonic() + 0.2, exec_command, ["sh", "-c", "sleep 5; true"])
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertFalse(result)
+        self.assertIn("was killed", error)
@@ -0,0 +1,96 @@
+import gzip
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from lighthouse.aggregates import Aggregates
+from lighthouse.compression import Compression, ENCODINGS
+from lighthouse.history import History
+from lighthouse.lighthouse import RESTAPITarget, RESTAction, LighthouseFactory, ConfigFileInvalidError, app
+
+
+def _fill(target: RESTAPITarget, nodes: int = 50):
+    target.feed_many([
+        {"ip_address": f"10.0.0.{n}", "hostname": f"node{n:03d}", "cpu_usage": 1.5} for n in range(nodes)
+    ])
+
+
+class CompressionTest(TestCase):
+    def test_choose(self):
+        """
+        The preferred encoding accepted by the client, none for small bodies or when the client accepts none
+        """
+        compression = Compression(min_size=100, encodings=["gzip"])
+        self.assertEqual(compression.choose("gzip, deflate, br", 100), "gzip")
+        self.assertEqual(compression.choose("*", 100), "gzip")
+        self.assertIsNone(compression.choose("gzip", 99))
+        self.assertIsNone(compression.choose("gzip;q=0, br", 100))
+        self.assertIsNone(compression.choose(None, 100))
+        self.assertIsNone(Compression(encodings=[]).choose("gzip", 10 ** 6))
+        self.assertEqual(Compression(encodings=["unknown", "gzip"]).encodings, ["gzip"])
+
+    def test_target_compressed_once_per_version(self):
+        """
+        Every request for the same version shares one compressed body, with an ETag of its own
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        _fill(t)
+        compress = Mock(side_effect=ENCODINGS["gzip"])
+        with patch.dict(ENCODINGS, {"gzip": compress}):
+            for _ in range(3):
+                with app.test_request_context("/test_target", headers={"Accept-Encoding": "gzip"}):
+                    response = t()
+            self.assertEqual(compress.call_count, 1)
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            self.assertIn("Accept-Encoding", response.vary)
+            self.assertEqual(gzip.decompress(response.get_data()), t.get_serialized_data()[0])
+            etag, _ = response.get_etag()
+            self.assertNotEqual(etag, t.get_serialized_data()[1])
+
+            with app.test_request_context("/test_target", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}):
+                self.assertEqual(t().status_code, 304)
+            t.feed({"ip_address": "10.0.0.1"})
+            with app.test_request_context("/test_target", headers={"Accept-Encoding": "gzip"}):
+                t()
+            self.assertEqual(compress.call_count, 2)
+
+        with app.test_request_context("/test_target"):
+            self.assertNotIn("Content-Encoding", t().headers)
+        small = RESTAPITarget("/test_small_target", group_by_attr="ip_address")
+        _fill(small, 1)
+        with app.test_request_context("/test_small_target", headers={"Accept-Encoding": "gzip"}):
+            self.assertNotIn("Content-Encoding", small().headers)
+
+    def test_action_compressed(self):
+        action = RESTAction("test_compressed_action", "/test_compressed_action", "test_script.py", [],
+                            compression=Compression(min_size=10))
+        action._main = Mock(return_value={"result": "success", "output": "x" * 100})
+        with app.test_request_context("/test_compressed_action", headers={"Accept-Encoding": "gzip"}):
+            response = action()
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn(b'"output"', gzip.decompress(response.get_data()))
+
+    def test_history_and_aggregates_compressed(self):
+        """
+        The history and aggregates of a target are compressed like its records
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", history=History(size=10),
+                          aggregates=Aggregates([{"name": "nodes", "function": "count"}]),
+                          compression=Compression(min_size=10))
+        _fill(t)
+        with app.test_request_context("/test_target/history", headers={"Accept-Encoding": "gzip"}):
+            response = t.serve_history()
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(app.json.loads(gzip.decompress(response.get_data()))["test_target"]), 50)
+        with app.test_request_context("/test_target/aggregate", headers={"Accept-Encoding": "gzip"}):
+            response = t.serve_aggregates()
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(app.json.loads(gzip.decompress(response.get_data())), {"test_target": {"nodes": 50}})
+        with app.test_request_context("/test_target/aggregate"):
+            self.assertNotIn("Content-Encoding", t.serve_aggregates().headers)
+
+    def test_config_compression(self):
+        config = {"log_level": "INFO", "compression": {"min_size": 512, "encodings": ["zstd", "gzip"]}}
+        LighthouseFactory._validate_config_file(config)
+        for compression in [{"min_size": -1}, {"min_size": "1k"}, {"encodings": ["br"]}, {"encodings": "gzip"}, []]:
+            config["compression"] = compression
+            self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
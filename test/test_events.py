@@ -0,0 +1,23 @@
+from unittest import TestCase
+
+from lighthouse.events import EventBroadcaster
+
+
+class EventBroadcasterTest(TestCase):
+    def test_wait_returns_events_after_version(self):
+        events = EventBroadcaster(backlog=3)
+        events.publish(0, 1, b"a")
+        events.publish(1, 3, b"b")
+        self.assertEqual(events.wait(0, timeout=0), [(1, b"a"), (3, b"b")])
+        self.assertEqual(events.wait(2, timeout=0), [(3, b"b")])
+        self.assertEqual(events.wait(3, timeout=0), [])
+
+    def test_wait_detects_gap(self):
+        """
+        A subscriber behind the oldest event in the backlog can't follow one by one
+        """
+        events = EventBroadcaster(backlog=2)
+        for version in range(4):
+            events.publish(version, version + 1, b"x")
+        self.assertIsNone(events.wait(1, timeout=0))
+        self.assertEqual(len(events.wait(2, timeout=0)), 2)
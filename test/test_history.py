@@ -0,0 +1,74 @@
+import math
+from unittest import TestCase
+
+from lighthouse.history import History, SeriesRing
+
+
+class HistoryTest(TestCase):
+    def test_series_ring_keeps_latest_samples(self):
+        """
+        The ring never grows beyond its capacity, older samples are overwritten
+        """
+        ring = SeriesRing(3, ["cpu_load"])
+        for i in range(5):
+            ring.append(float(i), {"cpu_load": i * 10, "hostname": "johnny01"})
+        self.assertEqual(ring.count, 3)
+        self.assertEqual(len(ring.timestamps), 3)
+        self.assertEqual([ring.timestamps[i] for i in ring.indices(0, math.inf)], [2.0, 3.0, 4.0])
+        self.assertEqual(ring.oldest_timestamp(), 2.0)
+
+    def test_history_query(self):
+        history = History(size=10)
+        for i in range(4):
+            history.record("127.0.0.1", {"ip_address": "127.0.0.1", "cpu_load": float(i), "up": True}, float(i))
+        history.record("127.0.0.2", {"ip_address": "127.0.0.2", "cpu_load": 7}, 2.0)
+
+        result = history.query(1.0, 3.0)
+        self.assertEqual(result["127.0.0.1"], {"timestamp": [1.0, 2.0], "cpu_load": [1.0, 2.0]})
+        self.assertEqual(result["127.0.0.2"], {"timestamp": [2.0], "cpu_load": [7.0]})
+        self.assertEqual(list(history.query(0.0, 4.0, group="127.0.0.2")), ["127.0.0.2"])
+
+    def test_history_downsample(self):
+        history = History(size=10, fields=["cpu_load", "temperature"])
+        for i in range(4):
+            history.record(None, {"cpu_load": float(i)}, float(i))
+
+        result = history.query(0.0, 4.0, buckets=2)[None]
+        self.assertEqual(result["timestamp"], [0.0, 2.0])
+        self.assertEqual(result["cpu_load"], {"min": [0.0, 2.0], "max": [1.0, 3.0], "mean": [0.5, 2.5]})
+        # a field that was never reported has no values
+        self.assertEqual(result["temperature"]["mean"], [None, None])
+
+    def test_history_keeps_expired_groups(self):
+        """
+        The series of an expired group is kept until retention_sec passed, or until max_expired groups expired
+        after it, and for as long as it reports again
+        """
+        history = History(size=5, retention_sec=10, max_expired=2)
+        for group in ["a", "b", "c", "d"]:
+            history.record(group, {"cpu_load": 1.0}, 1.0)
+        history.expire("a", 100.0)
+        history.expire("b", 105.0)
+        history.record("a", {"cpu_load": 2.0}, 106.0)
+        history.expire("c", 107.0)
+        self.assertEqual(sorted(history.query(0, 200)), ["a", "b", "c", "d"])
+        history.expire("d", 108.0)
+        self.assertEqual(sorted(history.query(0, 200)), ["a", "c", "d"])
+        history.prune(117.0)
+        self.assertEqual(sorted(history.query(0, 200)), ["a", "d"])
+        history.prune(1000.0)
+        self.assertEqual(sorted(history.query(0, 200)), ["a"])
+
+    def test_history_export_load(self):
+        history = History(size=5, retention_sec=10)
+        history.record("a", {"cpu_load": 1.0}, 1.0)
+        history.record("b", {"cpu_load": 1.0}, 1.0)
+        history.expire("b", 1.0)
+        copy = History(size=5, retention_sec=10)
+        copy.load_state(history.export_state())
+        self.assertEqual(copy.query(0, 2), history.query(0, 2))
+        copy.prune(20.0)
+        self.assertEqual(list(copy.query(0, 2)), ["a"])
+        resized = History(size=6)
+        resized.load_state(history.export_state())
+        self.assertEqual(resized.query(0, 2), {})
@@ -0,0 +1,80 @@
+import os
+import stat
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from lighthouse.jobs import JobManager, JobsBusyError
+from lighthouse.lighthouse import RESTAction
+
+
+def _wait_until_done(jobs: JobManager, job_id: str):
+    deadline = time.monotonic() + 5
+    while jobs.get(job_id)["status"] in ["queued", "running"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return jobs.get(job_id)
+
+
+class JobManagerTest(TestCase):
+    def test_job_finishes_with_result(self):
+        release = threading.Event()
+        jobs = JobManager(workers=1)
+        job = jobs.submit("test_action", lambda number: release.wait(5) and number * 2, [21])
+        self.assertIn(jobs.get(job["id"])["status"], ["queued", "running"])
+
+        release.set()
+        job = _wait_until_done(jobs, job["id"])
+        self.assertEqual((job["status"], job["result"]), ("finished", 42))
+        self.assertGreaterEqual(job["duration_sec"], 0)
+        self.assertIsNone(jobs.get("unknown"))
+
+    def test_job_failure_is_reported(self):
+        jobs = JobManager(workers=1)
+        job = _wait_until_done(jobs, jobs.submit("test_action", lambda: 1 / 0, [])["id"])
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("ZeroDivisionError", job["error"])
+
+    def test_finished_jobs_are_bounded(self):
+        jobs = JobManager(workers=1, max_jobs=2)
+        job_ids = [jobs.submit("test_action", lambda: None, [])["id"] for _ in range(3)]
+        _wait_until_done(jobs, job_ids[-1])
+        jobs.submit("test_action", lambda: None, [])
+        self.assertIsNone(jobs.get(job_ids[0]))
+        self.assertIsNotNone(jobs.get(job_ids[-1]))
+
+    def test_pending_jobs_are_bounded(self):
+        """
+        Jobs beyond max_pending queued or running jobs are rejected until one finishes
+        """
+        release = threading.Event()
+        jobs = JobManager(workers=1, max_pending=2)
+        job_ids = [jobs.submit("test_action", lambda: release.wait(5), [])["id"] for _ in range(2)]
+        self.assertRaises(JobsBusyError, jobs.submit, "test_action", lambda: None, [])
+        release.set()
+        for job_id in job_ids:
+            _wait_until_done(jobs, job_id)
+        self.assertEqual(jobs.pending, 0)
+        jobs.submit("test_action", lambda: None, [])
+        self.assertEqual(RESTAction._handle_jobs_busy(JobsBusyError())[1], 503)
+
+    def test_jobs_are_shared_through_directory(self):
+        """
+        A job run by one manager (i.e. worker process) can be looked up through another one
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            running, other = JobManager(directory=directory), JobManager(directory=directory)
+            job = _wait_until_done(running, running.submit("test_action", lambda: "done", [])["id"])
+            self.assertEqual(other.get(job["id"]), job)
+
+    def test_job_records_keep_arguments_private(self):
+        """
+        The arguments of a job, e.g. a password, are neither returned nor written, records are for the owner only
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            jobs = JobManager(directory=directory)
+            job = _wait_until_done(jobs, jobs.submit("test_action", lambda *_: "done", ["alice", "secret"])["id"])
+            self.assertNotIn("arguments", job)
+            with open(jobs._path(job["id"]), "r") as f:
+                self.assertNotIn("secret", f.read())
+            self.assertEqual(stat.S_IMODE(os.stat(jobs._path(job["id"])).st_mode), 0o600)
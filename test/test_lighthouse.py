@@ -1,14 +1,466 @@
+import os
+import sys
+import tempfile
+import threading
+import time
 from unittest import TestCase
 from unittest.mock import Mock, patch
 
-from lighthouse.lighthouse import RESTAPITarget, RESTAction
+from lighthouse.adapter import Adapter, Source, Target
+from lighthouse.history import History
+from lighthouse.aggregates import Aggregates
+from lighthouse.events import EventBroadcaster
+from lighthouse.lighthouse import RESTAPITarget, RESTAction, Lighthouse, LighthouseFactory, ConfigFileInvalidError, app
+from lighthouse.limits import ActionBusyError, ActionTimeoutError
+from lighthouse.shared_state import IngestLock
 
 
 class LighthouseTest(TestCase):
-    @patch("readerwriterlock.rwlock.RWLockRead.gen_rlock")
-    def test_rest_api_target(self, mock_gen_rlock):
-        t = RESTAPITarget("test_target")
-        t.get_data()
+    def test_rest_api_target_reads_take_no_lock(self):
+        """
+        Readers work on the current snapshot even while a writer holds the write lock
+        """
+        t = RESTAPITarget("/test_target")
+        t.feed({"key": "value"})
+        with t._write_lock:
+            self.assertEqual(t.get_data()["test_target"]["key"], "value")
 
-        t.rw_lock.gen_rlock.assert_called_once()
+    def test_rest_api_target_etag(self):
+        """
+        The serialized response is reused until data is fed, a matching If-None-Match gets a 304
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        t.feed({"ip_address": "127.0.0.1"})
+        with app.test_request_context("/test_target"):
+            first = t()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.get_json()["test_target"][0]["ip_address"], "127.0.0.1")
+        etag, _ = first.get_etag()
 
+        with patch.object(t, "_prepare_new_response") as mock_prepare:
+            with app.test_request_context("/test_target", headers={"If-None-Match": f'"{etag}"'}):
+                second = t()
+            mock_prepare.assert_not_called()
+        self.assertEqual(second.status_code, 304)
+
+        t.feed({"ip_address": "127.0.0.2"})
+        with app.test_request_context("/test_target", headers={"If-None-Match": f'"{etag}"'}):
+            third = t()
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(len(third.get_json()["test_target"]), 2)
+
+    def test_rest_api_target_compact_json(self):
+        """
+        The cached body is encoded like the responses of the other routes
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        t.feed({"ip_address": "127.0.0.1", "cpu_usage": 1.5})
+        with app.test_request_context("/test_target"):
+            body = t.get_serialized_data()[0]
+            self.assertEqual(body, app.json.response(t.get_data()).get_data().rstrip())
+        self.assertNotIn(b", ", body)
+        self.assertNotIn(b": ", body)
+
+    def test_rest_api_target_cache_expires_with_aging(self):
+        t = RESTAPITarget("/test_target")
+        t.feed({"key": "value"})
+        self.assertIn(b"value", t.get_serialized_data()[0])
+        t.aging_time_sec = 0
+        t._cached_response = (t.version, time.time() - 1) + t._cached_response[2:]
+        self.assertNotIn(b"value", t.get_serialized_data()[0])
+
+    def test_rest_api_target_feed_many(self):
+        """
+        A batch is published as a single new snapshot, keeping the last message of each group,
+        readers holding the previous snapshot are unaffected
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        t.feed({"ip_address": "127.0.0.1", "seq": 0})
+        previous_snapshot = t._snapshot
+        t.feed_many([
+            {"ip_address": "127.0.0.1", "seq": 1},
+            {"ip_address": "127.0.0.2", "seq": 2},
+            {"ip_address": "127.0.0.1", "seq": 3},
+        ])
+        self.assertEqual(t.version, previous_snapshot.version + 1)
+        self.assertEqual(list(t.persistence.keys()), ["127.0.0.2", "127.0.0.1"])
+        self.assertEqual(t.persistence["127.0.0.1"]["seq"], 3)
+        self.assertEqual(previous_snapshot.persistence["127.0.0.1"]["seq"], 0)
+
+    def test_rest_api_target_drops_ungrouped_messages(self):
+        """
+        Messages without the group_by_attr are dropped, the rest of the batch is fed
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address",
+                          aggregates=Aggregates([{"name": "nodes", "function": "count"}]))
+        t.feed_many([{"ip_address": "127.0.0.1"}, {"hostname": "node02"}, {"ip_address": "127.0.0.3"}])
+        self.assertEqual(list(t.persistence.keys()), ["127.0.0.1", "127.0.0.3"])
+        self.assertEqual(t.get_aggregates(), {"test_target": {"nodes": 2}})
+        version = t.version
+        t.feed({"hostname": "node04"})
+        self.assertEqual(t.version, version)
+
+    def test_rest_api_target_expire(self):
+        """
+        Aged groups are evicted oldest first, refeeding a group moves it to the back of the expiry order
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", aging_time_sec=5)
+        for ip in ["127.0.0.1", "127.0.0.2", "127.0.0.3"]:
+            t.feed({"ip_address": ip})
+        t.feed({"ip_address": "127.0.0.1"})
+        for i, record in enumerate(t.persistence.values()):
+            record["timestamp"] = time.time() - 10 + i * 4
+
+        version = t.version
+        t.expire()
+        self.assertEqual(list(t.persistence.keys()), ["127.0.0.1"])
+        self.assertEqual(t.get_data(), {"test_target": [t.persistence["127.0.0.1"]]})
+        self.assertGreater(t.version, version)
+
+    def test_rest_api_target_changes_since(self):
+        """
+        Only groups fed or expired after the given version are returned, along with the current version
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", aging_time_sec=5)
+        for ip in ["127.0.0.1", "127.0.0.2", "127.0.0.3"]:
+            t.feed({"ip_address": ip})
+        changes = t.get_changes_since(0)
+        self.assertEqual(len(changes["test_target"]), 3)
+        self.assertEqual((changes["seq"], changes["full"]), (3, False))
+
+        t.feed({"ip_address": "127.0.0.2"})
+        t.persistence["127.0.0.1"]["timestamp"] = time.time() - 20
+        t.expire()
+        changes = t.get_changes_since(3)
+        self.assertEqual([record["ip_address"] for record in changes["test_target"]], ["127.0.0.2"])
+        self.assertEqual(changes["expired"], ["127.0.0.1"])
+        self.assertEqual(t.get_changes_since(changes["seq"])["test_target"], [])
+
+        # changes older than the remembered expired groups can't be told, the full state is returned
+        t.MAX_EXPIRED_GROUPS = 1
+        t.persistence["127.0.0.3"]["timestamp"] = time.time() - 20
+        t.expire()
+        changes = t.get_changes_since(3)
+        self.assertTrue(changes["full"])
+        self.assertEqual([record["ip_address"] for record in changes["test_target"]], ["127.0.0.2"])
+
+    def test_rest_api_target_history(self):
+        """
+        Fed records are added to the history, the history of expired groups is kept until its retention passed
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", history=History(size=10, retention_sec=60))
+        t.feed({"ip_address": "127.0.0.1", "cpu_load": 1.5})
+        t.feed({"ip_address": "127.0.0.1", "cpu_load": 2.5})
+        history = t.get_history(start=None, end=time.time() + 1)
+        self.assertEqual(history["test_target"]["127.0.0.1"]["cpu_load"], [1.5, 2.5])
+
+        t.persistence["127.0.0.1"]["timestamp"] = time.time() - 20
+        t.expire()
+        history = t.get_history(start=0, end=time.time() + 1)
+        self.assertEqual(history["test_target"]["127.0.0.1"]["cpu_load"], [1.5, 2.5])
+        with patch("time.time", return_value=time.time() + 60):
+            t.expire()
+        self.assertEqual(t.get_history(start=0, end=time.time() + 1), {"test_target": {}})
+
+    def test_rest_api_target_aggregates(self):
+        """
+        Aggregates follow feeds and expiry and are part of each snapshot
+        """
+        aggregates = Aggregates([
+            {"name": "live_nodes", "function": "count"},
+            {"name": "max_load", "function": "max", "field": "cpu_load"}
+        ])
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", aggregates=aggregates)
+        t.feed({"ip_address": "127.0.0.1", "cpu_load": 80})
+        t.feed({"ip_address": "127.0.0.2", "cpu_load": 20})
+        t.feed({"ip_address": "127.0.0.1", "cpu_load": 10})
+        self.assertEqual(t.get_aggregates(), {"test_target": {"live_nodes": 2, "max_load": 20}})
+
+        t.persistence["127.0.0.2"]["timestamp"] = time.time() - 20
+        t.expire()
+        self.assertEqual(t.get_aggregates(), {"test_target": {"live_nodes": 1, "max_load": 10}})
+
+    def test_rest_api_target_stream(self):
+        """
+        A subscriber gets a snapshot, then updates, and a new snapshot once it falls behind the backlog
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", events=EventBroadcaster(backlog=2))
+        t.feed({"ip_address": "127.0.0.1", "cpu_load": 1})
+        stream = t._stream(None)
+        self.assertTrue(next(stream).startswith(b"id: 1\nevent: snapshot\n"))
+        self.assertEqual(t.events.subscribers, 1)
+
+        t.feed({"ip_address": "127.0.0.2", "cpu_load": 2})
+        event = next(stream)
+        self.assertTrue(event.startswith(b"id: 2\nevent: update\n"))
+        self.assertIn(b'"127.0.0.2"', event)
+        self.assertNotIn(b'"127.0.0.1"', event)
+
+        for i in range(3):
+            t.feed({"ip_address": "127.0.0.3", "cpu_load": i})
+        self.assertTrue(next(stream).startswith(b"id: 5\nevent: snapshot\n"))
+        stream.close()
+        self.assertEqual(t.events.subscribers, 0)
+
+    def test_rest_api_target_stream_needs_threads(self):
+        """
+        A server answering one request at a time per worker refuses streams instead of being held by a subscriber
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", events=EventBroadcaster())
+        with app.test_request_context("/test_target/stream", environ_overrides={"wsgi.multithread": False}):
+            response = t.serve_stream()
+        self.assertEqual(response.status_code, 501)
+        self.assertIn("?since=", response.get_json()["description"])
+        self.assertEqual(t.events.subscribers, 0)
+        with app.test_request_context("/test_target/stream", environ_overrides={"wsgi.multithread": True}):
+            response = t.serve_stream()
+        self.assertEqual(response.mimetype, "text/event-stream")
+        response.close()
+
+    def test_rest_action_loads_script_once(self):
+        """
+        The script is imported when the action is registered, calls don't touch sys.path,
+        a modified script is loaded again and a script without a matching main() is rejected
+        """
+        with tempfile.TemporaryDirectory() as script_dir:
+            script_path = os.path.join(script_dir, "test_rest_action_script.py")
+            with open(script_path, "w") as f:
+                f.write("def main(number):\n    return number * 2\n")
+            action = RESTAction("test_rest_action", "/test_rest_action", script_path, [{"name": "n", "type": "int"}])
+            action.register()
+            path_length = len(sys.path)
+            with app.test_request_context("/test_rest_action/2"):
+                self.assertEqual(action(n=2).get_json()["response"], 4)
+                self.assertEqual(action(n=3).get_json()["response"], 6)
+            self.assertEqual(len(sys.path), path_length)
+
+            with open(script_path, "w") as f:
+                f.write("def main(number):\n    return number * 3\n")
+            os.utime(script_path, (time.time() + 10, time.time() + 10))
+            action.reload_if_changed()
+            with app.test_request_context("/test_rest_action/2"):
+                self.assertEqual(action(n=2).get_json()["response"], 6)
+
+            with open(script_path, "w") as f:
+                f.write("def main():\n    return None\n")
+            with self.assertRaises(AttributeError):
+                action.load()
+            RESTAction._registered.remove(action)
+
+    def test_rest_action_max_parallel(self):
+        """
+        max_parallel (like the other settings of the script) of the action is passed to the script, which must take
+        it
+        """
+        with tempfile.TemporaryDirectory() as script_dir:
+            script_path = os.path.join(script_dir, "test_parallel_action_script.py")
+            with open(script_path, "w") as f:
+                f.write("def main(nodes, max_parallel=8):\n    return max_parallel\n")
+            action = RESTAction("test_parallel_action", "/test_parallel_action", script_path,
+                                [{"name": "nodes", "type": "string"}], max_parallel=3)
+            action.load()
+            with app.test_request_context("/test_parallel_action/1-4"):
+                self.assertEqual(action(nodes="1-4").get_json()["response"], 3)
+
+            with open(script_path, "w") as f:
+                f.write("def main(nodes):\n    return None\n")
+            with self.assertRaises(AttributeError):
+                action.load()
+
+        config = {"log_level": "INFO", "rest_actions": [
+            {"action_name": "a", "rest_route": "/a", "script_path": "a.py", "argument_list": [], "max_parallel": 0}
+        ]}
+        self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
+        config["rest_actions"][0] = {"action_name": "a", "rest_route": "/a", "script_path": "a.py",
+                                     "argument_list": [], "cache_ttl_sec": 30, "cache_stale_sec": 0}
+        LighthouseFactory._validate_config_file(config)
+        for key, value in [("cache_ttl_sec", -1), ("cache_stale_sec", "5m")]:
+            config["rest_actions"][0][key] = value
+            self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
+            config["rest_actions"][0][key] = 0
+
+    def test_rest_action_async(self):
+        """
+        An async action returns a job id right away, the script runs on the job pool
+        """
+        jobs = Mock()
+        jobs.submit.return_value = {"id": "0123abcd"}
+        action = RESTAction("test_async_action", "/test_async_action", "test_script.py", [], jobs=jobs)
+        action._main = Mock()
+        with app.test_request_context("/test_async_action"):
+            response = action()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()["job_id"], "0123abcd")
+        self.assertEqual(response.headers["Location"], "/jobs/0123abcd")
+        jobs.submit.assert_called_once()
+        name, function, arguments = jobs.submit.call_args[0]
+        self.assertEqual((name, arguments), ("test_async_action", []))
+        action._main.assert_not_called()
+        # the job runs the script, measured like a synchronous call
+        function(*arguments)
+        action._main.assert_called_once_with()
+        self.assertEqual(sum(action.metrics.duration.counts), 1)
+
+    def test_rest_action_limits(self):
+        """
+        Calls beyond the concurrency limit are rejected at once, calls running past the timeout are abandoned
+        """
+        release = threading.Event()
+        action = RESTAction("test_limited_action", "/test_limited_action", "test_script.py", [],
+                            timeout_sec=0.1, max_concurrency=1)
+        action._main = Mock(side_effect=lambda: release.wait(5))
+        running = threading.Thread(target=lambda: self.assertRaises(ActionTimeoutError, action._execute_limited,
+                                                                    action._main))
+        with patch.object(RESTAction, "TIMEOUT_GRACE_SEC", 0):
+            running.start()
+            while action._limit.running == 0:
+                time.sleep(0.001)
+            with app.test_request_context("/test_limited_action"), self.assertRaises(ActionBusyError):
+                action()
+            running.join()
+        # the slot is only freed once the script returned
+        self.assertEqual(action._limit.running, 1)
+        release.set()
+        action._timeout_executor.shutdown(wait=True)
+        self.assertEqual(action._limit.running, 0)
+        self.assertEqual(RESTAction._handle_action_busy(ActionBusyError())[1], 429)
+
+    def test_config_aging_time_sec(self):
+        config = {
+            "log_level": "INFO",
+            "ipc_rest_adapters": [
+                {"adapter_name": "a", "ipc_queue": "/a", "rest_route": "/a", "aging_time_sec": 0}
+            ]
+        }
+        with self.assertRaises(ConfigFileInvalidError):
+            LighthouseFactory._validate_config_file(config)
+        config["ipc_rest_adapters"][0]["aging_time_sec"] = 2.5
+        LighthouseFactory._validate_config_file(config)
+
+    def test_lighthouse_metrics(self):
+        """
+        /metrics reports the messages fed by the adapters, the groups of the targets, the requests and the actions
+        """
+        source = Mock(spec=Source)
+        source.get_message.side_effect = [{"ip": "10.0.0.1"}, {"ip": "10.0.0.2"}, None]
+        source.size.return_value = 7
+        target = RESTAPITarget("/test_metrics_target", group_by_attr="ip", aging_time_sec=0.05)
+        lighthouse = Lighthouse({})
+        lighthouse._adapters.append(Adapter(name="test_adapter", source=source, target=target, batch_size=8,
+                                           batch_time_usec=10 ** 6))
+        lighthouse._adapters[0].update()
+        target.feed({"ip": "10.0.0.3"})
+        time.sleep(0.06)
+        target.expire()
+        target.feed({"ip": "10.0.0.1"})
+
+        action = RESTAction("test_metrics_action", "/test_metrics_action", "test_script.py", [])
+        action._main = Mock(side_effect=[{"result": "success"}, {"result": "failed"}])
+        lighthouse._actions.append(action)
+        with app.test_request_context("/test_metrics_action"):
+            action()
+            action()
+
+        with app.test_request_context("/metrics"):
+            app.preprocess_request()
+            response = app.process_response(app.view_functions["metrics"]())
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertIn('lighthouse_adapter_messages_total{adapter="test_adapter"} 2', lines)
+        self.assertIn('lighthouse_adapter_messages_per_second{adapter="test_adapter"} 0.2', lines)
+        self.assertIn('lighthouse_adapter_queue_depth{adapter="test_adapter"} 7', lines)
+        self.assertIn('lighthouse_adapter_feed_latency_seconds_count{adapter="test_adapter"} 1', lines)
+        self.assertIn('lighthouse_target_live_groups{target="test_metrics_target"} 1', lines)
+        self.assertIn('lighthouse_target_expired_groups_total{target="test_metrics_target"} 3', lines)
+        self.assertIn('lighthouse_action_duration_seconds_count{action="test_metrics_action"} 2', lines)
+        self.assertIn('lighthouse_action_failures_total{action="test_metrics_action",reason="failed"} 1', lines)
+        self.assertIn('lighthouse_action_failures_total{action="test_metrics_action",reason="error"} 0', lines)
+        # the scrape itself is the first request measured on /metrics
+        self.assertIn(
+            'lighthouse_http_request_duration_seconds_count{route="/metrics",method="GET",status="200"} 1',
+            lighthouse.get_metrics().splitlines()
+        )
+
+    def test_lighthouse_stop_wakes_main_loop(self):
+        """
+        The main loop blocks while no messages arrive, stop() should still end it promptly
+        """
+        lighthouse = Lighthouse({})
+        lighthouse.IDLE_TIMEOUT_SEC = 60
+        lighthouse.start()
+        lighthouse.stop()
+        lighthouse.join(timeout=1)
+        self.assertFalse(lighthouse.is_alive())
+
+    def test_lighthouse_stop_before_start(self):
+        """
+        A stop() called before the main loop runs ends it at once, and a wake-up is consumed instead of busy-looping
+        """
+        lighthouse = Lighthouse({})
+        lighthouse.stop()
+        lighthouse.start()
+        lighthouse.join(timeout=1)
+        self.assertFalse(lighthouse.is_alive())
+
+        lighthouse = Lighthouse({})
+        lighthouse.IDLE_TIMEOUT_SEC = 60
+        lighthouse.start()
+        os.write(lighthouse._wakeup_write, b"\0")
+        time.sleep(0.1)
+        os.set_blocking(lighthouse._wakeup_read, False)
+        self.assertRaises(BlockingIOError, os.read, lighthouse._wakeup_read, 1)
+        lighthouse.stop()
+        lighthouse.join(timeout=1)
+        self.assertFalse(lighthouse.is_alive())
+
+    def test_lighthouse_polls_sources_without_fileno(self):
+        """
+        Sources that can't be waited on are still polled by the main loop
+        """
+        source = Mock(spec=Source)
+        source.fileno.return_value = None
+        source.get_message.side_effect = [{"key": "value"}] + [None] * 1000
+        target = Mock(spec=Target)
+        lighthouse = Lighthouse({})
+        lighthouse._adapters.append(Adapter(name="test_adapter", source=source, target=target))
+        lighthouse.start()
+        for _ in range(100):
+            if target.feed.called:
+                break
+            time.sleep(0.01)
+        lighthouse.stop()
+        lighthouse.join(timeout=1)
+        target.feed.assert_called_once_with({"key": "value"})
+
+    def test_lighthouse_survives_failing_adapter(self):
+        """
+        A message the target fails on is dropped and ingesting goes on. If the main loop dies anyway, the ingest
+        lock is released so that another process takes over
+        """
+        source = Mock(spec=Source)
+        source.fileno.return_value = None
+        source.get_message.side_effect = [{"key": "bad"}, {"key": "good"}] + [None] * 1000
+        target = Mock(spec=Target)
+        target.feed.side_effect = [KeyError("ip_address"), None]
+        lighthouse = Lighthouse({})
+        lighthouse._adapters.append(Adapter(name="test_adapter", source=source, target=target))
+        lighthouse.start()
+        for _ in range(100):
+            if target.feed.call_count == 2:
+                break
+            time.sleep(0.01)
+        self.assertTrue(lighthouse.is_alive())
+        lighthouse.stop()
+        lighthouse.join(timeout=1)
+        target.feed.assert_called_with({"key": "good"})
+
+        target.expire.side_effect = RuntimeError("bug")
+        lighthouse = Lighthouse({})
+        lighthouse._adapters.append(Adapter(name="test_adapter", source=source, target=target))
+        lighthouse._ingest_lock = Mock(spec=IngestLock)
+        lighthouse._ingest_lock.try_acquire.return_value = True
+        with patch("threading.excepthook"):
+            lighthouse.start()
+            lighthouse.join(timeout=1)
+        self.assertFalse(lighthouse.is_alive())
+        lighthouse._ingest_lock.release.assert_called_once()
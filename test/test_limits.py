@@ -0,0 +1,33 @@
+import threading
+from unittest import TestCase
+
+from lighthouse.limits import ConcurrencyLimit, ActionBusyError, ActionQueueTimeoutError
+
+
+class ConcurrencyLimitTest(TestCase):
+    def test_rejects_beyond_queue(self):
+        limit = ConcurrencyLimit(max_concurrency=1, max_queue=0)
+        limit.acquire()
+        with self.assertRaises(ActionBusyError):
+            limit.acquire()
+        limit.release()
+        limit.acquire()
+
+    def test_queued_caller_gets_released_slot(self):
+        limit = ConcurrencyLimit(max_concurrency=1, max_queue=1)
+        limit.acquire()
+        with self.assertRaises(ActionQueueTimeoutError):
+            limit.acquire(timeout=0.05)
+
+        acquired = threading.Event()
+        waiter = threading.Thread(target=lambda: (limit.acquire(timeout=5), acquired.set()))
+        waiter.start()
+        while limit.waiting == 0:
+            pass
+        # the queue holds a single caller
+        with self.assertRaises(ActionBusyError):
+            limit.acquire()
+        limit.release()
+        self.assertTrue(acquired.wait(5))
+        waiter.join()
+        self.assertEqual((limit.running, limit.waiting), (1, 0))
@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+from lighthouse.metrics import Histogram, IngestMetrics, RouteMetrics, MetricsWriter
+
+
+class MetricsTest(TestCase):
+    def test_histogram_render(self):
+        """
+        Buckets are rendered cumulative, with the values above the last bucket in +Inf
+        """
+        histogram = Histogram(buckets=(0.1, 1))
+        for value in [0.05, 0.1, 0.5, 2]:
+            histogram.observe(value)
+        writer = MetricsWriter()
+        writer.family("test_seconds", "histogram", "Test")
+        writer.histogram("test_seconds", {"route": '/a"b'}, histogram)
+        self.assertEqual(writer.text().splitlines(), [
+            "# HELP test_seconds Test",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{route="/a\\"b",le="1"} 3',
+            'test_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+            'test_seconds_sum{route="/a\\"b"} 2.65',
+            'test_seconds_count{route="/a\\"b"} 4'
+        ])
+
+    def test_ingest_metrics_rate(self):
+        """
+        The rate only counts the messages fed within the window
+        """
+        metrics = IngestMetrics()
+        metrics.record(100, 0.001, now=1000.5)
+        metrics.record(30, 0.001, now=1015.2)
+        metrics.record(20, 0.001, now=1016.7)
+        self.assertEqual(metrics.messages, 150)
+        self.assertEqual(metrics.rate(now=1020), 5)
+        self.assertEqual(metrics.rate(now=1040), 0)
+
+    def test_ingest_metrics_state(self):
+        """
+        Other processes get the counters and the latency histogram of the ingest process
+        """
+        metrics = IngestMetrics()
+        metrics.record(3, 0.002, now=1000)
+        copy = IngestMetrics()
+        copy.load_state(metrics.export_state())
+        self.assertEqual(copy.messages, 3)
+        self.assertEqual(copy.rate(now=1005), 0.3)
+        self.assertEqual(copy.feed_latency.export_state(), metrics.feed_latency.export_state())
+
+    def test_route_metrics(self):
+        """
+        Requests are counted per route, method and status
+        """
+        metrics = RouteMetrics()
+        metrics.observe("/nodes_status", "GET", 200, 0.001)
+        metrics.observe("/nodes_status", "GET", 200, 0.002)
+        metrics.observe("/nodes_status", "GET", 304, 0.001)
+        counts = {key: sum(histogram.counts) for key, histogram in metrics.items()}
+        self.assertEqual(counts, {("/nodes_status", "GET", 200): 2, ("/nodes_status", "GET", 304): 1})
@@ -0,0 +1,82 @@
+import json
+import pickle
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lighthouse.adapter import Adapter, Source
+from lighthouse.lighthouse import RESTAPITarget, LighthouseFactory, ConfigFileInvalidError
+from lighthouse.passthrough import JSONPassthrough, EncodedRecord
+from lighthouse.schema import MessageRejectedError
+
+
+class PassthroughTest(TestCase):
+    def test_decode(self):
+        """
+        JSON objects are kept as received, with the timestamp appended once stamped. Other messages are rejected
+        """
+        record = JSONPassthrough.decode(b'{"ip_address": "10.0.0.1", "cpu_usage": 12.5}\n')
+        self.assertEqual(record, {"ip_address": "10.0.0.1", "cpu_usage": 12.5})
+        record.stamp(1.5)
+        self.assertEqual(record.encoded, b'{"ip_address": "10.0.0.1", "cpu_usage": 12.5,"timestamp":1.5}')
+        self.assertEqual(json.loads(record.encoded), record)
+
+        empty = JSONPassthrough.decode(b"{}")
+        empty.stamp(2.0)
+        self.assertEqual(json.loads(empty.encoded), {"timestamp": 2.0})
+        stamped = JSONPassthrough.decode(b'{"ip_address": "10.0.0.1", "timestamp": 0}')
+        stamped.stamp(3.0)
+        self.assertEqual(json.loads(stamped.encoded), {"ip_address": "10.0.0.1", "timestamp": 3.0})
+
+        for message in [b"[1, 2]", b'"text"', b"{not json", b"\xff"]:
+            self.assertRaises(MessageRejectedError, JSONPassthrough.decode, message)
+
+    def test_decode_utf8_only(self):
+        """
+        JSON in other encodings, or UTF-8 with a byte order mark, is rejected: its text couldn't be served as is
+        """
+        message = '{"hostname": "n\u00f6de01"}'
+        self.assertEqual(JSONPassthrough.decode(message.encode("utf-8")).encoded, message.encode("utf-8"))
+        for encoding in ["utf-16", "utf-16-le", "utf-32", "utf-8-sig"]:
+            self.assertRaises(MessageRejectedError, JSONPassthrough.decode, message.encode(encoding))
+
+    def test_passthrough_target(self):
+        """
+        A passthrough target serves the same data as the JSON texts of its records, and shares them with other
+        processes
+        """
+        target = RESTAPITarget("/test_passthrough", group_by_attr="ip_address", passthrough=True)
+        source = Mock(spec=Source)
+        source.get_message.side_effect = [
+            b'{"ip_address": "10.0.0.1", "cpu_usage": 1}', b'{"ip_address": "10.0.0.2", "cpu_usage": 2}',
+            b"malformed", b'{"ip_address": "10.0.0.1", "cpu_usage": 3}', None
+        ]
+        # the batch ends with the messages, not with a pause (e.g. of the garbage collector) longer than the default
+        adapter = Adapter(name="test_adapter", source=source, target=target, batch_size=8, batch_time_usec=10 ** 6,
+                          decoder=JSONPassthrough())
+        self.assertTrue(adapter.update())
+        self.assertEqual((adapter.metrics.messages, adapter.metrics.rejected), (3, 1))
+
+        body, _ = target.get_serialized_data()
+        self.assertEqual(json.loads(body), target.get_data())
+        self.assertEqual([record["cpu_usage"] for record in json.loads(body)["test_passthrough"]], [2, 3])
+        copy = pickle.loads(pickle.dumps(target._snapshot._asdict()))
+        self.assertIs(type(copy["persistence"]["10.0.0.1"]), EncodedRecord)
+        self.assertEqual(copy["persistence"]["10.0.0.1"].encoded, target.persistence["10.0.0.1"].encoded)
+
+        single = RESTAPITarget("/test_passthrough_single", aging_time_sec=0.05, passthrough=True)
+        self.assertEqual(single.get_serialized_data()[0], b"{}")
+        single.feed(JSONPassthrough.decode(b'{"cpu_usage": 1}'))
+        self.assertEqual(json.loads(single.get_serialized_data()[0]), single.get_data())
+
+    def test_config_passthrough(self):
+        """
+        passthrough is a boolean and excludes a schema
+        """
+        adapter = {"adapter_name": "a", "ipc_queue": "/a", "rest_route": "/a", "passthrough": True}
+        config = {"log_level": "INFO", "ipc_rest_adapters": [adapter]}
+        LighthouseFactory._validate_config_file(config)
+        adapter["passthrough"] = "yes"
+        self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
+        adapter["passthrough"] = True
+        adapter["schema"] = {"fields": [{"name": "cpu_usage", "type": "float"}]}
+        self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
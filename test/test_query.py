@@ -0,0 +1,158 @@
+import os
+import random
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from werkzeug.datastructures import MultiDict
+
+from lighthouse.lighthouse import RESTAPITarget, LighthouseFactory, ConfigFileInvalidError, app
+from lighthouse.passthrough import JSONPassthrough
+from lighthouse.query import Query, QueryError, FieldIndex
+from lighthouse.shared_state import SharedStateStore
+
+NODES = [
+    {"ip_address": "10.0.0.1", "hostname": "johnny01", "cpu_load": 10.0, "cores": 4},
+    {"ip_address": "10.0.0.2", "hostname": "johnny02", "cpu_load": 95.5, "cores": 8},
+    {"ip_address": "10.0.0.3", "hostname": "johnny03", "cpu_load": 85, "cores": 4},
+    {"ip_address": "10.0.0.4", "hostname": "johnny04", "cores": 4}
+]
+
+
+def _nodes():
+    return [dict(node) for node in NODES]
+
+
+class QueryTest(TestCase):
+    def test_from_args(self):
+        """
+        fields and since are not filters, _gt and _lt are ranges with a numeric bound
+        """
+        self.assertIsNone(Query.from_args(MultiDict({"since": "3"})))
+        args = {"fields": "ip_address,cpu_load", "hostname": "johnny03", "cpu_load_gt": "80"}
+        query = Query.from_args(MultiDict(args))
+        self.assertEqual(query.fields, ("ip_address", "cpu_load"))
+        self.assertEqual((query.equal, query.ranges), ((("hostname", "johnny03"),), (("cpu_load", "_gt", 80.0),)))
+        self.assertRaises(QueryError, Query.from_args, MultiDict({"cpu_load_lt": "high"}))
+
+    def test_cache_buster_ignored(self):
+        """
+        The _ cache buster is not a filter, any other parameter filters on a field, indexed or not
+        """
+        self.assertIsNone(Query.from_args(MultiDict({"_": "1234"})))
+        query = Query.from_args(MultiDict({"_": "1234", "hostname": "johnny03", "uptime_lt": "5"}))
+        self.assertEqual((query.equal, query.ranges), ((("hostname", "johnny03"),), (("uptime", "_lt", 5.0),)))
+
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        t.feed_many(_nodes())
+        with app.test_request_context("/test_target?_=1234"):
+            self.assertEqual(t().get_json(), t.get_data())
+        with app.test_request_context("/test_target?_=1234&hostname=johnny03"):
+            self.assertEqual([n["ip_address"] for n in t().get_json()["test_target"]], ["10.0.0.3"])
+        with app.test_request_context("/test_target?_=1234&cpu_load_gt=80"):
+            self.assertEqual([n["ip_address"] for n in t().get_json()["test_target"]], ["10.0.0.2", "10.0.0.3"])
+        with app.test_request_context("/test_target?hostnme=johnny03"):
+            self.assertEqual(t().get_json(), {"test_target": []})
+
+    def test_index_matches_scan(self):
+        """
+        After any sequence of changes, looking records up in an index finds the same records as a scan
+        """
+        rng = random.Random(1)
+        persistence = {}
+        index = FieldIndex("cores")
+        for _ in range(500):
+            group = rng.randrange(20)
+            if rng.random() < 0.2:
+                removed = persistence.pop(group, None)
+                changes = [(group, removed, None)] if removed is not None else []
+            else:
+                added = {"cores": rng.choice([1, 2, 2.0, 4.5, "4", True, None, float("nan"), [1]])}
+                changes = [(group, persistence.pop(group, None), added)]
+                persistence[group] = added
+            previous, index = index, index.updated(changes)
+            for args in [{"cores": "2"}, {"cores": "4"}, {"cores_gt": "1.5"}, {"cores_lt": "3"}]:
+                query = Query.from_args(MultiDict(args))
+                scanned = query.select(persistence, {}, "group")
+                self.assertEqual(query.select(persistence, {"cores": index}, "group"), scanned if "cores" in args
+                                 else sorted(scanned, key=lambda record: record["cores"]))
+        # earlier indexes are left untouched
+        rebuilt = FieldIndex.build("cores", persistence.items())
+        self.assertEqual(index.equal((2,)), rebuilt.equal((2,)))
+        self.assertIsNot(previous._groups_by_value, index._groups_by_value)
+
+    def test_target_query(self):
+        """
+        Records are filtered by equality on the group key and on fields, and by ranges, then projected
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", indexes=["hostname", "cpu_load"])
+        t.feed_many(_nodes())
+
+        def get(**args):
+            return t.get_query_data(Query.from_args(MultiDict(args)))["test_target"]
+
+        self.assertEqual([n["ip_address"] for n in get(hostname="johnny03")], ["10.0.0.3"])
+        self.assertEqual([n["ip_address"] for n in get(ip_address="10.0.0.2", cores="8")], ["10.0.0.2"])
+        self.assertEqual([n["ip_address"] for n in get(cpu_load_gt="80")], ["10.0.0.3", "10.0.0.2"])
+        self.assertEqual([n["ip_address"] for n in get(cpu_load_gt="80", cpu_load_lt="90")], ["10.0.0.3"])
+        self.assertEqual([n["ip_address"] for n in get(cores="4", cpu_load_lt="50")], ["10.0.0.1"])
+        self.assertEqual(get(hostname="unknown"), [])
+
+        t.persistence["10.0.0.1"]["timestamp"] = time.time() - 20
+        t.expire()
+        self.assertEqual(get(hostname="johnny01"), [])
+        t.feed({"ip_address": "10.0.0.3", "hostname": "johnny03", "cpu_load": 5.0, "cores": 4})
+        self.assertEqual([n["ip_address"] for n in get(cpu_load_gt="80")], ["10.0.0.2"])
+
+        with app.test_request_context("/test_target?fields=ip_address,cpu_load&cores=4"):
+            response = t()
+        self.assertEqual(response.get_json(), {"test_target": [
+            {"ip_address": "10.0.0.4"}, {"ip_address": "10.0.0.3", "cpu_load": 5.0}
+        ]})
+        with app.test_request_context("/test_target?cpu_load_gt=high"):
+            self.assertEqual(t().status_code, 400)
+
+    def test_target_query_cache(self):
+        """
+        The serialized response of a query is reused until data is fed, per query
+        """
+        t = RESTAPITarget("/test_target", group_by_attr="ip_address", passthrough=True)
+        for node in NODES:
+            t.feed(JSONPassthrough.decode(app.json.dumps(node).encode("utf-8")))
+        query = Query.from_args(MultiDict({"cores": "4"}))
+        body, etag = t.get_serialized_data(query)
+        self.assertEqual([n["hostname"] for n in app.json.loads(body)["test_target"]],
+                         ["johnny01", "johnny03", "johnny04"])
+        with patch.object(t, "get_query_data") as mock_query:
+            self.assertEqual(t.get_serialized_data(query), (body, etag))
+            mock_query.assert_not_called()
+        self.assertNotEqual(t.get_serialized_data(Query.from_args(MultiDict({"cores": "8"})))[1], etag)
+        t.feed(JSONPassthrough.decode(b'{"ip_address": "10.0.0.5", "cores": 4}'))
+        self.assertEqual(len(app.json.loads(t.get_serialized_data(query)[0])["test_target"]), 4)
+        projected = t.get_serialized_data(Query.from_args(MultiDict({"fields": "cores", "cores": "8"})))[0]
+        self.assertEqual(app.json.loads(projected), {"test_target": [{"cores": 8}]})
+
+    def test_replica_rebuilds_indexes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.state")
+            ingesting = RESTAPITarget("/test_target", group_by_attr="ip_address", indexes=["hostname"])
+            ingesting.attach_store(SharedStateStore(path))
+            ingesting.begin_ingest()
+            replica = RESTAPITarget("/test_target", group_by_attr="ip_address", indexes=["hostname"])
+            replica.attach_store(SharedStateStore(path))
+
+            ingesting.feed_many(_nodes())
+            ingesting.publish()
+            query = Query.from_args(MultiDict({"hostname": "johnny02"}))
+            self.assertEqual(replica.get_query_data(query), ingesting.get_query_data(query))
+            self.assertEqual(replica._snapshot.indexes["hostname"].equal(("johnny02",)), ["10.0.0.2"])
+
+    def test_config_indexes(self):
+        adapter = {"adapter_name": "a", "ipc_queue": "/a", "rest_route": "/a", "indexes": ["hostname"]}
+        config = {"log_level": "INFO", "ipc_rest_adapters": [adapter]}
+        self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
+        adapter["group_by_attrib"] = "ip_address"
+        LighthouseFactory._validate_config_file(config)
+        adapter["indexes"] = "hostname"
+        self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
@@ -0,0 +1,101 @@
+import pickle
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lighthouse.adapter import Adapter, Source
+from lighthouse.lighthouse import RESTAPITarget, LighthouseFactory, ConfigFileInvalidError
+from lighthouse.schema import Schema, MessageRejectedError
+
+FIELDS = [
+    {"name": "ip_address", "type": "str", "size": 15},
+    {"name": "cpu_usage", "type": "float"},
+    {"name": "cores", "type": "int"},
+    {"name": "online", "type": "bool"}
+]
+BEACON = {"ip_address": "10.0.0.1", "cpu_usage": 12.5, "cores": 4, "online": True}
+
+
+class SchemaTest(TestCase):
+    def test_decode_pickle(self):
+        """
+        Pickled dicts are decoded into records read like the dict, ints are accepted for float fields
+        """
+        schema = Schema("test_pickle", FIELDS)
+        record = schema.decode(pickle.dumps({**BEACON, "cpu_usage": 12}))
+        self.assertEqual(record, {**BEACON, "cpu_usage": 12.0})
+        self.assertIsInstance(record["cpu_usage"], float)
+        self.assertFalse(hasattr(record, "__dict__"))
+        record["timestamp"] = 1.5
+        self.assertEqual(record.get("timestamp"), 1.5)
+        self.assertIsNone(record.get("unknown"))
+        with self.assertRaises(KeyError):
+            record["unknown"] = 1
+
+    def test_decode_struct(self):
+        """
+        Messages with the binary layout of the schema are decoded into the same records
+        """
+        schema = Schema("test_struct", FIELDS, "struct")
+        message = schema.encode(BEACON)
+        self.assertEqual(len(message), 15 + 8 + 8 + 1)
+        self.assertEqual(schema.decode(message), BEACON)
+
+    def test_reject(self):
+        """
+        Messages with missing, unknown or mistyped fields, or that can't be decoded at all, are rejected
+        """
+        schema = Schema("test_reject", FIELDS)
+        struct_schema = Schema("test_reject_struct", FIELDS, "struct")
+        for message in [
+            pickle.dumps({key: value for key, value in BEACON.items() if key != "cores"}),
+            pickle.dumps({**BEACON, "extra": 1}),
+            pickle.dumps({**BEACON, "cores": "4"}),
+            pickle.dumps({**BEACON, "cores": True}),
+            pickle.dumps([BEACON]),
+            b"not a pickle"
+        ]:
+            self.assertRaises(MessageRejectedError, schema.decode, message)
+        self.assertRaises(MessageRejectedError, struct_schema.decode, struct_schema.encode(BEACON)[:-1])
+        self.assertRaises(MessageRejectedError, struct_schema.decode, b"\xff" * 32)
+        self.assertRaises(MessageRejectedError, struct_schema.encode, {**BEACON, "ip_address": "1" * 16})
+
+    def test_records_in_target(self):
+        """
+        A target stores and serves records like dicts, and shares them with other processes
+        """
+        schema = Schema("test_target_schema", FIELDS, "struct")
+        target = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        source = Mock(spec=Source)
+        source.get_message.side_effect = [schema.encode(BEACON), b"malformed", None]
+        adapter = Adapter(name="test_adapter", source=source, target=target, batch_size=8, decoder=schema)
+        self.assertTrue(adapter.update())
+        self.assertEqual((adapter.metrics.messages, adapter.metrics.rejected), (1, 1))
+
+        body, _ = target.get_serialized_data()
+        self.assertIn(b'"ip_address":"10.0.0.1"', body)
+        self.assertIn(b'"timestamp":', body)
+        copy = pickle.loads(pickle.dumps(target._snapshot._asdict()))
+        self.assertEqual(copy["persistence"]["10.0.0.1"], target.persistence["10.0.0.1"])
+        self.assertIs(type(copy["persistence"]["10.0.0.1"]), schema.record_class)
+
+    def test_config_schema(self):
+        """
+        The fields of a schema need a name and a known type, str fields of the struct format a size
+        """
+        adapter = {"adapter_name": "a", "ipc_queue": "/a", "rest_route": "/a", "group_by_attrib": "ip_address"}
+        config = {"log_level": "INFO", "ipc_rest_adapters": [adapter]}
+        adapter["schema"] = {"format": "struct", "fields": FIELDS}
+        LighthouseFactory._validate_config_file(config)
+        for schema in [
+            {"fields": []},
+            {"format": "json", "fields": FIELDS},
+            {"fields": FIELDS + [{"name": "load", "type": "double"}]},
+            {"fields": FIELDS + [{"name": "timestamp", "type": "float"}]},
+            {"fields": FIELDS + [{"name": "self", "type": "int"}]},
+            {"fields": FIELDS + [{"name": "get", "type": "int"}]},
+            {"fields": FIELDS + [{"name": "as_dict", "type": "int"}]},
+            {"format": "struct", "fields": FIELDS + [{"name": "hostname", "type": "str"}]},
+            {"fields": FIELDS[1:]}
+        ]:
+            adapter["schema"] = schema
+            self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
@@ -0,0 +1,191 @@
+import json
+import os
+import struct
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from werkzeug.datastructures import MultiDict
+
+from lighthouse.aggregates import Aggregates
+from lighthouse.events import EventBroadcaster
+from lighthouse.history import History
+from lighthouse.lighthouse import RESTAPITarget, app
+from lighthouse.query import Query
+from lighthouse.shared_state import SharedStateStore, IngestLock, StateUnavailableError
+
+
+class SharedStateTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "test.state")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_store_publish_read(self):
+        """
+        A payload published through one mapping is read through another, including after the file grew
+        """
+        writer = SharedStateStore(self.path)
+        reader = SharedStateStore(self.path)
+        self.assertEqual(reader.read(), (0, None))
+
+        writer.publish(b"first")
+        self.assertEqual(reader.read(), (2, b"first"))
+
+        big_payload = b"x" * (SharedStateStore.INITIAL_SIZE * 3)
+        writer.publish(big_payload)
+        self.assertEqual(reader.sequence, 4)
+        self.assertEqual(reader.read(), (4, big_payload))
+
+    def test_replica_target_follows_ingesting_target(self):
+        """
+        A replica target serves the state fed into the ingesting target once it is published
+        """
+        ingesting = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        ingesting.attach_store(SharedStateStore(self.path))
+        ingesting.begin_ingest()
+        replica = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        replica.attach_store(SharedStateStore(self.path))
+
+        ingesting.feed({"ip_address": "127.0.0.1"})
+        self.assertEqual(replica.get_data(), {"test_target": []})
+
+        ingesting.publish()
+        self.assertEqual(replica.get_data()["test_target"][0]["ip_address"], "127.0.0.1")
+        self.assertEqual(replica.version, ingesting.version)
+
+    def test_replica_serves_published_response(self):
+        """
+        A replica answers plain requests with the response published by the ingest process, without loading the
+        snapshot, and loads the snapshot for other requests at most every REPLICA_SYNC_INTERVAL_SEC
+        """
+        response_path = os.path.join(self.tmp_dir.name, "test.response")
+        ingesting = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        ingesting.attach_store(SharedStateStore(self.path), response_store=SharedStateStore(response_path))
+        ingesting.begin_ingest()
+        replica = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        replica.attach_store(SharedStateStore(self.path), response_store=SharedStateStore(response_path))
+
+        ingesting.feed({"ip_address": "127.0.0.1"})
+        ingesting.publish()
+        self.assertEqual(replica.get_serialized_data(), ingesting.get_serialized_data())
+        self.assertEqual(replica.version, 0)
+
+        self.assertEqual(replica.group_counts(), (1, 0))
+        ingesting.feed({"ip_address": "127.0.0.2"})
+        ingesting.publish()
+        self.assertEqual(replica.get_serialized_data(), ingesting.get_serialized_data())
+        self.assertEqual(replica.group_counts(), (1, 0))
+        replica._synced_at -= RESTAPITarget.REPLICA_SYNC_INTERVAL_SEC
+        self.assertEqual(replica.group_counts(), (2, 0))
+
+    def test_replica_answers_newer_requests_at_once(self):
+        """
+        Queries, aggregates and a ?since= seq newer than the snapshot of a replica reload it within the
+        REPLICA_SYNC_INTERVAL_SEC, so that a seq from the ingest process gets only the changes
+        """
+        ingesting = RESTAPITarget("/test_target", group_by_attr="ip_address",
+                                  aggregates=Aggregates([{"name": "nodes", "function": "count"}]))
+        ingesting.attach_store(SharedStateStore(self.path))
+        ingesting.begin_ingest()
+        replica = RESTAPITarget("/test_target", group_by_attr="ip_address",
+                                aggregates=Aggregates([{"name": "nodes", "function": "count"}]))
+        replica.attach_store(SharedStateStore(self.path))
+        ingesting.feed_many([{"ip_address": f"127.0.0.{n}"} for n in range(100)])
+        ingesting.publish()
+        self.assertEqual(replica.group_counts(), (100, 0))
+
+        ingesting.feed({"ip_address": "127.0.0.1"})
+        ingesting.publish()
+        since = ingesting.get_changes_since(0)["seq"]
+        ingesting.feed({"ip_address": "127.0.0.2"})
+        ingesting.publish()
+        changes = replica.get_changes_since(since)
+        self.assertEqual((len(changes["test_target"]), changes["full"]), (1, False))
+
+        ingesting.feed({"ip_address": "127.0.1.1"})
+        ingesting.publish()
+        self.assertEqual(replica.get_aggregates(), {"test_target": {"nodes": 101}})
+        ingesting.feed({"ip_address": "127.0.1.2"})
+        ingesting.publish()
+        query = Query.from_args(MultiDict({"ip_address": "127.0.1.2"}))
+        self.assertEqual(replica.get_serialized_data(query), ingesting.get_serialized_data(query))
+
+    def test_replica_keeps_last_state_of_stuck_store(self):
+        """
+        A replica keeps serving the state it read last while the store is stuck in a write, and answers 503 if it
+        never read any
+        """
+        ingesting = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        ingesting.attach_store(SharedStateStore(self.path))
+        ingesting.begin_ingest()
+        replica = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        replica.attach_store(SharedStateStore(self.path))
+        ingesting.feed({"ip_address": "127.0.0.1"})
+        ingesting.publish()
+        self.assertEqual(len(replica.get_data()["test_target"]), 1)
+
+        # as if the ingest process died while publishing
+        struct.pack_into("<Q", ingesting.store._map, 0, ingesting.store.sequence + 3)
+        new_replica = RESTAPITarget("/test_target_stuck", group_by_attr="ip_address")
+        new_replica.attach_store(SharedStateStore(self.path))
+        with patch.object(SharedStateStore, "READ_RETRY_SEC", 0.01):
+            replica._synced_at = 0.0
+            self.assertEqual(len(replica.get_data()["test_target"]), 1)
+            self.assertRaises(StateUnavailableError, new_replica.get_data)
+            app.add_url_rule("/test_target_stuck", "test_target_stuck", new_replica)
+            self.assertEqual(app.test_client().get("/test_target_stuck").status_code, 503)
+
+            # a new ingest process repairs the store
+            new_replica.begin_ingest()
+            new_replica.feed({"ip_address": "127.0.0.2"})
+            new_replica.publish()
+        replica._synced_at = 0.0
+        self.assertEqual([n["ip_address"] for n in replica.get_data()["test_target"]], ["127.0.0.2"])
+
+    def test_replica_target_follows_history(self):
+        history_path = os.path.join(self.tmp_dir.name, "test.history")
+        ingesting = RESTAPITarget("/test_target", history=History(size=10))
+        ingesting.attach_store(SharedStateStore(self.path), SharedStateStore(history_path))
+        ingesting.begin_ingest()
+        replica = RESTAPITarget("/test_target", history=History(size=10))
+        replica.attach_store(SharedStateStore(self.path), SharedStateStore(history_path))
+
+        ingesting.feed({"cpu_load": 3.0})
+        ingesting.publish()
+        self.assertEqual(replica.get_history(start=0, end=time.time() + 1)["test_target"]["cpu_load"], [3.0])
+
+    def test_replica_target_streams_published_changes(self):
+        ingesting = RESTAPITarget("/test_target", group_by_attr="ip_address")
+        ingesting.attach_store(SharedStateStore(self.path))
+        ingesting.begin_ingest()
+        replica = RESTAPITarget("/test_target", group_by_attr="ip_address", events=EventBroadcaster())
+        replica.attach_store(SharedStateStore(self.path))
+        ingesting.feed({"ip_address": "127.0.0.1"})
+        ingesting.feed({"ip_address": "127.0.0.2"})
+        ingesting.publish()
+
+        stream = replica._stream(None)
+        self.assertTrue(next(stream).startswith(b"id: 2\nevent: snapshot\n"))
+        ingesting.feed({"ip_address": "127.0.0.2"})
+        ingesting.persistence["127.0.0.1"]["timestamp"] = time.time() - 20
+        ingesting.expire()
+        ingesting.publish()
+        replica.refresh()
+        event = next(stream)
+        self.assertTrue(event.startswith(b"id: 4\nevent: update\n"))
+        changes = json.loads(event.split(b"data: ")[1])
+        self.assertEqual(changes["expired"], ["127.0.0.1"])
+        self.assertEqual([record["ip_address"] for record in changes["test_target"]], ["127.0.0.2"])
+        stream.close()
+
+    def test_ingest_lock_is_exclusive(self):
+        path = os.path.join(self.tmp_dir.name, "ingest.lock")
+        first, second = IngestLock(path), IngestLock(path)
+        self.assertTrue(first.try_acquire())
+        self.assertFalse(second.try_acquire())
+        first.release()
+        self.assertTrue(second.try_acquire())
@@ -0,0 +1,41 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from lighthouse.single_flight import SingleFlight
+
+
+class SingleFlightTest(TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        single_flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def reset():
+            calls.append(1)
+            release.wait(5)
+            return {"result": "success"}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(single_flight.do, ("reset", 3), reset) for _ in range(4)]
+            deadline = time.monotonic() + 5
+            while not calls and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.05)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"result": "success"}] * 4)
+        self.assertEqual(single_flight.in_flight(), 0)
+
+        # once finished, the next call runs again
+        single_flight.do(("reset", 3), reset)
+        self.assertEqual(len(calls), 2)
+
+    def test_exception_is_raised_to_every_caller(self):
+        single_flight = SingleFlight()
+        with self.assertRaises(ZeroDivisionError):
+            single_flight.do("key", lambda: 1 / 0)
+        self.assertEqual(single_flight.do("key", lambda: 1), 1)
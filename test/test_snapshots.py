@@ -0,0 +1,118 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import Mock
+
+from werkzeug.datastructures import MultiDict
+
+from lighthouse.adapter import Adapter, Source
+from lighthouse.aggregates import Aggregates
+from lighthouse.history import History
+from lighthouse.lighthouse import RESTAPITarget, Lighthouse, LighthouseFactory, ConfigFileInvalidError
+from lighthouse.query import Query
+from lighthouse.snapshots import SnapshotFile
+
+
+def _target() -> RESTAPITarget:
+    return RESTAPITarget("/test_target", group_by_attr="ip_address", aging_time_sec=5, history=History(size=10),
+                         aggregates=Aggregates([{"name": "nodes", "function": "count"}]), indexes=["hostname"])
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "test.snapshot")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_file(self):
+        """
+        A snapshot is read back as written, missing or unreadable snapshots are None
+        """
+        snapshot_file = SnapshotFile(self.path)
+        self.assertIsNone(snapshot_file.read())
+        snapshot_file.write({"snapshot": {"version": 3}})
+        self.assertEqual(snapshot_file.read()["snapshot"], {"version": 3})
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["test.snapshot"])
+
+        with open(self.path, "r+b") as f:
+            f.truncate(10)
+        self.assertIsNone(snapshot_file.read())
+        SnapshotFile.FORMAT, format_ = 0, SnapshotFile.FORMAT
+        try:
+            snapshot_file.write({})
+        finally:
+            SnapshotFile.FORMAT = format_
+        self.assertIsNone(snapshot_file.read())
+
+    def test_target_restore(self):
+        """
+        A restored target serves the records at once, with their timestamps, along with its history, aggregates
+        and indexes
+        """
+        t = _target()
+        t.feed_many([{"ip_address": "10.0.0.1", "hostname": "node01", "cpu_usage": 1.0},
+                     {"ip_address": "10.0.0.2", "hostname": "node02", "cpu_usage": 2.0}])
+        t.persistence["10.0.0.1"]["timestamp"] = time.time() - 20
+
+        restored = _target()
+        self.assertTrue(restored.restore_state(t.export_state()))
+        self.assertEqual(restored.version, t.version)
+        self.assertEqual(restored.persistence, t.persistence)
+        self.assertEqual(restored.get_aggregates(), {"test_target": {"nodes": 2}})
+        self.assertEqual(len(restored.get_history(start=0, end=time.time() + 1)["test_target"]), 2)
+        query = Query.from_args(MultiDict({"hostname": "node02"}))
+        self.assertEqual(len(restored.get_query_data(query)["test_target"]), 1)
+
+        # aged while the daemon was down
+        self.assertEqual([n["ip_address"] for n in restored.get_data()["test_target"]], ["10.0.0.2"])
+        restored.expire()
+        self.assertEqual(list(restored.persistence), ["10.0.0.2"])
+        self.assertEqual(restored.get_aggregates(), {"test_target": {"nodes": 1}})
+
+        self.assertFalse(RESTAPITarget("/test_target").restore_state(t.export_state()))
+
+    def test_lighthouse_warm_restart(self):
+        """
+        The ingest process writes the snapshots of its targets, and restores them on start
+        """
+        def start(target: RESTAPITarget, messages) -> Lighthouse:
+            source = Mock(spec=Source)
+            source.fileno.return_value = None
+            source.get_message.side_effect = messages + [None] * 10000
+            lighthouse = Lighthouse({"snapshot_dir": self.tmp_dir.name, "snapshot_interval_sec": 0.01})
+            lighthouse._adapters.append(Adapter(name="test_adapter", source=source, target=target))
+            lighthouse._snapshot_files.append((target, SnapshotFile(self.path)))
+            lighthouse.start()
+            return lighthouse
+
+        first = _target()
+        lighthouse = start(first, [{"ip_address": "10.0.0.1", "hostname": "node01"}])
+        for _ in range(100):
+            if os.path.exists(self.path):
+                break
+            time.sleep(0.01)
+        self.assertEqual(SnapshotFile(self.path).read()["snapshot"]["version"], 1)
+        first.feed({"ip_address": "10.0.0.2", "hostname": "node02"})
+        lighthouse.stop()
+        lighthouse.join(timeout=1)
+        self.assertFalse(lighthouse.is_alive())
+
+        second = _target()
+        lighthouse = start(second, [])
+        for _ in range(100):
+            if second.version:
+                break
+            time.sleep(0.01)
+        lighthouse.stop()
+        lighthouse.join(timeout=1)
+        self.assertFalse(lighthouse.is_alive())
+        self.assertEqual(second.persistence, first.persistence)
+
+    def test_config_snapshots(self):
+        config = {"log_level": "INFO", "snapshot_dir": self.tmp_dir.name, "snapshot_interval_sec": 30}
+        LighthouseFactory._validate_config_file(config)
+        config["snapshot_interval_sec"] = 0
+        self.assertRaises(ConfigFileInvalidError, LighthouseFactory._validate_config_file, config)
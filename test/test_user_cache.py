@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "adapter_scripts"))
+from user_cache import UserListCache  # noqa: E402
+import user_list  # noqa: E402
+
+
+class UserListCacheTest(TestCase):
+    def test_fresh_list_is_served_from_cache(self):
+        cache = UserListCache()
+        load = Mock(return_value=["alice"])
+        self.assertEqual(cache.get(load, ttl_sec=60, stale_sec=0), ["alice"])
+        self.assertEqual(cache.get(load, ttl_sec=60, stale_sec=0), ["alice"])
+        load.assert_called_once()
+
+        cache.add("bob")
+        cache.remove("alice")
+        self.assertEqual(cache.get(load, ttl_sec=60, stale_sec=0), ["bob"])
+        load.assert_called_once()
+
+    def test_stale_list_is_served_while_refreshed(self):
+        cache = UserListCache()
+        cache.get(Mock(return_value=["alice"]), ttl_sec=60, stale_sec=60)
+        cache._loaded_at -= 90
+
+        refreshed = threading.Event()
+
+        def load():
+            refreshed.set()
+            return ["alice", "bob"]
+
+        self.assertEqual(cache.get(load, ttl_sec=60, stale_sec=60), ["alice"])
+        self.assertTrue(refreshed.wait(5))
+        deadline = time.monotonic() + 5
+        while cache.get(load, ttl_sec=60, stale_sec=60) != ["alice", "bob"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache.get(load, ttl_sec=60, stale_sec=60), ["alice", "bob"])
+
+    def test_load_overtaken_by_change_is_discarded(self):
+        cache = UserListCache()
+
+        def load():
+            # a user is created while the list is being loaded
+            cache.add("bob")
+            return ["alice"]
+
+        self.assertEqual(cache.get(load, ttl_sec=60, stale_sec=0), ["alice"])
+        self.assertIsNone(cache._users)
+
+    def test_failed_load_is_not_cached(self):
+        cache = UserListCache()
+        self.assertIsNone(cache.get(Mock(return_value=None), ttl_sec=60, stale_sec=0))
+        self.assertEqual(cache.get(Mock(return_value=["alice"]), ttl_sec=60, stale_sec=0), ["alice"])
+
+    def test_hanging_load_is_killed(self):
+        with tempfile.TemporaryDirectory() as script_dir:
+            script_path = os.path.join(script_dir, "get_users.bash")
+            with open(script_path, "w") as f:
+                f.write("#!/bin/sh\necho alice\nsleep 5\n")
+            os.chmod(script_path, 0o755)
+            with patch.object(user_list, "SCRIPT_PATH", script_path), patch.object(user_list, "LOAD_TIMEOUT_SEC", 0.2):
+                started = time.monotonic()
+                self.assertIsNone(user_list.get_users())
+                self.assertLess(time.monotonic() - started, 2)
+
+    def test_cache_lifetimes_from_action(self):
+        """
+        The cache lifetimes set for the action are used instead of the defaults of the script
+        """
+        with patch.object(user_list.user_cache.users, "get", return_value=["alice"]) as get:
+            self.assertEqual(user_list.main(cache_ttl_sec=5, cache_stale_sec=0)["users"], ["alice"])
+            get.assert_called_once_with(user_list.get_users, 5, 0)
+            user_list.main()
+            get.assert_called_with(user_list.get_users, user_list.TTL_SEC, user_list.STALE_WHILE_REVALIDATE_SEC)